@@ -4,17 +4,38 @@ Karachuonyo Website Backend Server
 Handles contact forms, newsletter subscriptions, and other server-side functionality
 """
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from flask_mail import Mail, Message
 from datetime import datetime
-import sqlite3
 import os
 import re
 import logging
+import time
 from werkzeug.security import generate_password_hash
 from config import get_config
 from mpesa import mpesa
+from db import create_pool, init_app as init_db_pool, get_db
+from migrations import apply_migrations
+from pagination import PaginationError, parse_page_args, keyset_page, page_body, page_headers
+from exports import EXPORT_FORMATS, export_stream, is_exportable
+from engagement import EngagementBuffer
+from sharedmem import get_segment
+from search import SearchError, parse_search_args, search_articles
+from news_catalog import NewsCatalog, NewsQueryError, parse_list_args
+from seed_articles import SEED_ARTICLES
+from response_cache import create_response_cache
+import http_cache
+from compression import CompressionMiddleware
+import outbox
+from email_templates import EmailTemplateRegistry
+from broadcast import BroadcastEngine, BroadcastError
+from outbound import GuardedMail, configure_guard, guard_stats
+from donations import DonationBusyError, DonationInitiator
+import callback_inbox
+from reconcile import DonationSweeper
+import fundraising
+from live import LiveBusyError, LiveHub, LiveTopicError
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -22,12 +43,111 @@ config_class = get_config()
 app.config.from_object(config_class)
 
 # CORS configuration
-CORS(app, origins=app.config['CORS_ORIGINS'])
+CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Next-Cursor', 'X-Total-Count'])
 
 mail = Mail(app)
 
-# Database configuration
-DATABASE = 'karachuonyo.db'
+# Daraja endpoint: Safaricom, or daraja_emulator.py for offline runs
+mpesa.base_url = app.config.get('MPESA_BASE_URL', mpesa.base_url).rstrip('/')
+
+# Timeouts, retries and circuit breakers for outbound SMTP and M-Pesa calls
+smtp_guard = configure_guard(
+    'smtp',
+    connect_timeout=app.config.get('SMTP_CONNECT_TIMEOUT', 5),
+    read_timeout=app.config.get('SMTP_READ_TIMEOUT', 15),
+    retries=app.config.get('SMTP_RETRIES', 1),
+    failure_threshold=app.config.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+    reset_timeout=app.config.get('CIRCUIT_RESET_TIMEOUT', 30)
+)
+mpesa.guard = configure_guard(
+    'mpesa',
+    connect_timeout=app.config.get('MPESA_CONNECT_TIMEOUT', 3.05),
+    read_timeout=app.config.get('MPESA_READ_TIMEOUT', 15),
+    retries=app.config.get('MPESA_RETRIES', 2),
+    failure_threshold=app.config.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+    reset_timeout=app.config.get('CIRCUIT_RESET_TIMEOUT', 30)
+)
+smtp = GuardedMail(mail.state, smtp_guard)
+
+# Database configuration (SQLite or PostgreSQL, selected by DATABASE_URL)
+db_pool = create_pool(app)
+init_db_pool(app, db_pool)
+
+# Counters and cache shared by all gunicorn workers (see gunicorn.conf.py)
+shared = get_segment(
+    counter_slots=app.config.get('SHARED_COUNTER_SLOTS', 4096),
+    cache_slots=app.config.get('SHARED_CACHE_SLOTS', 256),
+    cache_value_size=app.config.get('SHARED_CACHE_VALUE_SIZE', 65536),
+    lock_timeout=app.config.get('SHARED_LOCK_TIMEOUT', 0.5)
+)
+
+# Article views/likes/shares are buffered and written in batches
+engagement = EngagementBuffer(
+    db_pool,
+    flush_interval=app.config.get('ENGAGEMENT_FLUSH_INTERVAL', 1.0),
+    flush_threshold=app.config.get('ENGAGEMENT_FLUSH_THRESHOLD', 500),
+    segment=shared
+)
+
+# Published articles (database + seed) indexed for the public news endpoints
+news_catalog = NewsCatalog(db_pool, SEED_ARTICLES, segment=shared)
+
+# Public GET responses, invalidated by tag from the admin write handlers
+response_cache = create_response_cache(app.config, segment=shared)
+
+# ETag/Last-Modified, 304s and Cache-Control for the routes in HTTP_CACHE_POLICIES
+http_cache.init_app(app)
+
+# gzip/brotli for clients that accept it (cached responses arrive pre-compressed)
+if app.config.get('COMPRESSION_ENABLED', True):
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config.get('COMPRESSION_MIN_SIZE', 1024),
+        level=app.config.get('COMPRESSION_LEVEL', 6),
+        brotli_quality=app.config.get('COMPRESSION_BROTLI_QUALITY', 5)
+    )
+
+# Notification templates, compiled once at startup
+email_templates = EmailTemplateRegistry()
+
+# Notification email is queued with each submission and delivered in the background
+outbox_worker = outbox.OutboxWorker.from_config(app, smtp, db_pool)
+
+# Bulk newsletter sends to active subscribers (see broadcast.py)
+broadcasts = BroadcastEngine.from_config(app, smtp, db_pool, email_templates)
+
+# STK pushes run in the background; donors poll the shared status map
+donation_initiator = DonationInitiator.from_config(app, db_pool, mpesa, segment=shared)
+
+# M-Pesa callbacks are acknowledged once recorded and applied in batches
+callback_processor = callback_inbox.CallbackProcessor.from_config(app, db_pool, donation_initiator)
+
+# Donations whose callback never arrives are settled with STK Push Query
+donation_sweeper = DonationSweeper.from_config(app, db_pool, mpesa, donation_initiator)
+
+# Article metrics, fundraising totals and event spots pushed to /api/live streams
+live_hub = LiveHub.from_config(app, db_pool, engagement)
+
+if app.config.get('OUTBOX_WORKER', 'thread') == 'thread':
+    @app.before_request
+    def start_outbox_worker():
+        # Started per process on first request, so each gunicorn worker gets its own
+        outbox_worker.start()
+
+if app.config.get('MPESA_CALLBACK_WORKER', 'thread') == 'thread':
+    @app.before_request
+    def start_callback_processor():
+        callback_processor.start()
+
+if app.config.get('MPESA_SWEEPER', 'thread') == 'thread':
+    @app.before_request
+    def start_donation_sweeper():
+        donation_sweeper.start()
+
+if app.config.get('LIVE_PUBLISHER', 'thread') == 'thread':
+    @app.before_request
+    def start_live_hub():
+        live_hub.start()
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
@@ -37,10 +157,7 @@ def send_email_safe(message):
     """Send email safely - in development mode, just log the email content"""
     try:
         # Check if we're in development mode with test email configuration
-        is_dev_mode = (os.environ.get('FLASK_ENV') == 'development' and 
-                      os.environ.get('MAIL_USERNAME') == 'test@example.com')
-        
-        if is_dev_mode:
+        if outbox.is_dev_mail():
             # Development mode - just log the email
             logger.info(f"[DEV MODE] Email would be sent:")
             logger.info(f"  To: {message.recipients}")
@@ -48,200 +165,30 @@ def send_email_safe(message):
             logger.info(f"  Body: {message.body[:200]}...")
             return True
         else:
-            # Production mode - actually send the email
-            mail.send(message)
+            # Production mode - actually send the email (bounded by SMTP timeouts)
+            smtp.send(message)
             return True
     except Exception as e:
         logger.error(f"Failed to send email: {str(e)}")
         return False
 
 def init_database():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Contact submissions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contact_submissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT,
-            subject TEXT NOT NULL,
-            message TEXT NOT NULL,
-            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT,
-            status TEXT DEFAULT 'new'
-        )
-    ''')
-    
-    # Newsletter subscriptions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS newsletter_subscriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT,
-            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            status TEXT DEFAULT 'active',
-            confirmation_token TEXT
-        )
-    ''')
-    
-    # Admin users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            role TEXT DEFAULT 'admin'
-        )
-    ''')
-    
-    # Donations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS donations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            donor_name TEXT NOT NULL,
-            donor_email TEXT,
-            phone_number TEXT,
-            amount REAL NOT NULL,
-            payment_method TEXT NOT NULL,
-            status TEXT DEFAULT 'pending',
-            transaction_id TEXT,
-            checkout_request_id TEXT,
-            merchant_request_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT
-        )
-    ''')
-    
-    # News articles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS news_articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            slug TEXT UNIQUE NOT NULL,
-            excerpt TEXT,
-            content TEXT NOT NULL,
-            featured_image TEXT,
-            author TEXT DEFAULT 'Karachuonyo First Team',
-            status TEXT DEFAULT 'draft',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            published_at TIMESTAMP,
-            views INTEGER DEFAULT 0,
-            likes INTEGER DEFAULT 0,
-            shares INTEGER DEFAULT 0,
-            tags TEXT
-        )
-    ''')
-    
-    # Comments table for blog/news articles
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            article_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            comment TEXT NOT NULL,
-            approved INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Events table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            slug TEXT UNIQUE NOT NULL,
-            description TEXT,
-            location TEXT,
-            event_date TIMESTAMP NOT NULL,
-            end_date TIMESTAMP,
-            featured_image TEXT,
-            status TEXT DEFAULT 'upcoming',
-            max_attendees INTEGER,
-            registration_required BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Event registrations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS event_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT,
-            status TEXT DEFAULT 'confirmed',
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            notes TEXT,
-            FOREIGN KEY (event_id) REFERENCES events (id)
-        )
-    ''')
-    
-    # Agenda items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS agenda_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            category TEXT,
-            priority TEXT DEFAULT 'medium',
-            status TEXT DEFAULT 'planned',
-            target_date TIMESTAMP,
-            progress_percentage INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Volunteer registrations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS volunteer_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            location TEXT,
-            skills TEXT,
-            availability TEXT,
-            experience TEXT,
-            motivation TEXT,
-            status TEXT DEFAULT 'pending',
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT
-        )
-    ''')
-    
-    # Add migration for likes and shares columns if they don't exist
-    try:
-        cursor.execute("ALTER TABLE news_articles ADD COLUMN likes INTEGER DEFAULT 0")
-        logger.info("Added likes column to news_articles table")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
+    """Initialize the database by applying any pending schema migrations"""
+    conn = db_pool.acquire()
     try:
-        cursor.execute("ALTER TABLE news_articles ADD COLUMN shares INTEGER DEFAULT 0")
-        logger.info("Added shares column to news_articles table")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+        applied = apply_migrations(conn, db_pool.dialect)
+    finally:
+        db_pool.release(conn)
     
-    conn.commit()
-    conn.close()
+    if applied:
+        logger.info(f"Applied database migrations: {applied}")
     logger.info("Database initialized successfully")
 
+def article_lookup_params(article_id):
+    """Query parameters for matching a news article by slug or numeric id"""
+    numeric_id = int(article_id) if str(article_id).isdigit() else None
+    return (article_id, numeric_id)
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -337,16 +284,27 @@ def health_check():
     """Health check endpoint for deployment monitoring"""
     try:
         # Test database connection
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT 1')
-        conn.close()
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'service': 'karachuonyo-backend',
-            'database': 'connected'
+            'database': 'connected',
+            'database_pool': db_pool.stats(),
+            'engagement_buffer': engagement.stats(),
+            'shared_memory': shared.stats(),
+            'news_catalog': news_catalog.stats(),
+            'response_cache': response_cache.stats(),
+            'email_outbox': outbox_worker.stats(),
+            'mpesa': mpesa.stats(),
+            'stk_push': donation_initiator.stats(),
+            'mpesa_callbacks': callback_processor.stats(),
+            'donation_sweeper': donation_sweeper.stats(),
+            'live': live_hub.stats(),
+            'outbound': guard_stats()
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -433,7 +391,7 @@ def handle_contact_form():
         user_agent = request.headers.get('User-Agent', '')
         
         # Save to database
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -451,77 +409,38 @@ def handle_contact_form():
         ))
         
         submission_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
         
-        # Send email notification
-        try:
-            # Email to admin
-            admin_msg = Message(
-                subject=f"New Contact Form Submission: {data['subject']}",
-                recipients=['contact@karachuonyofirst.com'],
-                html=render_template_string('''
-                <h2>New Contact Form Submission</h2>
-                <p><strong>Submission ID:</strong> {{ submission_id }}</p>
-                <p><strong>Name:</strong> {{ name }}</p>
-                <p><strong>Email:</strong> {{ email }}</p>
-                <p><strong>Phone:</strong> {{ phone or 'Not provided' }}</p>
-                <p><strong>Subject:</strong> {{ subject }}</p>
-                <p><strong>Message:</strong></p>
-                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
-                    {{ message | replace('\n', '<br>') | safe }}
-                </div>
-                <p><strong>Submitted:</strong> {{ timestamp }}</p>
-                <p><strong>IP Address:</strong> {{ ip_address }}</p>
-                ''', 
-                submission_id=submission_id,
-                name=data['name'],
-                email=data['email'],
-                phone=data.get('phone'),
-                subject=data['subject'],
-                message=data['message'],
-                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                ip_address=ip_address
-                )
-            )
-            
-            # Auto-reply to user
-            user_msg = Message(
-                subject="Thank you for contacting Karachuonyo First",
-                recipients=[data['email']],
-                html=render_template_string('''
-                <h2>Thank you for your message!</h2>
-                <p>Dear {{ name }},</p>
-                <p>Thank you for reaching out to the Karachuonyo First campaign. We have received your message and will respond within 24-48 hours.</p>
-                
-                <h3>Your Message Details:</h3>
-                <p><strong>Subject:</strong> {{ subject }}</p>
-                <p><strong>Message:</strong></p>
-                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
-                    {{ message | replace('\n', '<br>') | safe }}
-                </div>
-                
-                <p>Best regards,<br>
-                <strong>Karachuonyo First Campaign Team</strong></p>
-                
-                <hr>
-                <p style="font-size: 12px; color: #666;">
-                This is an automated response. Please do not reply to this email.
-                For urgent matters, call: +254 700 686 943
-                </p>
-                ''',
-                name=data['name'],
-                subject=data['subject'],
-                message=data['message']
-                )
-            )
-            
-            send_email_safe(admin_msg)
-            send_email_safe(user_msg)
-            
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-            # Don't fail the request if email fails
+        # Queue email notifications in the submission's transaction (delivered by the outbox
+        # worker): if they cannot be queued, the submission fails with them
+
+        # Email to admin
+        admin_msg = email_templates.message(
+            'contact_admin',
+            recipients=['contact@karachuonyofirst.com'],
+            submission_id=submission_id,
+            name=data['name'],
+            email=data['email'],
+            phone=data.get('phone'),
+            subject=data['subject'],
+            message=data['message'],
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            ip_address=ip_address
+        )
+        
+        # Auto-reply to user
+        user_msg = email_templates.message(
+            'contact_reply',
+            recipients=[data['email']],
+            name=data['name'],
+            subject=data['subject'],
+            message=data['message']
+        )
+        
+        outbox.enqueue(conn, admin_msg)
+        outbox.enqueue(conn, user_msg)
+        
+        conn.commit()
+        outbox_worker.notify()
         
         logger.info(f"Contact form submitted successfully: ID {submission_id}")
         
@@ -556,7 +475,7 @@ def handle_newsletter_subscription():
         ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
         
         # Check if already subscribed
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id, status FROM newsletter_subscriptions WHERE email = ?', (email,))
@@ -581,43 +500,17 @@ def handle_newsletter_subscription():
                 VALUES (?, ?, ?)
             ''', (email, name, ip_address))
         
-        conn.commit()
-        conn.close()
+        # Queue welcome email
+        welcome_msg = email_templates.message(
+            'newsletter_welcome',
+            recipients=[email],
+            name=name
+        )
         
-        # Send welcome email
-        try:
-            welcome_msg = Message(
-                subject="Welcome to Karachuonyo First Newsletter!",
-                recipients=[email],
-                html=render_template_string('''
-                <h2>Welcome to Karachuonyo First!</h2>
-                <p>Dear {{ name or 'Supporter' }},</p>
-                <p>Thank you for subscribing to our newsletter! You'll now receive updates about:</p>
-                <ul>
-                    <li>Campaign events and rallies</li>
-                    <li>Policy announcements</li>
-                    <li>Community development projects</li>
-                    <li>Important political updates</li>
-                </ul>
-                
-                <p>Together, we're building a better future for Karachuonyo!</p>
-                
-                <p>Best regards,<br>
-                <strong>Karachuonyo First Campaign Team</strong></p>
-                
-                <hr>
-                <p style="font-size: 12px; color: #666;">
-                You can unsubscribe at any time by replying to this email with "UNSUBSCRIBE".
-                </p>
-                ''',
-                name=name
-                )
-            )
-            
-            send_email_safe(welcome_msg)
-            
-        except Exception as e:
-            logger.error(f"Failed to send welcome email: {e}")
+        outbox.enqueue(conn, welcome_msg)
+        
+        conn.commit()
+        outbox_worker.notify()
         
         logger.info(f"Newsletter subscription: {email}")
         
@@ -667,14 +560,13 @@ def handle_volunteer_registration():
         user_agent = request.headers.get('User-Agent', '')
         
         # Check if already registered
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id FROM volunteer_registrations WHERE email = ?', (data['email'].strip().lower(),))
         existing = cursor.fetchone()
         
         if existing:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'This email is already registered as a volunteer'
@@ -703,91 +595,39 @@ def handle_volunteer_registration():
         ))
         
         registration_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
         
-        # Send email notifications
-        try:
-            # Email to admin
-            admin_msg = Message(
-                subject="New Volunteer Registration",
-                recipients=['volunteers@karachuonyofirst.com'],
-                html=render_template_string('''
-                <h2>New Volunteer Registration</h2>
-                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
-                <p><strong>Name:</strong> {{ name }}</p>
-                <p><strong>Email:</strong> {{ email }}</p>
-                <p><strong>Phone:</strong> {{ phone }}</p>
-                <p><strong>Location:</strong> {{ location or 'Not specified' }}</p>
-                <p><strong>Skills:</strong> {{ skills or 'Not specified' }}</p>
-                <p><strong>Availability:</strong> {{ availability or 'Not specified' }}</p>
-                <p><strong>Experience:</strong> {{ experience or 'Not specified' }}</p>
-                <p><strong>Message:</strong></p>
-                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
-                    {{ message or 'Not provided' | replace('\n', '<br>') | safe }}
-                </div>
-                <p><strong>Registered:</strong> {{ timestamp }}</p>
-                <p><strong>IP Address:</strong> {{ ip_address }}</p>
-                ''', 
-                registration_id=registration_id,
-                name=data['name'],
-                email=data['email'],
-                phone=data['phone'],
-                location=data.get('location'),
-                skills=skills_str,
-                availability=data.get('availability'),
-                experience=data.get('experience'),
-                message=data.get('message'),
-                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                ip_address=ip_address
-                )
-            )
-            
-            # Welcome email to volunteer
-            volunteer_msg = Message(
-                subject="Welcome to Karachuonyo First Volunteer Team!",
-                recipients=[data['email']],
-                html=render_template_string('''
-                <h2>Welcome to the Team!</h2>
-                <p>Dear {{ name }},</p>
-                <p>Thank you for volunteering with the Karachuonyo First campaign! Your commitment to positive change in our community is truly appreciated.</p>
-                
-                <h3>What's Next?</h3>
-                <ul>
-                    <li>Our volunteer coordinator will contact you within 48 hours</li>
-                    <li>You'll receive information about upcoming volunteer opportunities</li>
-                    <li>Training sessions and orientation details will be shared</li>
-                    <li>You'll be added to our volunteer WhatsApp group</li>
-                </ul>
-                
-                <h3>Your Registration Details:</h3>
-                <p><strong>Name:</strong> {{ name }}</p>
-                <p><strong>Phone:</strong> {{ phone }}</p>
-                <p><strong>Location:</strong> {{ location or 'Not specified' }}</p>
-                
-                <p>Together, we're building a better future for Karachuonyo!</p>
-                
-                <p>Best regards,<br>
-                <strong>Karachuonyo First Volunteer Coordination Team</strong></p>
-                
-                <hr>
-                <p style="font-size: 12px; color: #666;">
-                For questions about volunteering, contact: volunteers@karachuonyofirst.com<br>
-                WhatsApp: +254 700 686 943
-                </p>
-                ''',
-                name=data['name'],
-                phone=data['phone'],
-                location=data.get('location')
-                )
-            )
-            
-            send_email_safe(admin_msg)
-            send_email_safe(volunteer_msg)
-            
-        except Exception as e:
-            logger.error(f"Failed to send volunteer registration email: {e}")
-            # Don't fail the request if email fails
+        # Queue email notifications
+        # Email to admin
+        admin_msg = email_templates.message(
+            'volunteer_admin',
+            recipients=['volunteers@karachuonyofirst.com'],
+            registration_id=registration_id,
+            name=data['name'],
+            email=data['email'],
+            phone=data['phone'],
+            location=data.get('location'),
+            skills=skills_str,
+            availability=data.get('availability'),
+            experience=data.get('experience'),
+            message=data.get('message'),
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            ip_address=ip_address
+        )
+        
+        # Welcome email to volunteer
+        volunteer_msg = email_templates.message(
+            'volunteer_welcome',
+            recipients=[data['email']],
+            name=data['name'],
+            phone=data['phone'],
+            location=data.get('location')
+        )
+        
+        outbox.enqueue(conn, admin_msg)
+        outbox.enqueue(conn, volunteer_msg)
+        
+        conn.commit()
+        outbox_worker.notify()
         
         logger.info(f"Volunteer registration submitted successfully: ID {registration_id}")
         
@@ -806,20 +646,27 @@ def handle_volunteer_registration():
 
 @app.route('/api/admin/contacts', methods=['GET'])
 def get_contact_submissions():
-    """Get all contact submissions (admin endpoint)"""
+    """Get a page of contact submissions, newest first (admin endpoint)"""
     # TODO: Add authentication
     try:
-        conn = sqlite3.connect(DATABASE)
+        filters, after, limit, include_total = parse_page_args(request.args, {
+            'status': 'status',
+            'date': 'submitted_at',
+            'search': ['name', 'email', 'subject', 'message']
+        }, db_pool.dialect)
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, name, email, phone, subject, message, submitted_at, status
-            FROM contact_submissions
-            ORDER BY submitted_at DESC
-        ''')
+        rows, next_cursor, total = keyset_page(
+            cursor, 'contact_submissions',
+            ['id', 'name', 'email', 'phone', 'subject', 'message', 'submitted_at', 'status'],
+            ['submitted_at', 'id'],
+            filters=filters, after=after, limit=limit, include_total=include_total
+        )
         
         submissions = []
-        for row in cursor.fetchall():
+        for row in rows:
             submissions.append({
                 'id': row[0],
                 'name': row[1],
@@ -831,10 +678,11 @@ def get_contact_submissions():
                 'status': row[7]
             })
         
-        conn.close()
-        
-        return jsonify(submissions)
+        body = page_body('contacts', submissions, next_cursor, total)
+        return jsonify(body), 200, page_headers(next_cursor, total)
         
+    except PaginationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching submissions: {e}")
         return jsonify({
@@ -849,7 +697,7 @@ def manage_contact_submission(contact_id):
     
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect(DATABASE)
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -860,7 +708,6 @@ def manage_contact_submission(contact_id):
             
             row = cursor.fetchone()
             if not row:
-                conn.close()
                 return jsonify({'error': 'Contact submission not found'}), 404
             
             submission = {
@@ -874,7 +721,6 @@ def manage_contact_submission(contact_id):
                 'status': row[7]
             }
             
-            conn.close()
             return jsonify(submission)
             
         except Exception as e:
@@ -883,17 +729,15 @@ def manage_contact_submission(contact_id):
     
     elif request.method == 'DELETE':
         try:
-            conn = sqlite3.connect(DATABASE)
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM contact_submissions WHERE id = ?', (contact_id,))
             
             if cursor.rowcount == 0:
-                conn.close()
                 return jsonify({'error': 'Contact submission not found'}), 404
             
             conn.commit()
-            conn.close()
             
             return jsonify({'success': True, 'message': 'Contact submission deleted'})
             
@@ -906,7 +750,7 @@ def mark_contact_as_read(contact_id):
     """Mark a contact submission as read"""
     # TODO: Add authentication
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -916,11 +760,9 @@ def mark_contact_as_read(contact_id):
         ''', (contact_id,))
         
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({'error': 'Contact submission not found'}), 404
         
         conn.commit()
-        conn.close()
         
         return jsonify({'success': True, 'message': 'Contact marked as read'})
         
@@ -959,21 +801,81 @@ def send_reply():
         logger.error(f"Error sending reply: {e}")
         return jsonify({'error': 'Failed to send reply'}), 500
 
+@app.route('/api/admin/newsletter/broadcasts', methods=['POST'])
+def create_newsletter_broadcast():
+    """Create a newsletter broadcast and start sending it in the background"""
+    # TODO: Add authentication
+    try:
+        data = request.get_json() or {}
+        if data.get('template'):
+            try:
+                source = email_templates.source(data['template'])
+            except KeyError:
+                return jsonify({'error': f"Unknown template: {data['template']}"}), 400
+        else:
+            source = {'subject': data.get('subject'), 'html': data.get('html'), 'text': data.get('text')}
+        
+        if not source['subject'] or not source['html']:
+            return jsonify({'error': 'subject and html (or a template name) are required'}), 400
+        
+        broadcast_id = broadcasts.create(source['subject'], source['html'], source.get('text'))
+        if data.get('start', True):
+            broadcasts.start(broadcast_id)
+        
+        return jsonify({'success': True, 'broadcast': broadcasts.get(broadcast_id)}), 202
+        
+    except BroadcastError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error creating broadcast: {e}")
+        return jsonify({'error': 'Failed to create broadcast'}), 500
+
+@app.route('/api/admin/newsletter/broadcasts/<int:broadcast_id>', methods=['GET'])
+def get_newsletter_broadcast(broadcast_id):
+    """Progress and throughput of a broadcast"""
+    progress = broadcasts.get(broadcast_id)
+    if progress is None:
+        return jsonify({'error': 'Broadcast not found'}), 404
+    return jsonify(progress)
+
+@app.route('/api/admin/newsletter/broadcasts/<int:broadcast_id>/<action>', methods=['POST'])
+def control_newsletter_broadcast(broadcast_id, action):
+    """Resume a paused or crashed broadcast, or cancel one"""
+    try:
+        if action == 'resume':
+            broadcasts.start(broadcast_id)
+        elif action == 'cancel':
+            if not broadcasts.cancel(broadcast_id):
+                return jsonify({'error': 'Broadcast not found or already finished'}), 409
+        else:
+            return jsonify({'error': 'Unknown action'}), 404
+        return jsonify({'success': True, 'broadcast': broadcasts.get(broadcast_id)})
+    except BroadcastError as e:
+        return jsonify({'error': str(e)}), 409
+
 @app.route('/api/admin/donations', methods=['GET'])
 def admin_donations():
     try:
-        conn = sqlite3.connect('karachuonyo.db')
+        filters, after, limit, include_total = parse_page_args(request.args, {
+            'status': 'status',
+            'payment_method': 'payment_method',
+            'date': 'created_at',
+            'search': ['donor_name', 'donor_email', 'phone_number', 'transaction_id']
+        }, db_pool.dialect)
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, donor_name, donor_email, phone_number, amount, payment_method, 
-                   status, transaction_id, created_at, completed_at
-            FROM donations 
-            ORDER BY created_at DESC
-        ''')
+        rows, next_cursor, total = keyset_page(
+            cursor, 'donations',
+            ['id', 'donor_name', 'donor_email', 'phone_number', 'amount', 'payment_method',
+             'status', 'transaction_id', 'created_at', 'completed_at'],
+            ['created_at', 'id'],
+            filters=filters, after=after, limit=limit, include_total=include_total
+        )
         
         donations = []
-        for row in cursor.fetchall():
+        for row in rows:
             donations.append({
                 'id': row[0],
                 'name': row[1],
@@ -987,12 +889,55 @@ def admin_donations():
                 'completed_at': row[9]
             })
         
-        conn.close()
-        return jsonify(donations)
+        body = page_body('donations', donations, next_cursor, total)
+        return jsonify(body), 200, page_headers(next_cursor, total)
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/donations/summary', methods=['GET'])
+def admin_donation_summary():
+    """Fundraising totals by payment method and per hour/day (?bucket=, ?since=, ?until=)"""
+    # TODO: Add authentication
+    try:
+        summary = fundraising.breakdown(
+            get_db(),
+            bucket=request.args.get('bucket', 'day'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            payment_method=request.args.get('payment_method')
+        )
+        return jsonify(summary)
+    except fundraising.SummaryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/export/<table>', methods=['GET'])
+def admin_export(table):
+    """Stream a full table dump as CSV or NDJSON (?format=, ?gzip=1)"""
+    # TODO: Add authentication
+    fmt = request.args.get('format', 'csv').lower()
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    if not is_exportable(table):
+        return jsonify({'error': f'Unknown export: {table}'}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    body, content_type, filename = export_stream(
+        db_pool, table, fmt, compress,
+        chunk_size=app.config.get('EXPORT_CHUNK_SIZE', 500)
+    )
+    logger.info(f"Streaming {table} export as {filename}")
+    
+    return Response(body, content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store'
+    })
+
 # Admin authentication (simple token-based)
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
@@ -1014,17 +959,25 @@ def admin_login():
 def admin_news():
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            filters, after, limit, include_total = parse_page_args(request.args, {
+                'status': 'status',
+                'date': 'created_at',
+                'search': ['title', 'excerpt', 'tags']
+            }, db_pool.dialect)
+            
+            conn = get_db()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT id, title, slug, excerpt, author, status, created_at, published_at, views
-                FROM news_articles 
-                ORDER BY created_at DESC
-            ''')
+            rows, next_cursor, total = keyset_page(
+                cursor, 'news_articles',
+                ['id', 'title', 'slug', 'excerpt', 'author', 'status', 'created_at',
+                 'published_at', 'views'],
+                ['created_at', 'id'],
+                filters=filters, after=after, limit=limit, include_total=include_total
+            )
             
             articles = []
-            for row in cursor.fetchall():
+            for row in rows:
                 articles.append({
                     'id': row[0],
                     'title': row[1],
@@ -1037,9 +990,11 @@ def admin_news():
                     'views': row[8]
                 })
             
-            conn.close()
-            return jsonify({'articles': articles})
+            body = page_body('articles', articles, next_cursor, total)
+            return jsonify(body), 200, page_headers(next_cursor, total)
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -1054,7 +1009,7 @@ def admin_news():
             status = data.get('status', 'draft')
             tags = data.get('tags', '')
             
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             published_at = datetime.now().isoformat() if status == 'published' else None
@@ -1066,7 +1021,8 @@ def admin_news():
             
             conn.commit()
             article_id = cursor.lastrowid
-            conn.close()
+            news_catalog.article_changed(article_id)
+            response_cache.invalidate('news')
             
             return jsonify({'message': 'Article created successfully', 'id': article_id})
             
@@ -1077,7 +1033,7 @@ def admin_news():
 def admin_news_item(article_id):
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1103,10 +1059,8 @@ def admin_news_item(article_id):
                     'views': row[11],
                     'tags': row[12]
                 }
-                conn.close()
                 return jsonify(article)
             else:
-                conn.close()
                 return jsonify({'error': 'Article not found'}), 404
                 
         except Exception as e:
@@ -1115,7 +1069,7 @@ def admin_news_item(article_id):
     elif request.method == 'PUT':
         try:
             data = request.get_json()
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             # Check if status changed to published
@@ -1138,7 +1092,8 @@ def admin_news_item(article_id):
              data.get('tags')) + ((published_at, article_id) if published_at else (article_id,)))
             
             conn.commit()
-            conn.close()
+            news_catalog.article_changed(article_id)
+            response_cache.invalidate('news')
             
             return jsonify({'message': 'Article updated successfully'})
             
@@ -1147,12 +1102,13 @@ def admin_news_item(article_id):
     
     elif request.method == 'DELETE':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM news_articles WHERE id = ?', (article_id,))
             conn.commit()
-            conn.close()
+            news_catalog.article_deleted(article_id)
+            response_cache.invalidate('news')
             
             return jsonify({'message': 'Article deleted successfully'})
             
@@ -1164,18 +1120,25 @@ def admin_news_item(article_id):
 def admin_events():
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            filters, after, limit, include_total = parse_page_args(request.args, {
+                'status': 'status',
+                'date': 'event_date',
+                'search': ['title', 'location', 'description']
+            }, db_pool.dialect)
+            
+            conn = get_db()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT id, title, slug, description, location, event_date, end_date, 
-                       status, max_attendees, registration_required, created_at
-                FROM events 
-                ORDER BY event_date DESC
-            ''')
+            rows, next_cursor, total = keyset_page(
+                cursor, 'events',
+                ['id', 'title', 'slug', 'description', 'location', 'event_date', 'end_date',
+                 'status', 'max_attendees', 'registration_required', 'created_at'],
+                ['event_date', 'id'],
+                filters=filters, after=after, limit=limit, include_total=include_total
+            )
             
             events = []
-            for row in cursor.fetchall():
+            for row in rows:
                 events.append({
                     'id': row[0],
                     'title': row[1],
@@ -1190,9 +1153,11 @@ def admin_events():
                     'created_at': row[10]
                 })
             
-            conn.close()
-            return jsonify({'events': events})
+            body = page_body('events', events, next_cursor, total)
+            return jsonify(body), 200, page_headers(next_cursor, total)
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -1209,7 +1174,7 @@ def admin_events():
             max_attendees = data.get('max_attendees')
             registration_required = data.get('registration_required', False)
             
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1221,7 +1186,7 @@ def admin_events():
             
             conn.commit()
             event_id = cursor.lastrowid
-            conn.close()
+            response_cache.invalidate('events')
             
             return jsonify({'message': 'Event created successfully', 'id': event_id})
             
@@ -1232,7 +1197,7 @@ def admin_events():
 def admin_event_item(event_id):
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1259,10 +1224,8 @@ def admin_event_item(event_id):
                     'created_at': row[11],
                     'updated_at': row[12]
                 }
-                conn.close()
                 return jsonify(event)
             else:
-                conn.close()
                 return jsonify({'error': 'Event not found'}), 404
                 
         except Exception as e:
@@ -1271,7 +1234,7 @@ def admin_event_item(event_id):
     elif request.method == 'PUT':
         try:
             data = request.get_json()
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1286,7 +1249,7 @@ def admin_event_item(event_id):
                   data.get('registration_required', False), event_id))
             
             conn.commit()
-            conn.close()
+            response_cache.invalidate('events')
             
             return jsonify({'message': 'Event updated successfully'})
             
@@ -1295,18 +1258,49 @@ def admin_event_item(event_id):
     
     elif request.method == 'DELETE':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
+            cursor.execute('DELETE FROM event_registrations WHERE event_id = ?', (event_id,))
             cursor.execute('DELETE FROM events WHERE id = ?', (event_id,))
             conn.commit()
-            conn.close()
+            response_cache.invalidate('events')
             
             return jsonify({'message': 'Event deleted successfully'})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/events/<int:event_id>/registrations/<int:registration_id>', methods=['DELETE'])
+def admin_event_registration_item(event_id, registration_id):
+    """Delete an event registration and release its spot"""
+    # TODO: Add authentication
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            'SELECT status FROM event_registrations WHERE id = ? AND event_id = ?',
+            (registration_id, event_id)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return jsonify({'error': 'Registration not found'}), 404
+        
+        cursor.execute('DELETE FROM event_registrations WHERE id = ?', (registration_id,))
+        if row[0] == 'confirmed':
+            cursor.execute(
+                'UPDATE events SET registration_count = registration_count - 1 WHERE id = ?',
+                (event_id,)
+            )
+        conn.commit()
+        response_cache.invalidate('events')
+        
+        return jsonify({'message': 'Registration deleted successfully'})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/events/<int:event_id>/register', methods=['POST'])
 def register_for_event(event_id):
     """Handle public event registration/RSVP"""
@@ -1336,7 +1330,7 @@ def register_for_event(event_id):
                 'error': 'Please enter a valid Kenyan phone number'
             }), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Check if event exists and is open for registration
@@ -1347,7 +1341,6 @@ def register_for_event(event_id):
         
         event = cursor.fetchone()
         if not event:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'Event not found'
@@ -1357,14 +1350,12 @@ def register_for_event(event_id):
         
         # Check if registration is required and event is active
         if not registration_required:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'This event does not require registration'
             }), 400
         
         if status != 'upcoming':
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'Registration is not available for this event'
@@ -1378,121 +1369,83 @@ def register_for_event(event_id):
         
         existing = cursor.fetchone()
         if existing:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'You are already registered for this event'
             }), 400
         
-        # Check capacity if max_attendees is set
-        if max_attendees:
-            cursor.execute('''
-                SELECT COUNT(*) FROM event_registrations 
-                WHERE event_id = ? AND status = 'confirmed'
-            ''', (event_id,))
-            
-            current_count = cursor.fetchone()[0]
-            if current_count >= max_attendees:
-                conn.close()
-                return jsonify({
-                    'success': False,
-                    'error': 'This event is fully booked'
-                }), 400
-        
-        # Register for event
+        # Reserve a spot atomically. The conditional UPDATE takes the write lock
+        # and re-checks capacity under it, so concurrent RSVPs cannot oversell.
         cursor.execute('''
-            INSERT INTO event_registrations 
-            (event_id, name, email, phone, notes)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            event_id,
-            data['name'].strip(),
-            data['email'].strip().lower(),
-            data.get('phone', '').strip(),
-            data.get('notes', '').strip()
-        ))
+            UPDATE events SET registration_count = registration_count + 1
+            WHERE id = ? AND status = 'upcoming'
+              AND (max_attendees IS NULL OR max_attendees = 0
+                   OR registration_count < max_attendees)
+        ''', (event_id,))
         
-        registration_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'This event is fully booked'
+            }), 400
         
-        # Send confirmation emails
+        # Register for event; the unique (event_id, email) index rejects racing duplicates
         try:
-            # Email to admin
-            admin_msg = Message(
-                subject=f"New Event Registration: {event_title}",
-                recipients=['events@karachuonyofirst.com'],
-                html=render_template_string('''
-                <h2>New Event Registration</h2>
-                <p><strong>Event:</strong> {{ event_title }}</p>
-                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
-                <p><strong>Name:</strong> {{ name }}</p>
-                <p><strong>Email:</strong> {{ email }}</p>
-                <p><strong>Phone:</strong> {{ phone or 'Not provided' }}</p>
-                <p><strong>Event Date:</strong> {{ event_date }}</p>
-                <p><strong>Location:</strong> {{ location }}</p>
-                <p><strong>Notes:</strong> {{ notes or 'None' }}</p>
-                <p><strong>Registered:</strong> {{ timestamp }}</p>
-                ''', 
-                event_title=event_title,
-                registration_id=registration_id,
-                name=data['name'],
-                email=data['email'],
-                phone=data.get('phone'),
-                event_date=event_date,
-                location=location,
-                notes=data.get('notes'),
-                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-            )
-            
-            # Confirmation email to attendee
-            attendee_msg = Message(
-                subject=f"Event Registration Confirmed: {event_title}",
-                recipients=[data['email']],
-                html=render_template_string('''
-                <h2>Registration Confirmed!</h2>
-                <p>Dear {{ name }},</p>
-                <p>Thank you for registering for our event. Your registration has been confirmed!</p>
-                
-                <h3>Event Details:</h3>
-                <p><strong>Event:</strong> {{ event_title }}</p>
-                <p><strong>Date:</strong> {{ event_date }}</p>
-                <p><strong>Location:</strong> {{ location }}</p>
-                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
-                
-                <h3>Important Information:</h3>
-                <ul>
-                    <li>Please arrive 15 minutes before the event starts</li>
-                    <li>Bring a valid ID for verification</li>
-                    <li>Contact us if you need to cancel your registration</li>
-                </ul>
-                
-                <p>We look forward to seeing you at the event!</p>
-                
-                <p>Best regards,<br>
-                <strong>Karachuonyo First Events Team</strong></p>
-                
-                <hr>
-                <p style="font-size: 12px; color: #666;">
-                For event inquiries, contact: events@karachuonyofirst.com<br>
-                Phone: +254 700 686 943
-                </p>
-                ''',
-                name=data['name'],
-                event_title=event_title,
-                event_date=event_date,
-                location=location,
-                registration_id=registration_id
-                )
-            )
-            
-            send_email_safe(admin_msg)
-            send_email_safe(attendee_msg)
-            
-        except Exception as e:
-            logger.error(f"Failed to send event registration email: {e}")
-            # Don't fail the request if email fails
+            cursor.execute('''
+                INSERT INTO event_registrations 
+                (event_id, name, email, phone, notes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                event_id,
+                data['name'].strip(),
+                data['email'].strip().lower(),
+                data.get('phone', '').strip(),
+                data.get('notes', '').strip()
+            ))
+        except db_pool.IntegrityError:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'You are already registered for this event'
+            }), 400
+        
+        registration_id = cursor.lastrowid
+        
+        # Queue confirmation emails
+        # Email to admin
+        admin_msg = email_templates.message(
+            'event_admin',
+            recipients=['events@karachuonyofirst.com'],
+            event_title=event_title,
+            registration_id=registration_id,
+            name=data['name'],
+            email=data['email'],
+            phone=data.get('phone'),
+            event_date=event_date,
+            location=location,
+            notes=data.get('notes'),
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        )
+        
+        # Confirmation email to attendee
+        attendee_msg = email_templates.message(
+            'event_confirmation',
+            recipients=[data['email']],
+            name=data['name'],
+            event_title=event_title,
+            event_date=event_date,
+            location=location,
+            registration_id=registration_id
+        )
+        
+        outbox.enqueue(conn, admin_msg)
+        outbox.enqueue(conn, attendee_msg)
+        
+        conn.commit()
+        outbox_worker.notify()
+        # Spots available changed
+        response_cache.invalidate('events')
         
         logger.info(f"Event registration successful: Event {event_id}, Registration {registration_id}")
         
@@ -1511,15 +1464,17 @@ def register_for_event(event_id):
         }), 500
 
 @app.route('/api/events', methods=['GET'])
+@response_cache.cached(tags=['events'])
 def get_public_events():
     """Get public events list"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
+        # registration_count is maintained on write, so this is a single indexed query
         cursor.execute('''
             SELECT id, title, slug, description, location, event_date, end_date, 
-                   featured_image, max_attendees, registration_required
+                   featured_image, max_attendees, registration_required, registration_count
             FROM events 
             WHERE status = 'upcoming'
             ORDER BY event_date ASC
@@ -1527,19 +1482,10 @@ def get_public_events():
         
         events = []
         for row in cursor.fetchall():
-            event_id = row[0]
-            
-            # Get registration count if registration is required
-            registration_count = 0
-            if row[9]:  # registration_required
-                cursor.execute('''
-                    SELECT COUNT(*) FROM event_registrations 
-                    WHERE event_id = ? AND status = 'confirmed'
-                ''', (event_id,))
-                registration_count = cursor.fetchone()[0]
+            registration_count = row[10] or 0
             
             events.append({
-                'id': event_id,
+                'id': row[0],
                 'title': row[1],
                 'slug': row[2],
                 'description': row[3],
@@ -1553,8 +1499,6 @@ def get_public_events():
                 'spots_available': (row[8] - registration_count) if row[8] else None
             })
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'events': events
@@ -1572,18 +1516,25 @@ def get_public_events():
 def admin_agenda():
     if request.method == 'GET':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            filters, after, limit, include_total = parse_page_args(request.args, {
+                'status': 'status',
+                'date': 'created_at',
+                'search': ['title', 'description', 'category']
+            }, db_pool.dialect)
+            
+            conn = get_db()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT id, title, description, category, priority, status, 
-                       target_date, progress_percentage, created_at, updated_at
-                FROM agenda_items 
-                ORDER BY priority DESC, created_at DESC
-            ''')
+            rows, next_cursor, total = keyset_page(
+                cursor, 'agenda_items',
+                ['id', 'title', 'description', 'category', 'priority', 'status',
+                 'target_date', 'progress_percentage', 'created_at', 'updated_at'],
+                ['priority', 'created_at', 'id'],
+                filters=filters, after=after, limit=limit, include_total=include_total
+            )
             
             items = []
-            for row in cursor.fetchall():
+            for row in rows:
                 items.append({
                     'id': row[0],
                     'title': row[1],
@@ -1597,9 +1548,11 @@ def admin_agenda():
                     'updated_at': row[9]
                 })
             
-            conn.close()
-            return jsonify({'agenda_items': items})
+            body = page_body('agenda_items', items, next_cursor, total)
+            return jsonify(body), 200, page_headers(next_cursor, total)
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -1614,7 +1567,7 @@ def admin_agenda():
             target_date = data.get('target_date')
             progress_percentage = data.get('progress_percentage', 0)
             
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1625,7 +1578,6 @@ def admin_agenda():
             
             conn.commit()
             item_id = cursor.lastrowid
-            conn.close()
             
             return jsonify({'message': 'Agenda item created successfully', 'id': item_id})
             
@@ -1637,7 +1589,7 @@ def admin_agenda_item(item_id):
     if request.method == 'PUT':
         try:
             data = request.get_json()
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1650,7 +1602,6 @@ def admin_agenda_item(item_id):
                   data.get('progress_percentage'), item_id))
             
             conn.commit()
-            conn.close()
             
             return jsonify({'message': 'Agenda item updated successfully'})
             
@@ -1659,215 +1610,27 @@ def admin_agenda_item(item_id):
     
     elif request.method == 'DELETE':
         try:
-            conn = sqlite3.connect('karachuonyo.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM agenda_items WHERE id = ?', (item_id,))
             conn.commit()
-            conn.close()
             
             return jsonify({'message': 'Agenda item deleted successfully'})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-# Blog/News articles data
-ARTICLES = {
-    'ward-cleanup-drive': {
-        'id': 'ward-cleanup-drive',
-        'title': 'Ward Clean-Up Drive Launched',
-        'date': 'August 24, 2025',
-        'category': 'Community',
-        'author': 'Karachuonyo First Team',
-        'excerpt': 'We flagged off a community clean-up across trading centers with youth groups and churches.',
-        'content': '''<p>In a remarkable display of community spirit, the Karachuonyo First campaign launched a comprehensive ward clean-up drive across all major trading centers in our constituency. This initiative, which began early Saturday morning, brought together youth groups, church organizations, and community volunteers in an unprecedented show of unity.</p>
-        
-        <h2>Community Mobilization</h2>
-        <p>The clean-up drive saw participation from over 200 volunteers, including members from various youth groups such as the Karachuonyo Youth Network, local church congregations, and community-based organizations. The enthusiasm and dedication shown by our young people was particularly inspiring.</p>
-        
-        <blockquote>"This is what true leadership looks like - bringing people together for the common good of our community," said Mary Otieno, a local church leader who participated in the drive.</blockquote>
-        
-        <h2>Areas Covered</h2>
-        <p>The clean-up exercise covered major trading centers including:</p>
-        <ul>
-            <li>Kendu Bay Market and surrounding areas</li>
-            <li>Homa Hills Trading Center</li>
-            <li>Kadel Market Square</li>
-            <li>Nyadhi Shopping Center</li>
-        </ul>
-        
-        <h2>Environmental Impact</h2>
-        <p>The initiative resulted in the collection of over 50 bags of waste, clearing of drainage systems, and general beautification of our trading centers. This effort not only improved the aesthetic appeal of our markets but also contributed to better health and sanitation conditions for traders and customers alike.</p>
-        
-        <h2>Moving Forward</h2>
-        <p>This clean-up drive is just the beginning of our comprehensive environmental conservation program. We plan to make this a monthly initiative, with each session focusing on different areas within our ward. Additionally, we are working on establishing permanent waste management systems in all major trading centers.</p>
-        
-        <p>The success of this initiative demonstrates what we can achieve when we work together as a community. It reflects our commitment to not just talking about change, but actively implementing solutions that improve the lives of our people.</p>''',
-        'read_time': '5 min read',
-        'tags': ['community', 'environment', 'youth'],
-        'featured_image': '/images/cleanup-drive.jpg',
-        'published': True,
-        'created_at': '2025-08-24T08:00:00Z',
-        'updated_at': '2025-08-24T08:00:00Z'
-    },
-    'bursary-vetting-guidelines': {
-        'id': 'bursary-vetting-guidelines',
-        'title': 'Bursary Vetting Guidelines',
-        'date': 'August 18, 2025',
-        'category': 'Education',
-        'author': 'Karachuonyo First Team',
-        'excerpt': 'Transparent criteria and timelines to ensure fairness and inclusion.',
-        'content': '''<p>Education remains the cornerstone of our development agenda, and we are committed to ensuring that every child in Karachuonyo has access to quality education regardless of their family's financial situation. Today, we are proud to announce the comprehensive bursary vetting guidelines that will govern the distribution of educational support in our constituency.</p>
-        
-        <h2>Transparency First</h2>
-        <p>Our bursary program is built on the principles of transparency, fairness, and inclusivity. We believe that every family deserves to know exactly how bursaries are allocated and what criteria are used in the selection process.</p>
-        
-        <h2>Eligibility Criteria</h2>
-        <p>The following criteria will be used to assess bursary applications:</p>
-        <ul>
-            <li><strong>Financial Need:</strong> Family income assessment and economic circumstances</li>
-            <li><strong>Academic Performance:</strong> Student's academic record and potential</li>
-            <li><strong>Community Involvement:</strong> Family's participation in community activities</li>
-            <li><strong>Special Circumstances:</strong> Orphaned students, students with disabilities, and other vulnerable cases</li>
-        </ul>
-        
-        <h2>Application Process</h2>
-        <p>The application process has been streamlined to make it accessible to all families:</p>
-        <ol>
-            <li>Application forms available at all chief's offices and online</li>
-            <li>Required documents clearly listed and easily obtainable</li>
-            <li>Community-based vetting committees in each location</li>
-            <li>Appeals process for disputed decisions</li>
-        </ol>
-        
-        <blockquote>"Education is not a privilege for the few, but a right for all. These guidelines ensure that deserving students get the support they need to achieve their dreams," emphasized our Education Coordinator.</blockquote>
-        
-        <h2>Timeline and Deadlines</h2>
-        <p>Applications will be accepted twice a year:</p>
-        <ul>
-            <li><strong>First Term:</strong> Applications due by December 15th</li>
-            <li><strong>Second Term:</strong> Applications due by April 15th</li>
-        </ul>
-        
-        <h2>Accountability Measures</h2>
-        <p>To ensure accountability and proper use of funds:</p>
-        <ul>
-            <li>Regular monitoring of beneficiaries' academic progress</li>
-            <li>Direct payment to educational institutions</li>
-            <li>Annual public reporting on bursary distribution</li>
-            <li>Community feedback mechanisms</li>
-        </ul>
-        
-        <p>We encourage all families with school-going children to familiarize themselves with these guidelines and to apply when the application windows open. Together, we can ensure that no child in Karachuonyo is denied education due to financial constraints.</p>''',
-        'read_time': '4 min read',
-        'tags': ['education', 'bursary', 'transparency'],
-        'featured_image': '/images/education-bursary.jpg',
-        'published': True,
-        'created_at': '2025-08-18T10:00:00Z',
-        'updated_at': '2025-08-18T10:00:00Z'
-    },
-    'water-nyadhi-project': {
-        'id': 'water-nyadhi-project',
-        'title': 'Water for Nyadhi – Project Update',
-        'date': 'August 2, 2025',
-        'category': 'Development',
-        'author': 'Karachuonyo First Team',
-        'excerpt': 'Borehole survey completed; rig mobilization scheduled pending NEMA greenlight.',
-        'content': '''<p>Access to clean, safe water is a fundamental human right, and we are making significant progress in ensuring that the people of Nyadhi have reliable access to this precious resource. Today, we provide a comprehensive update on the Water for Nyadhi project, which represents a major milestone in our infrastructure development agenda.</p>
-        
-        <h2>Project Background</h2>
-        <p>The Nyadhi community has faced water scarcity challenges for decades, with residents often walking long distances to access clean water. This project aims to drill a high-capacity borehole that will serve over 500 households and several institutions including schools and health facilities.</p>
-        
-        <h2>Survey Completion</h2>
-        <p>We are pleased to report that the comprehensive borehole survey has been successfully completed by certified hydrogeologists. The survey results are highly encouraging:</p>
-        <ul>
-            <li><strong>Water Table Depth:</strong> 45 meters - well within drilling capacity</li>
-            <li><strong>Estimated Yield:</strong> 15,000 liters per hour - sufficient for community needs</li>
-            <li><strong>Water Quality:</strong> Preliminary tests indicate excellent quality</li>
-            <li><strong>Sustainability:</strong> Aquifer shows signs of good recharge potential</li>
-        </ul>
-        
-        <h2>Environmental Compliance</h2>
-        <p>As responsible stewards of our environment, we have submitted all required documentation to the National Environment Management Authority (NEMA) for environmental impact assessment. This includes:</p>
-        <ul>
-            <li>Environmental Impact Assessment (EIA) report</li>
-            <li>Community consultation reports</li>
-            <li>Hydrogeological survey findings</li>
-            <li>Waste management and site restoration plans</li>
-        </ul>
-        
-        <blockquote>"We are committed to ensuring that this project not only provides water but also protects our environment for future generations," stated our Project Coordinator.</blockquote>
-        
-        <h2>Next Steps</h2>
-        <p>Upon receiving NEMA clearance, which we expect within the next two weeks, we will immediately proceed with:</p>
-        <ol>
-            <li>Drilling rig mobilization to site</li>
-            <li>Commencement of drilling operations</li>
-            <li>Installation of pumping equipment</li>
-            <li>Construction of distribution network</li>
-            <li>Community training on maintenance</li>
-        </ol>
-        
-        <h2>Community Involvement</h2>
-        <p>This project has been a true community effort from the beginning. Local residents have contributed through:</p>
-        <ul>
-            <li>Site identification and access provision</li>
-            <li>Local labor and materials where possible</li>
-            <li>Formation of a water management committee</li>
-            <li>Commitment to ongoing maintenance and sustainability</li>
-        </ul>
-        
-        <h2>Expected Timeline</h2>
-        <p>Based on current progress and pending approvals:</p>
-        <ul>
-            <li><strong>NEMA Approval:</strong> Expected by August 15, 2025</li>
-            <li><strong>Drilling Commencement:</strong> August 20, 2025</li>
-            <li><strong>Project Completion:</strong> September 30, 2025</li>
-            <li><strong>Community Handover:</strong> October 5, 2025</li>
-        </ul>
-        
-        <p>The Water for Nyadhi project exemplifies our commitment to addressing the real, everyday challenges facing our people. Clean water access will not only improve health outcomes but also free up time for productive activities, particularly for women and children who currently bear the burden of water collection.</p>
-        
-        <p>We will continue to provide regular updates on this project and welcome community feedback and involvement at every stage.</p>''',
-        'read_time': '6 min read',
-        'tags': ['development', 'water', 'infrastructure'],
-        'featured_image': '/images/water-project.jpg',
-        'published': True,
-        'created_at': '2025-08-02T09:00:00Z',
-        'updated_at': '2025-08-02T09:00:00Z'
-    }
-}
-
 # Public API endpoints for blog/news
 @app.route('/api/news', methods=['GET'])
+@response_cache.cached(tags=['news'])
 def get_news_articles():
     """Get published news articles"""
     try:
-        # Get query parameters
-        category = request.args.get('category')
-        limit = int(request.args.get('limit', 10))
-        offset = int(request.args.get('offset', 0))
-        
-        # Filter published articles
-        published_articles = [article for article in ARTICLES.values() if article.get('published', False)]
-        
-        # Filter by category if specified
-        if category:
-            published_articles = [article for article in published_articles if article.get('category', '').lower() == category.lower()]
-        
-        # Sort by date (newest first)
-        published_articles.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Apply pagination
-        total = len(published_articles)
-        articles = published_articles[offset:offset + limit]
+        category, limit, offset = parse_list_args(request.args)
         
-        # Remove full content from list view
-        article_summaries = []
-        for article in articles:
-            summary = article.copy()
-            summary.pop('content', None)  # Remove full content for list view
-            article_summaries.append(summary)
+        # Summaries (no content) come pre-sorted newest first from the catalog
+        article_summaries, total = news_catalog.list(category, limit, offset)
         
         return jsonify({
             'success': True,
@@ -1877,6 +1640,11 @@ def get_news_articles():
             'offset': offset
         })
         
+    except NewsQueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error fetching news articles: {e}")
         return jsonify({
@@ -1884,29 +1652,70 @@ def get_news_articles():
             'error': 'Failed to fetch articles'
         }), 500
 
+@app.route('/api/news/search', methods=['GET'])
+def search_news_articles():
+    """Full-text search over published articles, best matches first"""
+    try:
+        query, limit, offset = parse_search_args(request.args)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        results, total = search_articles(cursor, db_pool.dialect, query, limit, offset)
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        })
+        
+    except SearchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error searching news articles: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to search articles'
+        }), 500
+
 @app.route('/api/news/<article_id>', methods=['GET'])
 def get_news_article(article_id):
     """Get a specific news article by ID and increment view count"""
+    # Count the view here: the article itself may be served from the cache
+    article = news_catalog.get(article_id)
+    if article and isinstance(article['id'], int):
+        engagement.add(article['id'], 'views')
+    
+    return render_news_article(article_id)
+
+@response_cache.cached(tags=['news'])
+def render_news_article(article_id):
+    """Article payload, cached until the next admin write.
+
+    Views, likes and shares change on every visit, so they are left out
+    rather than served stale for the cache TTL; clients read them from
+    /api/news/<id>/metrics or the article's /api/live topic.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # First try to get from database
         cursor.execute('''
             SELECT id, title, slug, excerpt, content, featured_image, author, 
-                   created_at, updated_at, published_at, views, likes, shares, tags
+                   created_at, updated_at, published_at, tags
             FROM news_articles 
             WHERE (slug = ? OR id = ?) AND status = 'published'
-        ''', (article_id, article_id))
+        ''', article_lookup_params(article_id))
         
         row = cursor.fetchone()
         
         if row:
-            # Increment view count
-            cursor.execute('UPDATE news_articles SET views = views + 1 WHERE slug = ? OR id = ?', 
-                         (article_id, article_id))
-            conn.commit()
-            
             article = {
                 'id': row[0],
                 'title': row[1],
@@ -1918,27 +1727,23 @@ def get_news_article(article_id):
                 'created_at': row[7],
                 'updated_at': row[8],
                 'published_at': row[9],
-                'views': row[10] + 1,  # Return incremented count
-                'likes': row[11],
-                'shares': row[12],
-                'tags': row[13].split(',') if row[13] else []
+                'tags': row[10].split(',') if row[10] else []
             }
         else:
-            # Fallback to hardcoded articles
-            article = ARTICLES.get(article_id)
-            if not article or not article.get('published', False):
-                conn.close()
+            # Fallback to seed articles
+            article = news_catalog.get(article_id)
+            if not article:
                 return jsonify({
                     'success': False,
                     'error': 'Article not found'
                 }), 404
         
-        conn.close()
-        
-        return jsonify({
+        response = jsonify({
             'success': True,
             'article': article
         })
+        response.last_modified = http_cache.parse_timestamp(article.get('updated_at'))
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching article {article_id}: {e}")
@@ -1948,17 +1753,13 @@ def get_news_article(article_id):
         }), 500
 
 @app.route('/api/news/categories', methods=['GET'])
+@response_cache.cached(tags=['news'])
 def get_news_categories():
     """Get all available news categories"""
     try:
-        categories = set()
-        for article in ARTICLES.values():
-            if article.get('published', False) and article.get('category'):
-                categories.add(article['category'])
-        
         return jsonify({
             'success': True,
-            'categories': sorted(list(categories))
+            'categories': news_catalog.categories()
         })
         
     except Exception as e:
@@ -1972,32 +1773,23 @@ def get_news_categories():
 def like_article(article_id):
     """Like a news article"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Check if article exists
-        cursor.execute('SELECT id FROM news_articles WHERE (slug = ? OR id = ?) AND status = "published"', 
-                      (article_id, article_id))
+        cursor.execute("SELECT id, likes FROM news_articles WHERE (slug = ? OR id = ?) AND status = 'published'", 
+                      article_lookup_params(article_id))
         
-        if not cursor.fetchone():
-            conn.close()
+        row = cursor.fetchone()
+        if not row:
             return jsonify({
                 'success': False,
                 'error': 'Article not found'
             }), 404
         
-        # Increment like count
-        cursor.execute('UPDATE news_articles SET likes = likes + 1 WHERE slug = ? OR id = ?', 
-                      (article_id, article_id))
-        
-        # Get updated like count
-        cursor.execute('SELECT likes FROM news_articles WHERE slug = ? OR id = ?', 
-                      (article_id, article_id))
-        
-        new_likes = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
+        # Increment like count (written by the engagement buffer)
+        engagement.add(row[0], 'likes')
+        new_likes = row[1] + engagement.pending(row[0])['likes']
         
         return jsonify({
             'success': True,
@@ -2016,32 +1808,23 @@ def like_article(article_id):
 def share_article(article_id):
     """Increment share count for a news article"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Check if article exists
-        cursor.execute('SELECT id FROM news_articles WHERE (slug = ? OR id = ?) AND status = "published"', 
-                      (article_id, article_id))
+        cursor.execute("SELECT id, shares FROM news_articles WHERE (slug = ? OR id = ?) AND status = 'published'", 
+                      article_lookup_params(article_id))
         
-        if not cursor.fetchone():
-            conn.close()
+        row = cursor.fetchone()
+        if not row:
             return jsonify({
                 'success': False,
                 'error': 'Article not found'
             }), 404
         
-        # Increment share count
-        cursor.execute('UPDATE news_articles SET shares = shares + 1 WHERE slug = ? OR id = ?', 
-                      (article_id, article_id))
-        
-        # Get updated share count
-        cursor.execute('SELECT shares FROM news_articles WHERE slug = ? OR id = ?', 
-                      (article_id, article_id))
-        
-        new_shares = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
+        # Increment share count (written by the engagement buffer)
+        engagement.add(row[0], 'shares')
+        new_shares = row[1] + engagement.pending(row[0])['shares']
         
         return jsonify({
             'success': True,
@@ -2060,29 +1843,28 @@ def share_article(article_id):
 def get_article_metrics(article_id):
     """Get current metrics (views, likes, shares) for an article"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT views, likes, shares FROM news_articles WHERE (slug = ? OR id = ?) AND status = "published"', 
-                      (article_id, article_id))
+        cursor.execute("SELECT id, views, likes, shares FROM news_articles WHERE (slug = ? OR id = ?) AND status = 'published'", 
+                      article_lookup_params(article_id))
         
         row = cursor.fetchone()
         
         if not row:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'Article not found'
             }), 404
         
-        conn.close()
+        pending = engagement.pending(row[0])
         
         return jsonify({
             'success': True,
             'metrics': {
-                'views': row[0],
-                'likes': row[1],
-                'shares': row[2]
+                'views': row[1] + pending['views'],
+                'likes': row[2] + pending['likes'],
+                'shares': row[3] + pending['shares']
             }
         })
         
@@ -2118,104 +1900,120 @@ def process_mpesa_donation():
         if amount < 1:
             return jsonify({'error': 'Minimum donation amount is KSH 1'}), 400
         
-        # Generate account reference
-        account_ref = f"DONATION_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Fail fast while M-Pesa is known to be down or pushes are backed up
+        retry_after = mpesa.guard.breaker.retry_after()
+        if retry_after > 0 or not donation_initiator.has_capacity():
+            response = jsonify({'error': 'M-Pesa is temporarily unavailable, please try again shortly'})
+            response.headers['Retry-After'] = str(max(int(retry_after), 1))
+            return response, 503
         
-        # Initiate STK push
-        result = mpesa.stk_push(
-            phone=phone,
-            amount=amount,
-            account_ref=account_ref,
-            description=f"Donation from {donor_name}"
-        )
+        # Record the donation first; the STK push is sent in the background
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO donations (donor_name, amount, payment_method, status, created_at, donor_email, phone_number, ip_address, user_agent, next_check_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            donor_name,
+            amount,
+            'mpesa',
+            'pending_init',
+            datetime.now().isoformat(),
+            donor_email,
+            phone,
+            request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr),
+            request.headers.get('User-Agent'),
+            # Failed by the sweeper if the push has not started by then
+            int(time.time()) + donation_initiator.queue_deadline()
+        ))
+        donation_id = cursor.lastrowid
+        conn.commit()
         
-        if result.get('ResponseCode') == '0':
-            # Save donation record to database
-            conn = sqlite3.connect('karachuonyo.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO donations (donor_name, amount, payment_method, status, transaction_id, created_at, donor_email, phone_number, checkout_request_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                donor_name,
-                amount,
-                'mpesa',
-                'pending',
-                result.get('CheckoutRequestID'),
-                datetime.now().isoformat(),
-                donor_email,
-                phone,
-                result.get('CheckoutRequestID')
-            ))
-            
+        try:
+            donation_initiator.submit(
+                donation_id,
+                phone=phone,
+                amount=amount,
+                account_ref=f"DONATION_{donation_id}",
+                description=f"Donation from {donor_name}"
+            )
+        except DonationBusyError as e:
+            logger.warning(f"Donation {donation_id} not pushed: {e}")
+            conn.execute(
+                "UPDATE donations SET status = 'failed', status_detail = ? WHERE id = ?",
+                ('M-Pesa is busy, please try again shortly', donation_id)
+            )
             conn.commit()
-            conn.close()
-            
-            return jsonify({
-                'success': True,
-                'message': 'STK push sent successfully',
-                'checkout_request_id': result.get('CheckoutRequestID'),
-                'merchant_request_id': result.get('MerchantRequestID')
-            })
-        else:
-            return jsonify({
-                'error': 'Failed to initiate payment',
-                'details': result.get('errorMessage', 'Unknown error')
-            }), 400
+            response = jsonify({'error': 'M-Pesa is busy, please try again shortly'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        
+        return jsonify({
+            'success': True,
+            'message': 'Donation received, sending the M-Pesa prompt to your phone',
+            'donation_id': donation_id,
+            'status': 'pending_init',
+            'status_url': f'/api/donations/{donation_id}/status'
+        }), 202
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/donations/summary', methods=['GET'])
+def donation_summary():
+    """Public fundraising total for progress bars, read from the rollups"""
+    try:
+        summary = fundraising.progress(get_db(), app.config.get('FUNDRAISING_GOAL', 0))
+        summary['currency'] = 'KES'
+        return jsonify(summary)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/live', methods=['GET'])
+def live_updates():
+    """Server-sent events for ?topics=article:<id>,fundraising,event:<id>"""
+    topics = request.args.get('topics', '').split(',')
+    try:
+        subscriber = live_hub.subscribe(topics)
+    except LiveTopicError as e:
+        return jsonify({'error': str(e)}), 400
+    except LiveBusyError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    response = Response(live_hub.stream(subscriber), mimetype='text/event-stream', headers={
+        # no-transform keeps CompressionMiddleware from buffering events
+        'Cache-Control': 'no-cache, no-transform',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also covers clients that disconnect before the stream is first read
+    response.call_on_close(lambda: live_hub.unsubscribe(subscriber))
+    return response
+
+@app.route('/api/donations/<int:donation_id>/status', methods=['GET'])
+def get_donation_status(donation_id):
+    """Polled by the donation form until the payment settles"""
+    status = donation_initiator.status(get_db(), donation_id)
+    if status is None:
+        return jsonify({'error': 'Donation not found'}), 404
+    response = jsonify(status)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/api/mpesa/callback', methods=['POST'])
 def mpesa_callback():
+    # Record and acknowledge at once; callback_processor settles the donation
     try:
-        callback_data = request.get_json()
-        
-        # Process callback data
-        stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
-        result_code = stk_callback.get('ResultCode')
-        checkout_request_id = stk_callback.get('CheckoutRequestID')
-        
-        # Update donation status in database
-        conn = sqlite3.connect('karachuonyo.db')
-        cursor = conn.cursor()
-        
-        if result_code == 0:  # Success
-            # Extract transaction details
-            callback_metadata = stk_callback.get('CallbackMetadata', {})
-            items = callback_metadata.get('Item', [])
-            
-            mpesa_receipt = None
-            transaction_date = None
-            
-            for item in items:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    mpesa_receipt = item.get('Value')
-                elif item.get('Name') == 'TransactionDate':
-                    transaction_date = item.get('Value')
-            
-            cursor.execute('''
-                UPDATE donations 
-                SET status = ?, completed_at = ?, transaction_id = ?
-                WHERE checkout_request_id = ?
-            ''', ('completed', datetime.now().isoformat(), mpesa_receipt, checkout_request_id))
-        else:
-            # Payment failed
-            cursor.execute('''
-                UPDATE donations 
-                SET status = ?
-                WHERE checkout_request_id = ?
-            ''', ('failed', checkout_request_id))
-        
+        conn = get_db()
+        callback_inbox.record(conn, request.get_data(as_text=True))
         conn.commit()
-        conn.close()
-        
-        return jsonify({'ResultCode': 0, 'ResultDesc': 'Success'})
-        
     except Exception as e:
-        print(f"Callback error: {e}")
+        logger.error(f"Recording M-Pesa callback failed: {e}")
         return jsonify({'ResultCode': 1, 'ResultDesc': 'Error'})
+    
+    callback_processor.notify()
+    return jsonify({'ResultCode': 0, 'ResultDesc': 'Success'})
 
 if __name__ == '__main__':
     # Initialize database on startup
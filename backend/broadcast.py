@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Newsletter Broadcasts
+Bulk email to active newsletter subscribers, resumable and rate limited
+
+A broadcast stores its subject, HTML and plain-text template sources. A run
+compiles them once, streams active subscribers in id order, BROADCAST_BATCH_SIZE
+at a time, and splits each batch across BROADCAST_CONCURRENCY threads. Every
+thread borrows a persistent SMTP connection from a small pool, so a whole run
+opens at most that many connections. A token bucket caps the total send rate
+at BROADCAST_RATE_LIMIT messages per second.
+
+Each sending thread writes its recipients' outcomes to
+newsletter_broadcast_recipients every record_every messages, refreshing
+the run's heartbeat as it does; the checkpoint (the last subscriber id)
+moves on after each batch. A run that crashes or is stopped resumes after
+the checkpoint and skips anyone already recorded. Delivery is therefore
+at least once: only the few messages sent since a thread last recorded
+can go out again. A run whose heartbeat is older than
+BROADCAST_LEASE_SECONDS counts as crashed and can be taken over; the old
+run stops at its next record once it sees it has lost its claim.
+
+    python broadcast.py run <id>     send (or resume) a broadcast
+    python broadcast.py status <id>  progress and throughput
+"""
+
+import argparse
+import logging
+import os
+import queue
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_mail import Message
+
+from outbound import RateLimiter
+from outbox import is_dev_mail
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('pending', 'running', 'paused', 'completed', 'cancelled')
+
+_BROADCAST_COLUMNS = '''
+    id, subject, status, total_recipients, sent_count, failed_count,
+    last_subscriber_id, messages_per_second, last_error, created_at,
+    started_at, finished_at
+'''
+
+
+class BroadcastError(Exception):
+    """Raised when a broadcast cannot be created or run"""
+
+
+class _LoggingConnection:
+    """Stands in for SMTP in development mode with the placeholder account"""
+
+    def send(self, message):
+        logger.debug(f"[DEV MODE] Broadcast email would be sent to {message.recipients}")
+
+    def __exit__(self, *exc):
+        pass
+
+
+class SMTPConnectionPool:
+    """Open Flask-Mail connections reused across messages and batches"""
+
+    def __init__(self, mail, size):
+        self.mail = mail
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if is_dev_mail():
+            return _LoggingConnection()
+        connection = self.mail.connect()
+        connection.__enter__()
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    def discard(self, connection):
+        """Drop a connection that failed; the next acquire opens a new one"""
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                self.discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class BroadcastEngine:
+    """Creates broadcasts and sends them to active newsletter subscribers"""
+
+    def __init__(self, app, mail, pool, templates, batch_size=500, concurrency=4,
+                 rate_limit=0, max_attempts=3, lease_seconds=120, record_every=20):
+        self.app = app
+        self.mail = mail
+        self.pool = pool
+        self.templates = templates
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.record_every = record_every
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app, mail, pool, templates):
+        config = app.config
+        return cls(
+            app, mail, pool, templates,
+            batch_size=config.get('BROADCAST_BATCH_SIZE', 500),
+            concurrency=config.get('BROADCAST_CONCURRENCY', 4),
+            rate_limit=config.get('BROADCAST_RATE_LIMIT', 0),
+            max_attempts=config.get('BROADCAST_MAX_ATTEMPTS', 3),
+            lease_seconds=config.get('BROADCAST_LEASE_SECONDS', 120)
+        )
+
+    # Broadcast records
+
+    def create(self, subject, html, text=None):
+        """Store a new pending broadcast after checking its templates compile"""
+        try:
+            self.templates.compile(subject, html, text)
+        except Exception as e:
+            raise BroadcastError(f'Invalid template: {e}')
+
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO newsletter_broadcasts (subject, html, body) VALUES (?, ?, ?)',
+                (subject, html, text)
+            )
+            broadcast_id = cursor.lastrowid
+            conn.commit()
+            return broadcast_id
+        finally:
+            self.pool.release(conn)
+
+    def get(self, broadcast_id):
+        """Progress of one broadcast as a dict, or None"""
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute(
+                f'SELECT {_BROADCAST_COLUMNS} FROM newsletter_broadcasts WHERE id = ?',
+                (broadcast_id,)
+            ).fetchone()
+        finally:
+            self.pool.release(conn)
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'subject': row[1],
+            'status': row[2],
+            'total_recipients': row[3],
+            'sent': row[4],
+            'failed': row[5],
+            'remaining': max(row[3] - row[4] - row[5], 0),
+            'last_subscriber_id': row[6],
+            'messages_per_second': row[7],
+            'last_error': row[8],
+            'created_at': row[9],
+            'started_at': row[10],
+            'finished_at': row[11],
+            'running_here': self.is_running(row[0])
+        }
+
+    def cancel(self, broadcast_id):
+        """Stop a broadcast after its current batch; it cannot be resumed"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('''
+                UPDATE newsletter_broadcasts SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('pending', 'running', 'paused')
+            ''', (broadcast_id,))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            self.pool.release(conn)
+
+    # Running
+
+    def start(self, broadcast_id):
+        """Run a broadcast in a background thread of this process"""
+        with self._lock:
+            if self.is_running(broadcast_id):
+                raise BroadcastError('Broadcast is already running in this process')
+            self._claim(broadcast_id)
+            thread = threading.Thread(
+                target=self._run_claimed, args=(broadcast_id,),
+                name=f'broadcast-{broadcast_id}', daemon=True
+            )
+            self._threads[broadcast_id] = thread
+            thread.start()
+
+    def is_running(self, broadcast_id):
+        thread = self._threads.get(broadcast_id)
+        return thread is not None and thread.is_alive()
+
+    def run(self, broadcast_id, max_batches=None):
+        """Send a pending, paused or crashed broadcast in this thread.
+
+        Stops early after ``max_batches`` batches, leaving the broadcast
+        paused and resumable. Returns the final progress dict.
+        """
+        self._claim(broadcast_id)
+        return self._run_claimed(broadcast_id, max_batches)
+
+    def _claim(self, broadcast_id):
+        now = int(time.time())
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('''
+                UPDATE newsletter_broadcasts
+                SET status = 'running', locked_by = ?, heartbeat_at = ?, last_error = NULL,
+                    started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+                WHERE id = ? AND (status IN ('pending', 'paused')
+                                  OR (status = 'running' AND heartbeat_at < ?))
+            ''', (self.worker_id, now, broadcast_id, now - self.lease_seconds))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+        if cursor.rowcount != 1:
+            raise BroadcastError('Broadcast not found, finished, or running elsewhere')
+
+    def _run_claimed(self, broadcast_id, max_batches=None):
+        conn = self.pool.acquire()
+        try:
+            subject, html, text, checkpoint = conn.execute(
+                'SELECT subject, html, body, last_subscriber_id FROM newsletter_broadcasts WHERE id = ?',
+                (broadcast_id,)
+            ).fetchone()
+            # Recipients so far plus everyone still ahead of the checkpoint
+            total = conn.execute('''
+                SELECT COUNT(*) FROM newsletter_broadcast_recipients WHERE broadcast_id = ?
+            ''', (broadcast_id,)).fetchone()[0] + conn.execute(
+                "SELECT COUNT(*) FROM newsletter_subscriptions WHERE status = 'active' AND id > ?",
+                (checkpoint,)
+            ).fetchone()[0]
+            conn.execute('UPDATE newsletter_broadcasts SET total_recipients = ? WHERE id = ?',
+                         (total, broadcast_id))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+        template = self.templates.compile(subject, html, text)
+        limiter = RateLimiter(self.rate_limit)
+        smtp_pool = SMTPConnectionPool(self.mail, self.concurrency)
+        started = time.monotonic()
+        claim_lost = threading.Event()
+        sent_this_run = 0
+        batches = 0
+        status, error = 'completed', None
+
+        logger.info(f"Broadcast {broadcast_id} started: {total} recipients, "
+                    f"resuming after subscriber {checkpoint}")
+        try:
+            with ThreadPoolExecutor(self.concurrency, thread_name_prefix='broadcast-send') as executor:
+                while True:
+                    rows = self._next_batch(broadcast_id, checkpoint)
+                    if not rows:
+                        break
+
+                    chunks = [rows[i::self.concurrency] for i in range(self.concurrency)]
+                    sent_this_run += sum(executor.map(
+                        lambda chunk: self._send_chunk(broadcast_id, template, chunk, smtp_pool,
+                                                       limiter, claim_lost),
+                        [chunk for chunk in chunks if chunk]
+                    ))
+
+                    checkpoint = rows[-1][0]
+                    elapsed = time.monotonic() - started
+                    rate = round(sent_this_run / elapsed, 1) if elapsed else None
+                    if claim_lost.is_set() or not self._checkpoint(broadcast_id, checkpoint, rate):
+                        status = None  # cancelled (or taken over) meanwhile
+                        break
+
+                    batches += 1
+                    if max_batches is not None and batches >= max_batches:
+                        status = 'paused'
+                        break
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+            status, error = 'paused', str(e)[:500]
+        finally:
+            smtp_pool.close_all()
+
+        if status is not None:
+            self._finish(broadcast_id, status, error)
+        elapsed = time.monotonic() - started
+        logger.info(f"Broadcast {broadcast_id}: {sent_this_run} sent in {elapsed:.1f}s "
+                    f"over {smtp_pool.opened} SMTP connections")
+        return self.get(broadcast_id)
+
+    def _next_batch(self, broadcast_id, checkpoint):
+        """Next active subscribers after ``checkpoint`` not yet recorded for this broadcast"""
+        conn = self.pool.acquire()
+        try:
+            return conn.execute('''
+                SELECT s.id, s.email, s.name FROM newsletter_subscriptions s
+                WHERE s.status = 'active' AND s.id > ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM newsletter_broadcast_recipients r
+                      WHERE r.broadcast_id = ? AND r.subscriber_id = s.id
+                  )
+                ORDER BY s.id
+                LIMIT ?
+            ''', (checkpoint, broadcast_id, self.batch_size)).fetchall()
+        finally:
+            self.pool.release(conn)
+
+    def _send_chunk(self, broadcast_id, template, rows, smtp_pool, limiter, claim_lost):
+        """Send to ``rows`` over one pooled connection, recording outcomes as it goes.
+
+        Returns the number sent. Stops early once ``claim_lost`` is set (by
+        any thread) because the run was cancelled or taken over.
+        """
+        sent = 0
+        results = []
+        list_unsubscribe = None
+        with self.app.app_context():
+            sender = self.app.config.get('MAIL_DEFAULT_SENDER')
+            if sender:
+                list_unsubscribe = f'<mailto:{sender}?subject=UNSUBSCRIBE>'
+            smtp = smtp_pool.acquire()
+            try:
+                for subscriber_id, email, name in rows:
+                    if claim_lost.is_set():
+                        break
+                    rendered = template.render({'name': name, 'email': email})
+                    message = Message(
+                        subject=rendered.subject,
+                        recipients=[email],
+                        html=rendered.html,
+                        body=rendered.text,
+                        extra_headers={'List-Unsubscribe': list_unsubscribe} if list_unsubscribe else None
+                    )
+                    status, error, attempts = 'failed', None, 0
+                    while attempts < self.max_attempts:
+                        attempts += 1
+                        limiter.wait()
+                        try:
+                            if smtp is None:
+                                smtp = smtp_pool.acquire()
+                            smtp.send(message)
+                            status, error = 'sent', None
+                            break
+                        except smtplib.SMTPRecipientsRefused as e:
+                            # The relay will not take this address; retrying cannot help
+                            error = str(e)
+                            break
+                        except (smtplib.SMTPException, OSError) as e:
+                            error = str(e)
+                            if smtp is not None:
+                                smtp_pool.discard(smtp)
+                                smtp = None
+                    results.append((subscriber_id, email, status, attempts, error and error[:500]))
+                    sent += status == 'sent'
+
+                    if len(results) >= self.record_every:
+                        if not self._record(broadcast_id, results):
+                            claim_lost.set()
+                        results = []
+            finally:
+                if smtp is not None:
+                    smtp_pool.release(smtp)
+                # Also on the way out of a crash, so what was sent is not sent again
+                if results and not claim_lost.is_set() and not self._record(broadcast_id, results):
+                    claim_lost.set()
+        return sent
+
+    def _record(self, broadcast_id, results):
+        """Persist outcomes and refresh the heartbeat; False if the run lost its claim"""
+        sent = sum(1 for result in results if result[2] == 'sent')
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('''
+                UPDATE newsletter_broadcasts
+                SET sent_count = sent_count + ?, failed_count = failed_count + ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'running' AND locked_by = ?
+            ''', (sent, len(results) - sent, int(time.time()), broadcast_id, self.worker_id))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return False
+            conn.executemany('''
+                INSERT INTO newsletter_broadcast_recipients
+                (broadcast_id, subscriber_id, email, status, attempts, error)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(broadcast_id,) + result for result in results])
+            conn.commit()
+            return True
+        finally:
+            self.pool.release(conn)
+
+    def _checkpoint(self, broadcast_id, checkpoint, rate):
+        """Move the resume point past a finished batch; False if the run lost its claim"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('''
+                UPDATE newsletter_broadcasts
+                SET last_subscriber_id = ?, messages_per_second = ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'running' AND locked_by = ?
+            ''', (checkpoint, rate, int(time.time()), broadcast_id, self.worker_id))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            self.pool.release(conn)
+
+    def _finish(self, broadcast_id, status, error=None):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                UPDATE newsletter_broadcasts
+                SET status = ?, last_error = ?, locked_by = NULL,
+                    finished_at = CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP ELSE finished_at END
+                WHERE id = ? AND status = 'running' AND locked_by = ?
+            ''', (status, error, status, broadcast_id, self.worker_id))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo newsletter broadcasts')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='Send or resume a broadcast')
+    run.add_argument('broadcast_id', type=int)
+    status = subparsers.add_parser('status', help='Show broadcast progress')
+    status.add_argument('broadcast_id', type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import broadcasts
+
+    try:
+        if args.command == 'run':
+            progress = broadcasts.run(args.broadcast_id)
+        else:
+            progress = broadcasts.get(args.broadcast_id)
+    except BroadcastError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if progress is None:
+        print('Broadcast not found')
+        return 1
+    for key, value in progress.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
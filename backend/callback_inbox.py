@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo M-Pesa Callback Inbox
+Append-only record of Daraja callbacks, applied to donations in batches
+
+The callback endpoint only appends the raw body to mpesa_callback_inbox
+and acknowledges, so Safaricom gets its answer after one indexed insert
+however large the donations table grows. CallbackProcessor claims new
+inbox rows in batches, looks their donations up in one query on the
+unique checkout_request_id index and settles them in a single
+transaction, together with the fundraising rollups. Callbacks for a
+donation that is already settled (Safaricom retries them) are marked
+'duplicate' and change nothing, except that a successful one still
+completes a donation the sweeper gave up on or whose push response was
+lost: the donor has paid, so it is counted as 'late_completed'. A callback that arrives before its STK
+push was recorded is retried a few times, then left 'unmatched' for
+inspection.
+
+The processor runs as a thread in each web process
+(MPESA_CALLBACK_WORKER=thread) or as a separate process:
+
+    python callback_inbox.py run      apply callbacks until interrupted
+    python callback_inbox.py status   inbox rows by status
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from fundraising import record_completed
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('new', 'processing', 'applied', 'duplicate', 'unmatched', 'invalid')
+
+# Applied and duplicate rows are kept, so /health counts only the rest, each
+# off the status index
+UNSETTLED_STATUSES = ('new', 'processing', 'unmatched', 'invalid')
+
+# Donation statuses a callback may still settle
+OPEN_DONATION_STATUSES = ('pending_init', 'pending')
+
+# A successful callback is proof of payment, so it also completes these
+LATE_DONATION_STATUSES = ('pushing', 'failed')
+COMPLETABLE_DONATION_STATUSES = OPEN_DONATION_STATUSES + LATE_DONATION_STATUSES
+
+
+def _placeholders(values):
+    return ', '.join('?' for _ in values)
+
+
+def record(conn, body):
+    """Append a raw callback body to the inbox (committed by the caller)"""
+    checkout_request_id = result_code = None
+    try:
+        callback = json.loads(body).get('Body', {}).get('stkCallback', {})
+        checkout_request_id = callback.get('CheckoutRequestID')
+        result_code = callback.get('ResultCode')
+    except (ValueError, AttributeError):
+        pass  # kept as received and marked invalid by the processor
+    now = int(time.time())
+    conn.execute('''
+        INSERT INTO mpesa_callback_inbox
+        (checkout_request_id, result_code, payload, received_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (checkout_request_id, result_code, body, now, now))
+
+
+def parse(payload):
+    """(checkout_request_id, result_code, result_desc, metadata dict) or None"""
+    try:
+        callback = json.loads(payload)['Body']['stkCallback']
+        items = callback.get('CallbackMetadata', {}).get('Item', [])
+        metadata = {item.get('Name'): item.get('Value') for item in items}
+        return (callback['CheckoutRequestID'], int(callback['ResultCode']),
+                callback.get('ResultDesc'), metadata)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def inbox_depth(conn):
+    """Counts of inbox rows still waiting or needing inspection, by status"""
+    depth = {}
+    for status in UNSETTLED_STATUSES:
+        depth[status] = conn.execute(
+            'SELECT COUNT(*) FROM mpesa_callback_inbox WHERE status = ?', (status,)
+        ).fetchone()[0]
+    return depth
+
+
+class CallbackProcessor:
+    """Claims new inbox rows and applies them to donations in batches"""
+
+    def __init__(self, pool, initiator=None, batch_size=200, poll_interval=1.0,
+                 max_attempts=6, retry_base=5, lease_seconds=60):
+        self.pool = pool
+        self.initiator = initiator
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._pid = None
+        self._thread = None
+        self._counts = dict.fromkeys(
+            ('applied', 'duplicate', 'retried', 'unmatched', 'invalid', 'late_completed'), 0
+        )
+        self._last_error = None
+
+    @classmethod
+    def from_config(cls, app, pool, initiator=None):
+        config = app.config
+        return cls(
+            pool, initiator,
+            batch_size=config.get('MPESA_CALLBACK_BATCH_SIZE', 200),
+            poll_interval=config.get('MPESA_CALLBACK_POLL_INTERVAL', 1.0),
+            max_attempts=config.get('MPESA_CALLBACK_MAX_ATTEMPTS', 6),
+            retry_base=config.get('MPESA_CALLBACK_RETRY_BASE', 5)
+        )
+
+    # Background thread
+
+    def start(self):
+        """Start the processing thread in this process (after any fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.worker_id = f'{socket.gethostname()}:{self._pid}'
+                self._stopped = False
+                self._thread = threading.Thread(target=self.run, name='mpesa-callbacks', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """Wake this process's processor after recording a callback"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        """Apply callbacks until stopped, polling between batches"""
+        while not self._stopped:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Applying M-Pesa callbacks failed: {e}")
+                with self._lock:
+                    self._last_error = str(e)[:200]
+
+    # Processing
+
+    def drain(self):
+        """Apply claimed batches until none are due; returns rows processed"""
+        self._release_expired()
+        processed = 0
+        while not self._stopped:
+            rows = self._claim()
+            if not rows:
+                break
+            self._apply(rows)
+            processed += len(rows)
+        return processed
+
+    def _claim(self):
+        """Mark up to batch_size due inbox rows as ours and return them"""
+        now = int(time.time())
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                UPDATE mpesa_callback_inbox SET status = 'processing', locked_by = ?, locked_at = ?
+                WHERE status = 'new' AND id IN (
+                    SELECT id FROM mpesa_callback_inbox
+                    WHERE status = 'new' AND next_attempt_at <= ?
+                    ORDER BY id
+                    LIMIT ?
+                )
+            ''', (self.worker_id, now, now, self.batch_size))
+            conn.commit()
+            return conn.execute('''
+                SELECT id, payload, attempts FROM mpesa_callback_inbox
+                WHERE status = 'processing' AND locked_by = ? AND locked_at = ?
+                ORDER BY id
+            ''', (self.worker_id, now)).fetchall()
+        finally:
+            self.pool.release(conn)
+
+    def _apply(self, rows):
+        parsed = {row[0]: parse(row[1]) for row in rows}
+        checkout_ids = sorted({p[0] for p in parsed.values() if p})
+
+        now = datetime.now().isoformat()
+        completed, failed, outcomes, retry, late = [], [], [], [], []
+        settled = {}
+
+        conn = self.pool.acquire()
+        try:
+            donations = {}
+            if checkout_ids:
+                for donation_id, checkout_request_id, status, amount, payment_method in conn.execute(
+                    f'SELECT id, checkout_request_id, status, amount, payment_method FROM donations '
+                    f'WHERE checkout_request_id IN ({_placeholders(checkout_ids)})', checkout_ids
+                ).fetchall():
+                    donations[checkout_request_id] = (donation_id, status, amount, payment_method)
+
+            for row_id, payload, attempts in rows:
+                callback = parsed[row_id]
+                if callback is None:
+                    outcomes.append(('invalid', row_id))
+                    continue
+                checkout_request_id, result_code, result_desc, metadata = callback
+                donation = donations.get(checkout_request_id)
+                if donation is None:
+                    # The push may not be recorded yet: look again shortly
+                    if attempts + 1 >= self.max_attempts:
+                        outcomes.append(('unmatched', row_id))
+                    else:
+                        delay = self.retry_base * 2 ** attempts
+                        retry.append((attempts + 1, int(time.time()) + delay, row_id))
+                    continue
+                settleable = COMPLETABLE_DONATION_STATUSES if result_code == 0 else OPEN_DONATION_STATUSES
+                if donation[1] not in settleable or checkout_request_id in settled:
+                    outcomes.append(('duplicate', row_id))
+                    continue
+
+                if result_code == 0:
+                    settled[checkout_request_id] = ('completed', None)
+                    completed.append((now, metadata.get('MpesaReceiptNumber'), checkout_request_id))
+                    if donation[1] in LATE_DONATION_STATUSES:
+                        late.append(donation[0])
+                else:
+                    settled[checkout_request_id] = ('failed', result_desc)
+                    failed.append((result_desc, checkout_request_id))
+                outcomes.append(('applied', row_id))
+
+            # Settle donations and close inbox rows in one transaction
+            # One UPDATE per donation, so only those this batch completed are rolled up
+            open_statuses = _placeholders(OPEN_DONATION_STATUSES)
+            completable_statuses = _placeholders(COMPLETABLE_DONATION_STATUSES)
+            newly_completed = []
+            for row in completed:
+                cursor = conn.execute(f'''
+                    UPDATE donations
+                    SET status = 'completed', completed_at = ?, transaction_id = ?, status_detail = NULL
+                    WHERE checkout_request_id = ? AND status IN ({completable_statuses})
+                ''', (*row, *COMPLETABLE_DONATION_STATUSES))
+                if cursor.rowcount == 1:
+                    donation = donations[row[2]]
+                    newly_completed.append((donation[2], donation[3], now))
+            record_completed(conn, newly_completed)
+            if failed:
+                conn.executemany(f'''
+                    UPDATE donations SET status = 'failed', status_detail = ?
+                    WHERE checkout_request_id = ? AND status IN ({open_statuses})
+                ''', [(*row, *OPEN_DONATION_STATUSES) for row in failed])
+            if outcomes:
+                conn.executemany('''
+                    UPDATE mpesa_callback_inbox
+                    SET status = ?, processed_at = CURRENT_TIMESTAMP, locked_by = NULL, locked_at = NULL
+                    WHERE id = ?
+                ''', outcomes)
+            if retry:
+                conn.executemany('''
+                    UPDATE mpesa_callback_inbox
+                    SET status = 'new', attempts = ?, next_attempt_at = ?, locked_by = NULL, locked_at = NULL
+                    WHERE id = ?
+                ''', retry)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release(conn)
+
+        with self._lock:
+            for outcome, _ in outcomes:
+                self._counts[outcome] += 1
+            self._counts['retried'] += len(retry)
+            self._counts['late_completed'] += len(late)
+        for outcome, row_id in outcomes:
+            if outcome in ('unmatched', 'invalid'):
+                logger.warning(f"M-Pesa callback {row_id} left {outcome}")
+        for donation_id in late:
+            logger.warning(f"Donation {donation_id} completed by a late M-Pesa callback")
+
+        if self.initiator is not None:
+            for checkout_request_id, (status, detail) in settled.items():
+                self.initiator.publish(donations[checkout_request_id][0], status, detail=detail,
+                                       checkout_request_id=checkout_request_id)
+
+    def _release_expired(self):
+        """Return rows claimed by a processor that never finished them"""
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                UPDATE mpesa_callback_inbox SET status = 'new', locked_by = NULL, locked_at = NULL
+                WHERE status = 'processing' AND locked_at < ?
+            ''', (int(time.time()) - self.lease_seconds,))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+    def stats(self):
+        """Inbox depth plus this process's processing counters"""
+        conn = self.pool.acquire()
+        try:
+            depth = inbox_depth(conn)
+        finally:
+            self.pool.release(conn)
+        with self._lock:
+            depth.update({f'{name}_by_this_process': count for name, count in self._counts.items()})
+            depth['worker_running'] = self._thread is not None and self._pid == os.getpid()
+            depth['last_error'] = self._last_error
+        return depth
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo M-Pesa callback inbox')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('run', help='Apply recorded callbacks until interrupted')
+    subparsers.add_parser('status', help='Show inbox rows by status')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import callback_processor
+
+    if args.command == 'run':
+        logger.info(f"Callback processor {callback_processor.worker_id} started")
+        try:
+            callback_processor.run()
+        except KeyboardInterrupt:
+            callback_processor.stop()
+    elif args.command == 'status':
+        for key, value in callback_processor.stats().items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Response Compression
+gzip / brotli content negotiation for the Flask app
+
+CompressionMiddleware wraps the WSGI app and compresses text-like responses
+the client accepts, picking brotli over gzip when both are allowed. Small
+bodies and bodies that already carry a Content-Encoding (or are compressed
+formats such as the .gz exports) pass through untouched. Streamed responses
+are compressed chunk by chunk with a sync flush, so exports keep streaming.
+
+Responses served from the response cache arrive already encoded: the cache
+compresses each entry once per encoding and keeps the variants alongside
+the identity body.
+
+Compressed representations get the encoding appended to a strong ETag
+("abc" -> "abc-br"), as the bytes differ from the identity body.
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """Best supported encoding allowed by an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body, encoding, level=6, brotli_quality=5):
+    """Compress a whole body in one go"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def encoded_etag(etag, encoding):
+    """ETag of the ``encoding`` representation of a body tagged ``etag``"""
+    return f'{etag}-{encoding}'
+
+
+class _StreamCompressor:
+    """Incremental compressor flushing after every chunk"""
+
+    def __init__(self, encoding, level, brotli_quality):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+            self._compress = self._compressor.process
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+            self._compress = self._compressor.compress
+
+    def chunk(self, data):
+        return self._compress(data) + self._flush()
+
+    def finish(self):
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """WSGI middleware negotiating gzip / brotli for compressible responses"""
+
+    def __init__(self, app, min_size=DEFAULT_MIN_SIZE, level=6, brotli_quality=5):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            # Body writes through the legacy write() callable are not supported
+            return lambda data: None
+
+        body = self.app(environ, capture)
+        status, headers = captured['status'], captured['headers']
+
+        if not self._should_compress(status, headers):
+            start_response(status, headers, captured['exc_info'])
+            return body
+
+        length = _header(headers, 'Content-Length')
+        if length is not None:
+            return self._compress_buffered(body, encoding, status, headers, start_response)
+        return self._compress_streamed(body, encoding, status, headers, start_response)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        if _header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        mimetype = (_header(headers, 'Content-Type') or '').split(';')[0].strip()
+        if not is_compressible(mimetype):
+            return False
+        length = _header(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _encoded_headers(self, headers, encoding, length=None):
+        result = []
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'vary':
+                continue
+            if lower == 'etag' and not value.startswith('W/'):
+                tag = encoded_etag(value.strip('"'), encoding)
+                value = f'"{tag}"'
+            result.append((name, value))
+        result.append(('Vary', _vary_with_encoding(_header(headers, 'Vary'))))
+        result.append(('Content-Encoding', encoding))
+        if length is not None:
+            result.append(('Content-Length', str(length)))
+        return result
+
+    def _compress_buffered(self, body, encoding, status, headers, start_response):
+        try:
+            data = b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        compressed = compress(data, encoding, self.level, self.brotli_quality)
+        start_response(status, self._encoded_headers(headers, encoding, len(compressed)))
+        return [compressed]
+
+    def _compress_streamed(self, body, encoding, status, headers, start_response):
+        start_response(status, self._encoded_headers(headers, encoding))
+        compressor = _StreamCompressor(encoding, self.level, self.brotli_quality)
+
+        def generate():
+            try:
+                for data in body:
+                    if data:
+                        chunk = compressor.chunk(data)
+                        if chunk:
+                            yield chunk
+                yield compressor.finish()
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+
+        return generate()
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _vary_with_encoding(vary):
+    """Vary header value that includes Accept-Encoding exactly once"""
+    if not vary:
+        return 'Accept-Encoding'
+    fields = [field.strip().lower() for field in vary.split(',')]
+    if 'accept-encoding' in fields or '*' in fields:
+        return vary
+    return f'{vary}, Accept-Encoding'
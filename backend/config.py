@@ -16,10 +16,26 @@ class Config:
     # Database Configuration
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///karachuonyo.db'
     
+    # SQLite connection pool tuning (connections are opened once per worker in WAL mode)
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE') or 8)
+    SQLITE_POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT') or 10)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 16384)  # 16MB page cache
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 134217728)  # 128MB
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE') or 'MEMORY'
+    
+    # PostgreSQL connection pool (used when DATABASE_URL is postgres:// or postgresql://)
+    POSTGRES_POOL_MIN = int(os.environ.get('POSTGRES_POOL_MIN') or 1)
+    POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE') or 10)
+    POSTGRES_POOL_TIMEOUT = float(os.environ.get('POSTGRES_POOL_TIMEOUT') or 10)
+    POSTGRES_CONNECT_TIMEOUT = int(os.environ.get('POSTGRES_CONNECT_TIMEOUT') or 5)
+    POSTGRES_STATEMENT_TIMEOUT_MS = int(os.environ.get('POSTGRES_STATEMENT_TIMEOUT_MS') or 30000)
+    
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
-    MAIL_USE_TLS = True
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USE_SSL = False
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
@@ -39,6 +55,67 @@ class Config:
     # Session Configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
+    # Article engagement counters: buffered deltas are flushed every interval
+    # (seconds) or as soon as this many are pending
+    ENGAGEMENT_FLUSH_INTERVAL = float(os.environ.get('ENGAGEMENT_FLUSH_INTERVAL') or 1.0)
+    ENGAGEMENT_FLUSH_THRESHOLD = int(os.environ.get('ENGAGEMENT_FLUSH_THRESHOLD') or 500)
+    
+    # Shared memory segment (sharedmem.py) created by the gunicorn master and
+    # inherited by every worker: counter slots, cache slots, bytes per
+    # cache value, and seconds to wait for one of its locks before degrading
+    # to a cache miss or a per-worker count
+    SHARED_COUNTER_SLOTS = int(os.environ.get('SHARED_COUNTER_SLOTS') or 4096)
+    SHARED_CACHE_SLOTS = int(os.environ.get('SHARED_CACHE_SLOTS') or 256)
+    SHARED_CACHE_VALUE_SIZE = int(os.environ.get('SHARED_CACHE_VALUE_SIZE') or 65536)
+    SHARED_LOCK_TIMEOUT = float(os.environ.get('SHARED_LOCK_TIMEOUT') or 0.5)
+    
+    # Public GET response cache: 'memory' (per worker LRU) or 'shared' (the
+    # shared memory segment, entries up to SHARED_CACHE_VALUE_SIZE bytes)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND') or 'memory'
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL') or 60)
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') or 512)
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES') or 32 * 1024 * 1024)
+    
+    # Browser/CDN caching of public endpoints (by Flask endpoint name). Listed
+    # routes also get strong ETags and answer conditional GETs with 304.
+    HTTP_CACHE_POLICIES = {
+        'get_public_events': 'public, max-age=30, stale-while-revalidate=120',
+        'get_news_articles': 'public, max-age=60, stale-while-revalidate=300',
+        'get_news_categories': 'public, max-age=300, stale-while-revalidate=3600',
+        'get_news_article': 'public, max-age=120, stale-while-revalidate=600',
+        'search_news_articles': 'public, max-age=60, stale-while-revalidate=300',
+        'donation_summary': 'public, max-age=15, stale-while-revalidate=60',
+    }
+    
+    # Response compression (gzip, plus brotli when the Brotli package is
+    # installed); bodies smaller than COMPRESSION_MIN_SIZE bytes are sent as is
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE') or 1024)
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL') or 6)
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY') or 5)
+    
+    # Email outbox: OUTBOX_WORKER=thread delivers from every web process;
+    # set it to none when running `python outbox.py run` separately
+    OUTBOX_WORKER = os.environ.get('OUTBOX_WORKER') or 'thread'
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 50)
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL') or 2.0)
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 6)
+    OUTBOX_RETRY_BASE = int(os.environ.get('OUTBOX_RETRY_BASE') or 30)  # seconds, doubled per attempt
+    OUTBOX_RETRY_MAX = int(os.environ.get('OUTBOX_RETRY_MAX') or 3600)
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS') or 300)
+    
+    # Newsletter broadcasts: subscribers per batch, parallel SMTP connections,
+    # messages per second across all connections (0 = unlimited)
+    BROADCAST_BATCH_SIZE = int(os.environ.get('BROADCAST_BATCH_SIZE') or 500)
+    BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY') or 4)
+    BROADCAST_RATE_LIMIT = float(os.environ.get('BROADCAST_RATE_LIMIT') or 0)
+    BROADCAST_MAX_ATTEMPTS = int(os.environ.get('BROADCAST_MAX_ATTEMPTS') or 3)
+    BROADCAST_LEASE_SECONDS = int(os.environ.get('BROADCAST_LEASE_SECONDS') or 120)
+    
+    # Streaming exports (/api/admin/export/<table>): rows fetched per chunk
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 500)
+    
     # File Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
@@ -60,6 +137,67 @@ class Config:
     MPESA_SHORTCODE = os.environ.get('MPESA_SHORTCODE') or '174379'
     MPESA_PASSKEY = os.environ.get('MPESA_PASSKEY') or 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919'
     MPESA_CALLBACK_URL = os.environ.get('MPESA_CALLBACK_URL') or 'https://karachuonyo-backend.onrender.com/api/mpesa/callback'
+    # Daraja endpoint; http://127.0.0.1:8089 with `python daraja_emulator.py`
+    MPESA_BASE_URL = os.environ.get('MPESA_BASE_URL') or 'https://sandbox.safaricom.co.ke'
+    
+    # STK pushes are sent in the background (donations.py): threads per web
+    # process, pushes allowed to queue behind them, and seconds an in-flight
+    # donation status is served from the shared cache before re-reading it
+    MPESA_PUSH_WORKERS = int(os.environ.get('MPESA_PUSH_WORKERS') or 8)
+    MPESA_PUSH_MAX_PENDING = int(os.environ.get('MPESA_PUSH_MAX_PENDING') or 500)
+    DONATION_STATUS_TTL = int(os.environ.get('DONATION_STATUS_TTL') or 10)
+    
+    # M-Pesa callbacks are recorded in an inbox and applied in batches
+    # (callback_inbox.py); MPESA_CALLBACK_WORKER=none when running
+    # `python callback_inbox.py run` separately
+    MPESA_CALLBACK_WORKER = os.environ.get('MPESA_CALLBACK_WORKER') or 'thread'
+    MPESA_CALLBACK_BATCH_SIZE = int(os.environ.get('MPESA_CALLBACK_BATCH_SIZE') or 200)
+    MPESA_CALLBACK_POLL_INTERVAL = float(os.environ.get('MPESA_CALLBACK_POLL_INTERVAL') or 1.0)
+    MPESA_CALLBACK_MAX_ATTEMPTS = int(os.environ.get('MPESA_CALLBACK_MAX_ATTEMPTS') or 6)
+    MPESA_CALLBACK_RETRY_BASE = int(os.environ.get('MPESA_CALLBACK_RETRY_BASE') or 5)  # seconds, doubled per attempt
+    
+    # Donations with no callback after MPESA_RECONCILE_AFTER seconds are
+    # checked with the STK Push Query API (reconcile.py); MPESA_SWEEPER=none
+    # when running `python reconcile.py run` separately
+    MPESA_SWEEPER = os.environ.get('MPESA_SWEEPER') or 'thread'
+    MPESA_RECONCILE_AFTER = int(os.environ.get('MPESA_RECONCILE_AFTER') or 180)
+    MPESA_SWEEP_INTERVAL = float(os.environ.get('MPESA_SWEEP_INTERVAL') or 60)
+    MPESA_SWEEP_BATCH_SIZE = int(os.environ.get('MPESA_SWEEP_BATCH_SIZE') or 50)
+    MPESA_SWEEP_CONCURRENCY = int(os.environ.get('MPESA_SWEEP_CONCURRENCY') or 4)
+    MPESA_SWEEP_RATE_LIMIT = float(os.environ.get('MPESA_SWEEP_RATE_LIMIT') or 5)  # queries per second
+    MPESA_SWEEP_MAX_CHECKS = int(os.environ.get('MPESA_SWEEP_MAX_CHECKS') or 10)
+    
+    # Target shown with the public total by /api/donations/summary (0 = none)
+    FUNDRAISING_GOAL = float(os.environ.get('FUNDRAISING_GOAL') or 0)
+    
+    # Live updates over server-sent events (/api/live, live.py): seconds
+    # between polls of the subscribed topics, heartbeat seconds, messages
+    # queued per stream before a slow client is dropped, topics per stream,
+    # and seconds before a stream ends and the browser reconnects. Every
+    # stream holds one of a worker's GUNICORN_THREADS (gunicorn.conf.py reads
+    # it from here), so by default streams may take three quarters of them and
+    # the rest stay free for ordinary requests; LIVE_PUBLISHER=none stops polling
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS') or 64)
+    LIVE_PUBLISHER = os.environ.get('LIVE_PUBLISHER') or 'thread'
+    LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL') or 2.0)
+    LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT') or 15)
+    LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE') or 32)
+    LIVE_MAX_SUBSCRIBERS = int(
+        os.environ.get('LIVE_MAX_SUBSCRIBERS') or GUNICORN_THREADS - GUNICORN_THREADS // 4
+    )
+    LIVE_MAX_TOPICS = int(os.environ.get('LIVE_MAX_TOPICS') or 8)
+    LIVE_STREAM_SECONDS = int(os.environ.get('LIVE_STREAM_SECONDS') or 600)
+    
+    # Outbound call guards (outbound.py): timeouts in seconds, retries per call,
+    # and consecutive failures before a dependency's circuit opens
+    MPESA_CONNECT_TIMEOUT = float(os.environ.get('MPESA_CONNECT_TIMEOUT') or 3.05)
+    MPESA_READ_TIMEOUT = float(os.environ.get('MPESA_READ_TIMEOUT') or 15)
+    MPESA_RETRIES = int(os.environ.get('MPESA_RETRIES') or 2)
+    SMTP_CONNECT_TIMEOUT = float(os.environ.get('SMTP_CONNECT_TIMEOUT') or 5)
+    SMTP_READ_TIMEOUT = float(os.environ.get('SMTP_READ_TIMEOUT') or 15)
+    SMTP_RETRIES = int(os.environ.get('SMTP_RETRIES') or 1)
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD') or 5)
+    CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT') or 30)
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -93,14 +231,20 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     
-    # Use in-memory database for testing
-    DATABASE_URL = 'sqlite:///:memory:'
+    # Use in-memory database for testing unless a throwaway database is supplied
+    DATABASE_URL = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
     
     # Disable CSRF for testing
     WTF_CSRF_ENABLED = False
     
     # Disable rate limiting for testing
     RATELIMIT_ENABLED = False
+    
+    # Tests drive outbox delivery, callback processing, sweeps and live polls explicitly
+    OUTBOX_WORKER = 'none'
+    MPESA_CALLBACK_WORKER = 'none'
+    MPESA_SWEEPER = 'none'
+    LIVE_PUBLISHER = 'none'
 
 # Configuration dictionary
 config = {
@@ -113,4 +257,9 @@ config = {
 def get_config():
     """Get configuration based on environment"""
     env = os.environ.get('FLASK_ENV', 'development')
-    return config.get(env, config['default'])
\ No newline at end of file
+    return config.get(env, config['default'])
+
+def get_settings():
+    """Active configuration as a plain dict (for scripts running outside Flask)"""
+    config_class = get_config()
+    return {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Daraja Emulator
+Local stand-in for the Safaricom Daraja API, for tests and load runs
+
+Implements the endpoints mpesa.py uses: OAuth token generation, STK push,
+STK push query, and delivery of the result callback to the push's
+CallBackURL. Latency, injected 503s, token lifetime, the delay before a
+donor "answers" the prompt, and the share of prompts that are cancelled
+or whose callback is lost are all configurable, so the donation flow can
+be measured offline under realistic failure conditions.
+
+    python daraja_emulator.py [--port 8089] [--latency 0.3] [--error-rate 0.02]
+        [--callback-url http://127.0.0.1:5000/api/mpesa/callback]
+
+then point the backend at it with MPESA_BASE_URL=http://127.0.0.1:8089.
+In tests, DarajaEmulator(deliver=...) hands callbacks to a function (e.g.
+a Flask test client) instead of POSTing them.
+"""
+
+import argparse
+import base64
+import heapq
+import itertools
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+PHONE_PATTERN = re.compile(r'^254[17]\d{8}$')
+
+CANCELLED = (1032, 'Request cancelled by user')
+PAID = (0, 'The service request is processed successfully.')
+
+
+class _DarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except ValueError:
+            return None
+
+    def _handle(self, route):
+        emulator = self.server.emulator
+        emulator._delay()
+        if emulator.error_rate and random.random() < emulator.error_rate:
+            emulator._count('errors_injected')
+            self.reply(503, {'errorCode': '503.001.01', 'errorMessage': 'Service Unavailable'})
+            return
+        status, payload = route(self)
+        self.reply(status, payload)
+
+    def do_GET(self):
+        emulator = self.server.emulator
+        if self.path.startswith('/oauth/v1/generate'):
+            self._handle(emulator._token)
+        else:
+            self.reply(404, {'errorMessage': 'Not Found'})
+
+    def do_POST(self):
+        # Read the whole body first so a kept-alive connection stays in sync
+        self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        emulator = self.server.emulator
+        routes = {
+            '/mpesa/stkpush/v1/processrequest': emulator._push,
+            '/mpesa/stkpushquery/v1/query': emulator._query
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self.reply(404, {'errorMessage': 'Not Found'})
+            return
+        self._handle(route)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class DarajaEmulator:
+    """Threaded HTTP server answering like Daraja, with injectable failures"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 token_ttl=3599, callback_delay=1.0, cancel_rate=0.0, lost_callback_rate=0.0,
+                 callback_url=None, deliver=None, delivery_workers=8):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.callback_delay = callback_delay
+        self.cancel_rate = cancel_rate
+        self.lost_callback_rate = lost_callback_rate
+        self.callback_url = callback_url
+        self.deliver = deliver or _post_callback
+        self.transactions = {}
+        self._tokens = {}
+        self._ids = itertools.count(1)
+        # Keeps checkout ids unique across emulator runs against one database
+        self._instance = random.randint(1000, 9999)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys((
+            'tokens', 'pushes', 'queries', 'rejected_tokens', 'invalid_requests', 'errors_injected',
+            'callbacks_delivered', 'callbacks_lost', 'callback_errors'
+        ), 0)
+        self._due = []
+        self._due_changed = threading.Condition(self._lock)
+        self._deliveries = ThreadPoolExecutor(max_workers=delivery_workers, thread_name_prefix='daraja-callback')
+        self._server = _Server((host, port), _DarajaHandler)
+        self._server.emulator = self
+        self._threads = []
+        self._stopped = False
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self):
+        """Value for MPESA_BASE_URL / MPesaAPI.base_url"""
+        return f'http://{self.address[0]}:{self.port}'
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def _delay(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    # Endpoints
+
+    def _token(self, handler):
+        authorization = handler.headers.get('Authorization', '')
+        if not authorization.startswith('Basic ') or ':' not in _decode_basic(authorization):
+            self._count('invalid_requests')
+            return 400, {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'}
+        token = secrets.token_urlsafe(21)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = {t: expiry for t, expiry in self._tokens.items() if expiry > now}
+            self._tokens[token] = now + self.token_ttl
+            self._counts['tokens'] += 1
+        return 200, {'access_token': token, 'expires_in': str(self.token_ttl)}
+
+    def _authorized(self, handler):
+        token = handler.headers.get('Authorization', '')[len('Bearer '):]
+        with self._lock:
+            valid = self._tokens.get(token, 0) > time.monotonic()
+            if not valid:
+                self._counts['rejected_tokens'] += 1
+        return valid
+
+    def _push(self, handler):
+        if not self._authorized(handler):
+            return 401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'}
+        payload = handler._read_json()
+        phone = str((payload or {}).get('PhoneNumber', ''))
+        if payload is None or not PHONE_PATTERN.match(phone):
+            self._count('invalid_requests')
+            return 400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid PhoneNumber'}
+
+        number = next(self._ids)
+        checkout_request_id = f"ws_CO_{datetime.now().strftime('%d%m%Y%H%M%S')}{self._instance}{number:06d}"
+        merchant_request_id = f'{random.randint(10000, 99999)}-{number}-1'
+        result = CANCELLED if random.random() < self.cancel_rate else PAID
+        transaction = {
+            'merchant_request_id': merchant_request_id,
+            'checkout_request_id': checkout_request_id,
+            'amount': payload.get('Amount'),
+            'phone': phone,
+            'callback_url': self.callback_url or payload.get('CallBackURL'),
+            'result': result,
+            'receipt': f'EMU{number:07d}' if result is PAID else None,
+            'answered_at': time.monotonic() + self.callback_delay,
+            'lose_callback': random.random() < self.lost_callback_rate
+        }
+        with self._lock:
+            self.transactions[checkout_request_id] = transaction
+            self._counts['pushes'] += 1
+            heapq.heappush(self._due, (transaction['answered_at'], checkout_request_id))
+            self._due_changed.notify()
+        return 200, {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        }
+
+    def _query(self, handler):
+        if not self._authorized(handler):
+            return 401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'}
+        payload = handler._read_json() or {}
+        self._count('queries')
+        with self._lock:
+            transaction = self.transactions.get(payload.get('CheckoutRequestID'))
+        if transaction is None:
+            self._count('invalid_requests')
+            return 400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'}
+        if time.monotonic() < transaction['answered_at']:
+            return 500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+        result_code, result_desc = transaction['result']
+        return 200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': transaction['merchant_request_id'],
+            'CheckoutRequestID': transaction['checkout_request_id'],
+            'ResultCode': str(result_code),
+            'ResultDesc': result_desc
+        }
+
+    # Callbacks
+
+    def callback_body(self, transaction):
+        """The stkCallback document Daraja POSTs once the donor has answered"""
+        result_code, result_desc = transaction['result']
+        callback = {
+            'MerchantRequestID': transaction['merchant_request_id'],
+            'CheckoutRequestID': transaction['checkout_request_id'],
+            'ResultCode': result_code,
+            'ResultDesc': result_desc
+        }
+        if result_code == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': transaction['amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': transaction['receipt']},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(transaction['phone'])}
+            ]}
+        return {'Body': {'stkCallback': callback}}
+
+    def _schedule_callbacks(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._due or self._due[0][0] > time.monotonic()):
+                    timeout = self._due[0][0] - time.monotonic() if self._due else None
+                    self._due_changed.wait(timeout)
+                if self._stopped:
+                    return
+                _, checkout_request_id = heapq.heappop(self._due)
+                transaction = self.transactions[checkout_request_id]
+            if transaction['lose_callback'] or not transaction['callback_url']:
+                self._count('callbacks_lost')
+                continue
+            self._deliveries.submit(self._deliver, transaction)
+
+    def _deliver(self, transaction):
+        try:
+            self.deliver(transaction['callback_url'], self.callback_body(transaction))
+            self._count('callbacks_delivered')
+        except Exception:
+            self._count('callback_errors')
+
+    # Lifecycle
+
+    def revoke_tokens(self):
+        """Invalidate every issued token, as Daraja does on its own schedule"""
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['callbacks_pending'] = len(self._due)
+        return stats
+
+    def start(self):
+        for target, name in ((self._server.serve_forever, 'daraja-emulator'),
+                             (self._schedule_callbacks, 'daraja-callbacks')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._due_changed.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._deliveries.shutdown(wait=False)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _decode_basic(authorization):
+    try:
+        return base64.b64decode(authorization[len('Basic '):]).decode()
+    except ValueError:
+        return ''
+
+
+def _post_callback(url, body):
+    response = requests.post(url, json=body, timeout=10)
+    response.raise_for_status()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local Daraja (M-Pesa) emulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered 503')
+    parser.add_argument('--token-ttl', type=int, default=3599)
+    parser.add_argument('--callback-delay', type=float, default=1.0, help='seconds before the donor answers')
+    parser.add_argument('--cancel-rate', type=float, default=0.0)
+    parser.add_argument('--lost-callback-rate', type=float, default=0.0)
+    parser.add_argument('--callback-url', help='deliver callbacks here instead of the CallBackURL sent')
+    args = parser.parse_args(argv)
+
+    emulator = DarajaEmulator(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        token_ttl=args.token_ttl, callback_delay=args.callback_delay, cancel_rate=args.cancel_rate,
+        lost_callback_rate=args.lost_callback_rate, callback_url=args.callback_url
+    ).start()
+    print(f"Daraja emulator listening on {emulator.base_url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(emulator.stats())
+    except KeyboardInterrupt:
+        emulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Donations
+Background STK push initiation and a cheap donation status lookup
+
+The donation endpoint stores a 'pending_init' row and returns its id at
+once; DonationInitiator then sends the STK push from a small thread pool,
+so a burst of donors never holds web workers on Daraja round trips. A
+push first claims its row by moving it to 'pushing', and is skipped if
+the row was given up on while it sat in the queue. The push result moves
+the row to 'pending' (prompt on the donor's phone, waiting for the
+callback) or 'failed', and the M-Pesa callback later settles it as
+'completed' or 'failed'. Only a definite rejection fails the row: when
+the request may have reached Daraja but its answer was lost (a read
+timeout, a garbled body) the donor may already have the prompt, so the
+row stays 'pushing' for reconcile.py.
+
+Every status change is published to the shared memory cache, which all
+gunicorn workers read, so /api/donations/<id>/status polls are answered
+without a query until the entry expires; a miss falls back to the
+donations table. Donations whose callback never arrives, or whose push
+never happened, are settled by reconcile.py.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from outbound import CircuitOpenError, is_connect_error
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('completed', 'failed')
+
+# Settled donations do not change, so their status is cached much longer
+FINAL_STATUS_TTL = 3600
+
+
+class DonationBusyError(Exception):
+    """Raised when too many STK pushes are already waiting to be sent"""
+
+
+def _status_key(donation_id):
+    return f'donation-status:{donation_id}'
+
+
+class DonationInitiator:
+    """Sends STK pushes in the background and tracks donation status"""
+
+    def __init__(self, pool, api, segment=None, workers=8, max_pending=500, status_ttl=10,
+                 check_after=180):
+        self.pool = pool
+        self.api = api
+        self.segment = segment
+        self.workers = workers
+        self.max_pending = max_pending
+        self.status_ttl = status_ttl
+        self.check_after = check_after
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._queued = 0
+        self._counts = dict.fromkeys(
+            ('submitted', 'pushed', 'failed', 'rejected', 'skipped', 'unconfirmed'), 0
+        )
+        self._last_error = None
+
+    @classmethod
+    def from_config(cls, app, pool, api, segment=None):
+        config = app.config
+        return cls(
+            pool, api, segment,
+            workers=config.get('MPESA_PUSH_WORKERS', 8),
+            max_pending=config.get('MPESA_PUSH_MAX_PENDING', 500),
+            status_ttl=config.get('DONATION_STATUS_TTL', 10),
+            check_after=config.get('MPESA_RECONCILE_AFTER', 180)
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    # STK pushes
+
+    def _get_executor(self):
+        # Created per process on first use, so each gunicorn worker owns its threads
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queued = 0
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='stk-push'
+                )
+            return self._executor
+
+    def push_seconds(self):
+        """Longest one STK push can take under the M-Pesa guard"""
+        guard = self.api.guard
+        # Pushes are not idempotent: one read, plus a retried connect per attempt
+        return guard.read_timeout + (guard.connect_timeout + guard.backoff_max) * (guard.retries + 1)
+
+    def queue_deadline(self):
+        """Seconds a queued push may wait, with every slot ahead of it at its slowest"""
+        rounds = -(-self.max_pending // self.workers)
+        return max(int(rounds * self.push_seconds()), self.check_after)
+
+    def has_capacity(self):
+        """Whether another push can be queued in this process"""
+        with self._lock:
+            return self._pid != os.getpid() or self._queued < self.max_pending
+
+    def submit(self, donation_id, phone, amount, account_ref, description):
+        """Queue the STK push for a committed 'pending_init' donation"""
+        executor = self._get_executor()
+        with self._lock:
+            if self._queued >= self.max_pending:
+                self._counts['rejected'] += 1
+                raise DonationBusyError(f'{self._queued} STK pushes already queued')
+            self._queued += 1
+            self._counts['submitted'] += 1
+        self.publish(donation_id, 'pending_init')
+        return executor.submit(self._push, donation_id, phone, amount, account_ref, description)
+
+    def _push(self, donation_id, phone, amount, account_ref, description):
+        try:
+            if not self._claim(donation_id):
+                # Given up on while queued: prompting the donor now would be unrecordable
+                self._count('skipped')
+                logger.warning(f"STK push for donation {donation_id} skipped: no longer awaiting a push")
+                conn = self.pool.acquire()
+                try:
+                    self._publish_stored(conn, donation_id)  # replaces the 'pending_init' entry
+                finally:
+                    self.pool.release(conn)
+                return
+            try:
+                result = self.api.stk_push(
+                    phone=phone, amount=amount, account_ref=account_ref, description=description
+                )
+            except CircuitOpenError as e:
+                result = {'errorMessage': 'M-Pesa is temporarily unavailable, please try again shortly'}
+                logger.warning(f"STK push for donation {donation_id} not sent: {e}")
+            except Exception as e:
+                if not is_connect_error(e):
+                    # Daraja may have prompted the donor before the answer was lost
+                    self._count('unconfirmed')
+                    logger.error(f"STK push for donation {donation_id} unconfirmed, left to reconcile: {e}")
+                    with self._lock:
+                        self._last_error = str(e)[:200]
+                    return
+                result = {'errorMessage': 'Could not reach M-Pesa, please try again'}
+                logger.error(f"STK push for donation {donation_id} failed: {e}")
+
+            if result.get('ResponseCode') == '0':
+                self._pushed(donation_id, result)
+            else:
+                detail = result.get('errorMessage') or result.get('ResponseDescription') or 'Unknown error'
+                self._failed(donation_id, detail)
+        except Exception as e:
+            logger.error(f"Recording STK push for donation {donation_id} failed: {e}")
+            with self._lock:
+                self._last_error = str(e)[:200]
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+    def _claim(self, donation_id):
+        """Move a queued donation to 'pushing'; False if it is no longer 'pending_init'"""
+        return self._update('''
+            UPDATE donations SET status = 'pushing', next_check_at = ?
+            WHERE id = ? AND status = 'pending_init'
+        ''', (int(time.time()) + max(int(self.push_seconds()), self.check_after), donation_id)) == 1
+
+    def _pushed(self, donation_id, result):
+        checkout_request_id = result.get('CheckoutRequestID')
+        updated = self._update('''
+            UPDATE donations
+            SET status = 'pending', transaction_id = ?, checkout_request_id = ?, merchant_request_id = ?,
+                next_check_at = ?
+            WHERE id = ? AND status = 'pushing'
+        ''', (checkout_request_id, checkout_request_id, result.get('MerchantRequestID'),
+              int(time.time()) + self.check_after, donation_id))
+        if updated != 1:
+            # Settled meanwhile (the sweeper gave up on it), but the donor has the
+            # prompt: keep the ids so their callback can still complete it
+            self._update('''
+                UPDATE donations SET checkout_request_id = ?, merchant_request_id = ?
+                WHERE id = ? AND checkout_request_id IS NULL
+            ''', (checkout_request_id, result.get('MerchantRequestID'), donation_id))
+            logger.error(f"Donation {donation_id} was settled during its STK push {checkout_request_id}")
+            return
+        self._count('pushed')
+        self.publish(donation_id, 'pending', checkout_request_id=checkout_request_id)
+
+    def _failed(self, donation_id, detail):
+        updated = self._update('''
+            UPDATE donations SET status = 'failed', status_detail = ?
+            WHERE id = ? AND status = 'pushing'
+        ''', (detail, donation_id))
+        self._count('failed')
+        with self._lock:
+            self._last_error = detail[:200]
+        if updated == 1:
+            self.publish(donation_id, 'failed', detail=detail)
+
+    def _update(self, sql, params):
+        """Run one UPDATE and commit it; returns the number of rows changed"""
+        conn = self.pool.acquire()
+        try:
+            rowcount = conn.execute(sql, params).rowcount
+            conn.commit()
+            return rowcount
+        finally:
+            self.pool.release(conn)
+
+    # Status map
+
+    def publish(self, donation_id, status, detail=None, checkout_request_id=None):
+        """Record a status change where every worker's status polls will see it"""
+        entry = {
+            'donation_id': donation_id,
+            'status': status,
+            'detail': detail,
+            'checkout_request_id': checkout_request_id,
+            'updated_at': datetime.now().isoformat()
+        }
+        if self.segment is not None:
+            ttl = FINAL_STATUS_TTL if status in FINAL_STATUSES else self.status_ttl
+            self.segment.cache_set(_status_key(donation_id), json.dumps(entry).encode(), ttl=ttl)
+        return entry
+
+    def publish_by_checkout(self, conn, checkout_request_id):
+        """Publish the stored status of the donation behind a callback"""
+        row = conn.execute('''
+            SELECT id, status, status_detail, checkout_request_id
+            FROM donations WHERE checkout_request_id = ?
+        ''', (checkout_request_id,)).fetchone()
+        if row is not None:
+            self.publish(row[0], row[1], detail=row[2], checkout_request_id=row[3])
+
+    def status(self, conn, donation_id):
+        """Current status of a donation, or None if there is no such donation"""
+        if self.segment is not None:
+            cached = self.segment.cache_get(_status_key(donation_id))
+            if cached is not None:
+                return json.loads(cached)
+
+        return self._publish_stored(conn, donation_id)
+
+    def _publish_stored(self, conn, donation_id):
+        row = conn.execute('''
+            SELECT id, status, status_detail, checkout_request_id
+            FROM donations WHERE id = ?
+        ''', (donation_id,)).fetchone()
+        if row is None:
+            return None
+        return self.publish(row[0], row[1], detail=row[2], checkout_request_id=row[3])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['queued'] = self._queued if self._pid == os.getpid() else 0
+            stats['last_error'] = self._last_error
+        stats['workers'] = self.workers
+        return stats
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Email Templates
+Notification templates compiled once and rendered to HTML and plain text
+
+Each template has a subject, an HTML body and a plain-text body. The
+registry compiles all of them into Jinja template objects when it is
+created, so sending a notification costs a dictionary lookup plus a render
+instead of parsing and compiling the template source every time.
+
+HTML bodies are autoescaped like Flask's render_template_string; subjects
+and plain-text bodies are not.
+
+    python email_templates.py bench [--iterations 2000]
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from jinja2 import Environment, StrictUndefined, Undefined
+
+TEMPLATES = {
+    'contact_admin': {
+        'subject': 'New Contact Form Submission: {{ subject }}',
+        'html': '''
+                <h2>New Contact Form Submission</h2>
+                <p><strong>Submission ID:</strong> {{ submission_id }}</p>
+                <p><strong>Name:</strong> {{ name }}</p>
+                <p><strong>Email:</strong> {{ email }}</p>
+                <p><strong>Phone:</strong> {{ phone or 'Not provided' }}</p>
+                <p><strong>Subject:</strong> {{ subject }}</p>
+                <p><strong>Message:</strong></p>
+                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
+                    {{ message | replace('\n', '<br>') | safe }}
+                </div>
+                <p><strong>Submitted:</strong> {{ timestamp }}</p>
+                <p><strong>IP Address:</strong> {{ ip_address }}</p>
+                ''',
+        'text': '''New Contact Form Submission
+
+Submission ID: {{ submission_id }}
+Name: {{ name }}
+Email: {{ email }}
+Phone: {{ phone or 'Not provided' }}
+Subject: {{ subject }}
+
+Message:
+{{ message }}
+
+Submitted: {{ timestamp }}
+IP Address: {{ ip_address }}
+'''
+    },
+    'contact_reply': {
+        'subject': 'Thank you for contacting Karachuonyo First',
+        'html': '''
+                <h2>Thank you for your message!</h2>
+                <p>Dear {{ name }},</p>
+                <p>Thank you for reaching out to the Karachuonyo First campaign. We have received your message and will respond within 24-48 hours.</p>
+
+                <h3>Your Message Details:</h3>
+                <p><strong>Subject:</strong> {{ subject }}</p>
+                <p><strong>Message:</strong></p>
+                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
+                    {{ message | replace('\n', '<br>') | safe }}
+                </div>
+
+                <p>Best regards,<br>
+                <strong>Karachuonyo First Campaign Team</strong></p>
+
+                <hr>
+                <p style="font-size: 12px; color: #666;">
+                This is an automated response. Please do not reply to this email.
+                For urgent matters, call: +254 700 686 943
+                </p>
+                ''',
+        'text': '''Thank you for your message!
+
+Dear {{ name }},
+
+Thank you for reaching out to the Karachuonyo First campaign. We have received your message and will respond within 24-48 hours.
+
+Your Message Details:
+Subject: {{ subject }}
+Message:
+{{ message }}
+
+Best regards,
+Karachuonyo First Campaign Team
+
+--
+This is an automated response. Please do not reply to this email.
+For urgent matters, call: +254 700 686 943
+'''
+    },
+    'newsletter_welcome': {
+        'subject': 'Welcome to Karachuonyo First Newsletter!',
+        'html': '''
+                <h2>Welcome to Karachuonyo First!</h2>
+                <p>Dear {{ name or 'Supporter' }},</p>
+                <p>Thank you for subscribing to our newsletter! You'll now receive updates about:</p>
+                <ul>
+                    <li>Campaign events and rallies</li>
+                    <li>Policy announcements</li>
+                    <li>Community development projects</li>
+                    <li>Important political updates</li>
+                </ul>
+
+                <p>Together, we're building a better future for Karachuonyo!</p>
+
+                <p>Best regards,<br>
+                <strong>Karachuonyo First Campaign Team</strong></p>
+
+                <hr>
+                <p style="font-size: 12px; color: #666;">
+                You can unsubscribe at any time by replying to this email with "UNSUBSCRIBE".
+                </p>
+                ''',
+        'text': '''Welcome to Karachuonyo First!
+
+Dear {{ name or 'Supporter' }},
+
+Thank you for subscribing to our newsletter! You'll now receive updates about:
+- Campaign events and rallies
+- Policy announcements
+- Community development projects
+- Important political updates
+
+Together, we're building a better future for Karachuonyo!
+
+Best regards,
+Karachuonyo First Campaign Team
+
+--
+You can unsubscribe at any time by replying to this email with "UNSUBSCRIBE".
+'''
+    },
+    'volunteer_admin': {
+        'subject': 'New Volunteer Registration',
+        'html': '''
+                <h2>New Volunteer Registration</h2>
+                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
+                <p><strong>Name:</strong> {{ name }}</p>
+                <p><strong>Email:</strong> {{ email }}</p>
+                <p><strong>Phone:</strong> {{ phone }}</p>
+                <p><strong>Location:</strong> {{ location or 'Not specified' }}</p>
+                <p><strong>Skills:</strong> {{ skills or 'Not specified' }}</p>
+                <p><strong>Availability:</strong> {{ availability or 'Not specified' }}</p>
+                <p><strong>Experience:</strong> {{ experience or 'Not specified' }}</p>
+                <p><strong>Message:</strong></p>
+                <div style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
+                    {{ message or 'Not provided' | replace('\n', '<br>') | safe }}
+                </div>
+                <p><strong>Registered:</strong> {{ timestamp }}</p>
+                <p><strong>IP Address:</strong> {{ ip_address }}</p>
+                ''',
+        'text': '''New Volunteer Registration
+
+Registration ID: {{ registration_id }}
+Name: {{ name }}
+Email: {{ email }}
+Phone: {{ phone }}
+Location: {{ location or 'Not specified' }}
+Skills: {{ skills or 'Not specified' }}
+Availability: {{ availability or 'Not specified' }}
+Experience: {{ experience or 'Not specified' }}
+
+Message:
+{{ message or 'Not provided' }}
+
+Registered: {{ timestamp }}
+IP Address: {{ ip_address }}
+'''
+    },
+    'volunteer_welcome': {
+        'subject': 'Welcome to Karachuonyo First Volunteer Team!',
+        'html': '''
+                <h2>Welcome to the Team!</h2>
+                <p>Dear {{ name }},</p>
+                <p>Thank you for volunteering with the Karachuonyo First campaign! Your commitment to positive change in our community is truly appreciated.</p>
+
+                <h3>What's Next?</h3>
+                <ul>
+                    <li>Our volunteer coordinator will contact you within 48 hours</li>
+                    <li>You'll receive information about upcoming volunteer opportunities</li>
+                    <li>Training sessions and orientation details will be shared</li>
+                    <li>You'll be added to our volunteer WhatsApp group</li>
+                </ul>
+
+                <h3>Your Registration Details:</h3>
+                <p><strong>Name:</strong> {{ name }}</p>
+                <p><strong>Phone:</strong> {{ phone }}</p>
+                <p><strong>Location:</strong> {{ location or 'Not specified' }}</p>
+
+                <p>Together, we're building a better future for Karachuonyo!</p>
+
+                <p>Best regards,<br>
+                <strong>Karachuonyo First Volunteer Coordination Team</strong></p>
+
+                <hr>
+                <p style="font-size: 12px; color: #666;">
+                For questions about volunteering, contact: volunteers@karachuonyofirst.com<br>
+                WhatsApp: +254 700 686 943
+                </p>
+                ''',
+        'text': '''Welcome to the Team!
+
+Dear {{ name }},
+
+Thank you for volunteering with the Karachuonyo First campaign! Your commitment to positive change in our community is truly appreciated.
+
+What's Next?
+- Our volunteer coordinator will contact you within 48 hours
+- You'll receive information about upcoming volunteer opportunities
+- Training sessions and orientation details will be shared
+- You'll be added to our volunteer WhatsApp group
+
+Your Registration Details:
+Name: {{ name }}
+Phone: {{ phone }}
+Location: {{ location or 'Not specified' }}
+
+Together, we're building a better future for Karachuonyo!
+
+Best regards,
+Karachuonyo First Volunteer Coordination Team
+
+--
+For questions about volunteering, contact: volunteers@karachuonyofirst.com
+WhatsApp: +254 700 686 943
+'''
+    },
+    'event_admin': {
+        'subject': 'New Event Registration: {{ event_title }}',
+        'html': '''
+                <h2>New Event Registration</h2>
+                <p><strong>Event:</strong> {{ event_title }}</p>
+                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
+                <p><strong>Name:</strong> {{ name }}</p>
+                <p><strong>Email:</strong> {{ email }}</p>
+                <p><strong>Phone:</strong> {{ phone or 'Not provided' }}</p>
+                <p><strong>Event Date:</strong> {{ event_date }}</p>
+                <p><strong>Location:</strong> {{ location }}</p>
+                <p><strong>Notes:</strong> {{ notes or 'None' }}</p>
+                <p><strong>Registered:</strong> {{ timestamp }}</p>
+                ''',
+        'text': '''New Event Registration
+
+Event: {{ event_title }}
+Registration ID: {{ registration_id }}
+Name: {{ name }}
+Email: {{ email }}
+Phone: {{ phone or 'Not provided' }}
+Event Date: {{ event_date }}
+Location: {{ location }}
+Notes: {{ notes or 'None' }}
+Registered: {{ timestamp }}
+'''
+    },
+    'event_confirmation': {
+        'subject': 'Event Registration Confirmed: {{ event_title }}',
+        'html': '''
+                <h2>Registration Confirmed!</h2>
+                <p>Dear {{ name }},</p>
+                <p>Thank you for registering for our event. Your registration has been confirmed!</p>
+
+                <h3>Event Details:</h3>
+                <p><strong>Event:</strong> {{ event_title }}</p>
+                <p><strong>Date:</strong> {{ event_date }}</p>
+                <p><strong>Location:</strong> {{ location }}</p>
+                <p><strong>Registration ID:</strong> {{ registration_id }}</p>
+
+                <h3>Important Information:</h3>
+                <ul>
+                    <li>Please arrive 15 minutes before the event starts</li>
+                    <li>Bring a valid ID for verification</li>
+                    <li>Contact us if you need to cancel your registration</li>
+                </ul>
+
+                <p>We look forward to seeing you at the event!</p>
+
+                <p>Best regards,<br>
+                <strong>Karachuonyo First Events Team</strong></p>
+
+                <hr>
+                <p style="font-size: 12px; color: #666;">
+                For event inquiries, contact: events@karachuonyofirst.com<br>
+                Phone: +254 700 686 943
+                </p>
+                ''',
+        'text': '''Registration Confirmed!
+
+Dear {{ name }},
+
+Thank you for registering for our event. Your registration has been confirmed!
+
+Event Details:
+Event: {{ event_title }}
+Date: {{ event_date }}
+Location: {{ location }}
+Registration ID: {{ registration_id }}
+
+Important Information:
+- Please arrive 15 minutes before the event starts
+- Bring a valid ID for verification
+- Contact us if you need to cancel your registration
+
+We look forward to seeing you at the event!
+
+Best regards,
+Karachuonyo First Events Team
+
+--
+For event inquiries, contact: events@karachuonyofirst.com
+Phone: +254 700 686 943
+'''
+    }
+}
+
+
+class RenderedEmail:
+    """Subject plus HTML and plain-text bodies of one notification"""
+
+    __slots__ = ('subject', 'html', 'text')
+
+    def __init__(self, subject, html, text):
+        self.subject = subject
+        self.html = html
+        self.text = text
+
+
+class CompiledEmailTemplate:
+    """Compiled subject, HTML and (optional) plain-text templates"""
+
+    __slots__ = ('subject', 'html', 'text')
+
+    def __init__(self, subject, html, text=None):
+        self.subject = subject
+        self.html = html
+        self.text = text
+
+    def render(self, context):
+        return RenderedEmail(
+            ' '.join(self.subject.render(context).split()),
+            self.html.render(context),
+            self.text.render(context) if self.text is not None else None
+        )
+
+
+class EmailTemplateRegistry:
+    """Email templates compiled once, looked up by name"""
+
+    def __init__(self, templates=None, strict=False):
+        undefined = StrictUndefined if strict else Undefined
+        # Separate environments: only HTML output is escaped
+        self._html_env = Environment(autoescape=True, undefined=undefined)
+        self._text_env = Environment(autoescape=False, undefined=undefined, keep_trailing_newline=True)
+        self._sources = dict(templates if templates is not None else TEMPLATES)
+        self._compiled = {name: self.compile(**source) for name, source in self._sources.items()}
+
+    def compile(self, subject, html, text=None):
+        """Compile template sources that are not in the registry (e.g. a broadcast)"""
+        return CompiledEmailTemplate(
+            self._text_env.from_string(subject),
+            self._html_env.from_string(html),
+            self._text_env.from_string(text) if text else None
+        )
+
+    def names(self):
+        return sorted(self._compiled)
+
+    def source(self, template):
+        """Subject, HTML and text sources of a registered template"""
+        return dict(self._sources[template])
+
+    def render(self, template, /, **context):
+        """Render ``template``; raises KeyError for unknown names"""
+        return self._compiled[template].render(context)
+
+    def message(self, template, /, recipients, **context):
+        """flask_mail Message carrying both bodies of ``template``"""
+        from flask_mail import Message
+
+        rendered = self.render(template, **context)
+        return Message(subject=rendered.subject, recipients=recipients,
+                       html=rendered.html, body=rendered.text)
+
+    def render_uncompiled(self, template, /, **context):
+        """Parse, compile and render on every call (the old per-email cost), for comparison"""
+        return self.compile(**self._sources[template]).render(context)
+
+
+SAMPLE_CONTEXT = {
+    'submission_id': 1042,
+    'registration_id': 311,
+    'name': 'Achieng Otieno',
+    'email': 'achieng@example.com',
+    'phone': '+254700000000',
+    'subject': 'Water project',
+    'message': 'When does the borehole work start?\nThank you.',
+    'location': 'Kendu Bay',
+    'skills': 'canvassing, logistics',
+    'availability': 'weekends',
+    'experience': 'Ward coordinator 2022',
+    'event_title': 'Town Hall Meeting',
+    'event_date': '2030-01-01T10:00:00',
+    'notes': None,
+    'timestamp': datetime(2030, 1, 1, 9, 30).strftime('%Y-%m-%d %H:%M:%S'),
+    'ip_address': '127.0.0.1'
+}
+
+
+def benchmark(registry, iterations=2000):
+    """Average microseconds per render, compiled vs compiled-per-call"""
+    results = {}
+    for name in registry.names():
+        timings = {}
+        for label, render in (('compiled', registry.render), ('uncompiled', registry.render_uncompiled)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                render(name, **SAMPLE_CONTEXT)
+            timings[label] = (time.perf_counter() - started) / iterations * 1e6
+        timings['speedup'] = timings['uncompiled'] / timings['compiled']
+        results[name] = timings
+    return results
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo email templates')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bench = subparsers.add_parser('bench', help='Time compiled against per-call compiled rendering')
+    bench.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        started = time.perf_counter()
+        registry = EmailTemplateRegistry(strict=True)
+        print(f"Compiled {len(registry.names())} templates in {(time.perf_counter() - started) * 1000:.1f} ms")
+        print(f"{'template':<22}{'compiled us':>14}{'uncompiled us':>16}{'speedup':>10}")
+        for name, timings in benchmark(registry, args.iterations).items():
+            print(f"{name:<22}{timings['compiled']:>14.1f}{timings['uncompiled']:>16.1f}"
+                  f"{timings['speedup']:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
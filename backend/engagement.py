@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Article Engagement Counters
+Write-coalescing buffer for news article views, likes and shares
+
+Handlers record deltas in memory; a background thread folds them into
+news_articles with one batched transaction per flush interval (or sooner
+once enough deltas are pending), so a popular article costs one write per
+interval instead of one per visitor. Reads add pending deltas on top of the
+stored value so visitors still see their own view/like reflected.
+
+Given a shared memory segment (sharedmem.py) the deltas live there instead,
+so every gunicorn worker reports the same pending counts and whichever
+worker flushes first writes the deltas of all of them.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from sharedmem import SegmentBusy
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('views', 'likes', 'shares')
+SHARED_PREFIX = 'engagement:'
+
+
+class EngagementBuffer:
+    """Aggregator of article counter deltas (per process, or per segment)"""
+
+    def __init__(self, pool, flush_interval=1.0, flush_threshold=500, segment=None):
+        self.pool = pool
+        self.segment = segment
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pid = None
+        self._thread = None
+        self._pending = {}
+        self._pending_total = 0
+        self._flushes = 0
+        self._rows_written = 0
+        self._deltas_written = 0
+        self._failures = 0
+        self._shared_fallbacks = 0
+        self._last_flush_ms = 0.0
+        atexit.register(self.stop)
+
+    def _ensure_worker(self):
+        """Start the flush thread in this process (after any fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Deltas recorded by a parent process belong to the parent
+                self._pending = {}
+                self._pending_total = 0
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name='engagement-flush', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Engagement flush failed: {e}")
+
+    @staticmethod
+    def _shared_key(article_id, field):
+        return f'{SHARED_PREFIX}{field}:{article_id}'
+
+    def add(self, article_id, field, delta=1):
+        """Record ``delta`` for one counter of an article (by numeric id)"""
+        self._ensure_worker()
+        shared = False
+        if self.segment is not None:
+            try:
+                self.segment.incr(self._shared_key(article_id, field), delta)
+                shared = True
+            except (MemoryError, SegmentBusy):
+                # Counter table full or locked up: keep the delta locally rather than lose it
+                with self._lock:
+                    self._shared_fallbacks += 1
+
+        with self._lock:
+            if not shared:
+                counters = self._pending.setdefault(article_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                counters[field] += delta
+            self._pending_total += delta
+            if self._pending_total >= self.flush_threshold:
+                self._wake.set()
+
+    def pending(self, article_id):
+        """Deltas not yet written for an article"""
+        with self._lock:
+            counters = self._pending.get(article_id)
+            counters = dict(counters) if counters else dict.fromkeys(COUNTER_FIELDS, 0)
+        if self.segment is not None:
+            try:
+                for field in COUNTER_FIELDS:
+                    counters[field] += self.segment.get_counter(self._shared_key(article_id, field))
+            except SegmentBusy:
+                pass  # shown once flushed
+        return counters
+
+    def _drain_shared(self, batch):
+        """Move deltas from the shared segment into ``batch``; returns their sum"""
+        total = 0
+        for key, value in self.segment.drain_counters(SHARED_PREFIX).items():
+            field, article_id = key[len(SHARED_PREFIX):].split(':', 1)
+            counters = batch.setdefault(int(article_id), dict.fromkeys(COUNTER_FIELDS, 0))
+            counters[field] += value
+            total += value
+        return total
+
+    def flush(self):
+        """Write all pending deltas in a single transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                total = sum(sum(c.values()) for c in batch.values())
+                self._pending_total = 0
+            if self.segment is not None:
+                total += self._drain_shared(batch)
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            conn = self.pool.acquire()
+            try:
+                conn.executemany(
+                    'UPDATE news_articles SET views = views + ?, likes = likes + ?, '
+                    'shares = shares + ? WHERE id = ?',
+                    [(c['views'], c['likes'], c['shares'], article_id)
+                     for article_id, c in batch.items()]
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self._restore(batch, total)
+                with self._lock:
+                    self._failures += 1
+                raise
+            finally:
+                self.pool.release(conn)
+
+            with self._lock:
+                self._flushes += 1
+                self._rows_written += len(batch)
+                self._deltas_written += total
+                self._last_flush_ms = (time.perf_counter() - started) * 1000
+            return len(batch)
+
+    def _restore(self, batch, total):
+        """Put a failed batch back so the next flush in this process retries it"""
+        with self._lock:
+            for article_id, counters in batch.items():
+                pending = self._pending.setdefault(article_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                for field, value in counters.items():
+                    pending[field] += value
+            self._pending_total += total
+
+    def stop(self):
+        """Stop the flush thread and write whatever is still pending"""
+        self._stopped = True
+        self._wake.set()
+        if self._pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final engagement flush failed: {e}")
+
+    def stats(self):
+        """Snapshot of buffer counters"""
+        with self._lock:
+            return {
+                'pending_articles': len(self._pending),
+                'pending_deltas': self._pending_total,
+                'flushes': self._flushes,
+                'rows_written': self._rows_written,
+                'deltas_written': self._deltas_written,
+                'failures': self._failures,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'shared_segment': self.segment is not None,
+                'shared_fallbacks': self._shared_fallbacks,
+                'flush_interval': self.flush_interval,
+                'flush_threshold': self.flush_threshold
+            }
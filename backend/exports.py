@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Data Exports
+Constant-memory CSV / NDJSON dumps of submission and donation tables
+
+Rows are read with fetchmany() from a dedicated pooled connection (a named
+server-side cursor on PostgreSQL; SQLite cursors already step lazily) and
+encoded chunk by chunk, so memory use does not grow with table size.
+The connection goes back to the pool when the body is exhausted or closed,
+including when the client disconnects mid-download.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+# Export name -> (table, columns), columns in output order
+EXPORTABLE_TABLES = {
+    'contacts': ('contact_submissions', [
+        'id', 'name', 'email', 'phone', 'subject', 'message', 'submitted_at',
+        'ip_address', 'user_agent', 'status'
+    ]),
+    'volunteers': ('volunteer_registrations', [
+        'id', 'name', 'email', 'phone', 'location', 'skills', 'availability',
+        'experience', 'motivation', 'status', 'registered_at', 'ip_address', 'user_agent'
+    ]),
+    'donations': ('donations', [
+        'id', 'donor_name', 'donor_email', 'phone_number', 'amount', 'payment_method',
+        'status', 'transaction_id', 'checkout_request_id', 'merchant_request_id',
+        'created_at', 'completed_at', 'ip_address', 'user_agent'
+    ]),
+    'rsvps': ('event_registrations', [
+        'id', 'event_id', 'name', 'email', 'phone', 'status', 'registered_at', 'notes'
+    ]),
+}
+
+# Table names accepted in place of the export names
+EXPORT_ALIASES = {
+    'contact_submissions': 'contacts',
+    'volunteer_registrations': 'volunteers',
+    'event_registrations': 'rsvps',
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_row_chunks(pool, table, columns, chunk_size=500):
+    """Yield lists of rows from ``table`` in primary key order.
+
+    The connection is checked out for the lifetime of the generator rather
+    than the request, because the body is produced after the view returns.
+    """
+    conn = pool.acquire()
+    try:
+        if pool.dialect == 'postgresql':
+            cursor = conn.cursor(name=f'export_{table}')
+        else:
+            cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+        cursor.close()
+    finally:
+        pool.release(conn)
+
+
+def csv_chunks(columns, row_chunks):
+    """Encode row chunks as CSV text, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(columns, row_chunks):
+    """Encode row chunks as newline-delimited JSON objects"""
+    for rows in row_chunks:
+        lines = [
+            json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False)
+            for row in rows
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a gzip file on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def is_exportable(name):
+    """Whether ``name`` is an export name or one of its table aliases"""
+    return EXPORT_ALIASES.get(name, name) in EXPORTABLE_TABLES
+
+
+def _closing(body, row_chunks):
+    """Stream ``body``, closing the row reader (and its connection) however it ends"""
+    try:
+        yield from body
+    finally:
+        row_chunks.close()
+
+
+def export_stream(pool, name, fmt='csv', compress=False, chunk_size=500):
+    """Body generator, content type and download filename for an export.
+
+    Raises KeyError for unknown export names or formats.
+    """
+    table, columns = EXPORTABLE_TABLES[EXPORT_ALIASES.get(name, name)]
+    content_type = EXPORT_FORMATS[fmt]
+
+    row_chunks = iter_row_chunks(pool, table, columns, chunk_size)
+    encoder = csv_chunks if fmt == 'csv' else ndjson_chunks
+    body = encoder(columns, row_chunks)
+    filename = f'{table}.{fmt}'
+
+    if compress:
+        body = gzip_chunks(body)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    return _closing(body, row_chunks), content_type, filename
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Fundraising Totals
+Incremental rollups of completed donations for totals and progress bars
+
+donation_rollups keeps the amount and number of completed donations per
+hour, per day and overall, split by payment method. Whatever settles a
+donation (the callback inbox or the reconciliation sweeper) calls
+record_completed() in the same transaction as the status change, and only
+for donations that changed state then, so every donation is counted once.
+Totals are read from a handful of rollup rows, however many donations
+there are.
+
+    python fundraising.py rebuild   recompute the rollups from donations
+    python fundraising.py summary   print the public totals
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ('hour', 'day', 'all')
+
+# Longest admin breakdown served in one response, by bucket
+MAX_PERIODS = {'hour': 24 * 14, 'day': 366 * 2}
+
+
+class SummaryError(ValueError):
+    """Invalid breakdown request parameters"""
+
+
+def _period(bucket, moment):
+    if bucket == 'hour':
+        return moment.strftime('%Y-%m-%dT%H:00')
+    if bucket == 'day':
+        return moment.strftime('%Y-%m-%d')
+    return ''
+
+
+def _parse_moment(value):
+    """Datetime for a stored completed_at (ISO text or a driver datetime)"""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return datetime.now()
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', ''))
+    except ValueError:
+        return datetime.now()
+
+
+def record_completed(conn, donations):
+    """Add (amount, payment_method, completed_at) donations to the rollups.
+
+    Runs on the caller's connection and transaction, so the totals commit
+    or roll back with the status change that completed the donations.
+    """
+    deltas = defaultdict(lambda: [0.0, 0])
+    for amount, payment_method, completed_at in donations:
+        moment = _parse_moment(completed_at)
+        for bucket in BUCKETS:
+            delta = deltas[(bucket, _period(bucket, moment), payment_method or 'unknown')]
+            delta[0] += float(amount or 0)
+            delta[1] += 1
+    if deltas:
+        conn.executemany('''
+            INSERT INTO donation_rollups (bucket, period_start, payment_method, total_amount, donation_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (bucket, period_start, payment_method) DO UPDATE SET
+                total_amount = donation_rollups.total_amount + excluded.total_amount,
+                donation_count = donation_rollups.donation_count + excluded.donation_count
+        ''', [(*key, total, count) for key, (total, count) in deltas.items()])
+    return len(deltas)
+
+
+def rebuild(conn):
+    """Recompute every rollup row from the completed donations (committed by the caller)"""
+    conn.execute('DELETE FROM donation_rollups')
+    rows = conn.execute('''
+        SELECT amount, payment_method, COALESCE(completed_at, created_at)
+        FROM donations WHERE status = 'completed'
+    ''').fetchall()
+    record_completed(conn, rows)
+    return len(rows)
+
+
+def totals(conn):
+    """Public fundraising total: amount and count over every payment method"""
+    row = conn.execute('''
+        SELECT COALESCE(SUM(total_amount), 0), COALESCE(SUM(donation_count), 0)
+        FROM donation_rollups WHERE bucket = 'all'
+    ''').fetchone()
+    return {'total_amount': round(row[0], 2), 'donation_count': row[1]}
+
+
+def progress(conn, goal=0):
+    """Public total plus the goal and percent raised when a goal is set"""
+    summary = totals(conn)
+    if goal:
+        summary['goal'] = goal
+        summary['percent'] = round(min(summary['total_amount'] / goal * 100, 100), 1)
+    return summary
+
+
+def breakdown(conn, bucket='day', since=None, until=None, payment_method=None):
+    """Admin view: totals per payment method plus a per-period series"""
+    if bucket not in MAX_PERIODS:
+        raise SummaryError(f"bucket must be one of: {', '.join(MAX_PERIODS)}")
+    step = timedelta(hours=1) if bucket == 'hour' else timedelta(days=1)
+    try:
+        until = datetime.fromisoformat(until) if until else datetime.now()
+        since = datetime.fromisoformat(since) if since else until - step * (48 if bucket == 'hour' else 30)
+    except ValueError:
+        raise SummaryError('since and until must be ISO dates, e.g. 2025-01-31 or 2025-01-31T14:00')
+    if since > until:
+        raise SummaryError('since must not be after until')
+    if (until - since) / step > MAX_PERIODS[bucket]:
+        raise SummaryError(f'at most {MAX_PERIODS[bucket]} {bucket}s per request')
+
+    by_method = {}
+    for method, total, count in conn.execute('''
+        SELECT payment_method, total_amount, donation_count
+        FROM donation_rollups WHERE bucket = 'all'
+        ORDER BY payment_method
+    ''').fetchall():
+        by_method[method] = {'total_amount': round(total, 2), 'donation_count': count}
+
+    sql = '''
+        SELECT period_start, payment_method, total_amount, donation_count
+        FROM donation_rollups
+        WHERE bucket = ? AND period_start >= ? AND period_start <= ?
+    '''
+    params = [bucket, _period(bucket, since), _period(bucket, until)]
+    if payment_method:
+        sql += ' AND payment_method = ?'
+        params.append(payment_method)
+    series = [
+        {'period': period, 'payment_method': method, 'total_amount': round(total, 2), 'donation_count': count}
+        for period, method, total, count in conn.execute(sql + ' ORDER BY period_start, payment_method', params)
+    ]
+
+    summary = totals(conn)
+    summary.update({
+        'by_payment_method': by_method,
+        'bucket': bucket,
+        'since': _period(bucket, since),
+        'until': _period(bucket, until),
+        'series': series
+    })
+    return summary
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo fundraising totals')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help='Recompute the rollups from donations')
+    subparsers.add_parser('summary', help='Print the public totals')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import db_pool
+
+    conn = db_pool.acquire()
+    try:
+        if args.command == 'rebuild':
+            counted = rebuild(conn)
+            conn.commit()
+            print(f"Rolled up {counted} completed donations")
+        elif args.command == 'summary':
+            for key, value in totals(conn).items():
+                print(f"{key}: {value}")
+    finally:
+        db_pool.release(conn)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+"""
+gunicorn settings for the Karachuonyo backend
+
+Loaded automatically when gunicorn is started from this directory (see
+Procfile / render.yaml). Command line flags still take precedence.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_settings  # noqa: E402
+
+settings = get_settings()
+
+# Threaded workers, so long-lived /api/live streams (live.py) each hold a
+# thread rather than a whole worker. GUNICORN_WORKER_CLASS=gevent serves
+# many more streams per worker once gevent is installed. The thread count
+# comes from config, which caps live streams (LIVE_MAX_SUBSCRIBERS) below it.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'gthread'
+threads = settings['GUNICORN_THREADS']
+
+
+def on_starting(server):
+    """Create the shared memory segment in the master so workers inherit it"""
+    import sharedmem
+
+    segment = sharedmem.create_segment(
+        counter_slots=settings.get('SHARED_COUNTER_SLOTS', 4096),
+        cache_slots=settings.get('SHARED_CACHE_SLOTS', 256),
+        cache_value_size=settings.get('SHARED_CACHE_VALUE_SIZE', 65536),
+        lock_timeout=settings.get('SHARED_LOCK_TIMEOUT', 0.5)
+    )
+    server.log.info(f"Shared memory segment ready ({segment.size} bytes)")
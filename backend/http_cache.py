@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo HTTP Caching
+Validators, conditional GETs and Cache-Control for public JSON endpoints
+
+Routes listed in HTTP_CACHE_POLICIES (config.py, keyed by endpoint name)
+get that Cache-Control header and a strong ETag on 200 responses, and
+requests carrying a matching If-None-Match (or, without one, an
+If-Modified-Since no older than Last-Modified) are answered with 304.
+
+Responses served from the response cache reuse the ETag stored with the
+entry, so a revalidation hit costs neither a view call nor a body hash.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+from compression import available_encodings, encoded_etag
+
+
+def strong_etag(body):
+    """Content hash of a response body, used as a strong ETag"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def parse_timestamp(value):
+    """UTC datetime from the ISO or SQLite timestamps stored in the database"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if moment.tzinfo is None:
+        # CURRENT_TIMESTAMP and the seed articles are UTC
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def _matching_etag(etag):
+    """The tag in If-None-Match naming ``etag`` or one of its encoded variants"""
+    for candidate in (etag,) + tuple(encoded_etag(etag, e) for e in available_encodings()):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def is_not_modified(etag, last_modified=None):
+    """Whether the current request's validators match the given ones"""
+    if request.if_none_match:
+        return _matching_etag(etag) is not None
+    if last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have one-second resolution
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def not_modified_response(etag, last_modified=None):
+    """Bodyless 304 carrying the validators the client already holds"""
+    response = Response(status=304)
+    response.set_etag((_matching_etag(etag) if request.if_none_match else None) or etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def init_app(app):
+    """Apply validators and Cache-Control policies to configured endpoints"""
+    policies = app.config.get('HTTP_CACHE_POLICIES', {})
+
+    @app.after_request
+    def apply_http_cache_policy(response):
+        policy = policies.get(request.endpoint)
+        if policy is None or request.method not in ('GET', 'HEAD'):
+            return response
+
+        if response.status_code == 200 and not response.is_streamed:
+            etag, _ = response.get_etag()
+            if etag is None:
+                response.set_etag(strong_etag(response.get_data()))
+                etag, _ = response.get_etag()
+            if is_not_modified(etag, response.last_modified):
+                response = not_modified_response(etag, response.last_modified)
+
+        if response.status_code in (200, 304):
+            response.headers['Cache-Control'] = policy
+        return response
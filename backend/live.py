@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Live Updates
+Server-sent events for article metrics, fundraising totals and event spots
+
+Pages subscribe to topics over one /api/live stream instead of polling:
+'article:<id or slug>', 'fundraising' and 'event:<id>'. Each process keeps
+one TopicPublisher per subscribed topic, however many clients follow it,
+and a single LiveHub thread polls every subscribed topic each interval
+with one pooled connection and one query per kind of topic. Only fields
+that changed since the last poll are sent, so a quiet article costs its
+subscribers nothing but a heartbeat comment.
+
+Every client has a bounded queue. A client too slow to drain it is
+disconnected rather than buffered for; EventSource reconnects and starts
+again from a fresh snapshot. Streams hold a worker thread (or greenlet)
+but never a database connection, and end after stream_seconds so
+reconnects spread clients across gunicorn workers. max_subscribers caps
+the streams per process below the worker's thread count (config.py
+derives it from GUNICORN_THREADS), so other requests still get a thread.
+
+    python live.py status   publisher counters for this process
+    python live.py poll     poll the given topics once and print them
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import fundraising
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,120}$')
+
+
+class LiveTopicError(ValueError):
+    """Unknown or malformed topic in a subscription"""
+
+
+class LiveBusyError(Exception):
+    """This process already serves its maximum number of streams"""
+
+
+def parse_topic(topic):
+    """(kind, key) for a topic name; raises LiveTopicError"""
+    kind, _, key = topic.partition(':')
+    if kind == 'fundraising' and not key:
+        return kind, ''
+    if kind == 'event' and key.isdigit():
+        return kind, key
+    if kind == 'article' and KEY_PATTERN.match(key):
+        return kind, key
+    raise LiveTopicError(f'Unknown topic: {topic[:80]}')
+
+
+def _placeholders(values):
+    return ', '.join('?' for _ in values)
+
+
+def article_metrics(engagement=None):
+    """Loader for 'article' topics: views, likes and shares including buffered deltas"""
+    def load(conn, keys):
+        ids = [int(key) for key in keys if key.isdigit()]
+        slugs = [key for key in keys if not key.isdigit()]
+        clauses, params = [], []
+        if ids:
+            clauses.append(f'id IN ({_placeholders(ids)})')
+            params.extend(ids)
+        if slugs:
+            clauses.append(f'slug IN ({_placeholders(slugs)})')
+            params.extend(slugs)
+        rows = conn.execute(f'''
+            SELECT id, slug, views, likes, shares FROM news_articles
+            WHERE status = 'published' AND ({' OR '.join(clauses)})
+        ''', params).fetchall()
+
+        wanted = set(keys)
+        values = {}
+        for article_id, slug, views, likes, shares in rows:
+            pending = engagement.pending(article_id) if engagement is not None else {}
+            metrics = {
+                'views': (views or 0) + pending.get('views', 0),
+                'likes': (likes or 0) + pending.get('likes', 0),
+                'shares': (shares or 0) + pending.get('shares', 0)
+            }
+            for key in (str(article_id), slug):
+                if key in wanted:
+                    values[key] = metrics
+        return values
+    return load
+
+
+def fundraising_total(goal=0):
+    """Loader for the 'fundraising' topic: the public total and progress"""
+    def load(conn, keys):
+        return {'': fundraising.progress(conn, goal)}
+    return load
+
+
+def event_spots(conn, keys):
+    """Loader for 'event' topics: registrations and spots remaining"""
+    ids = [int(key) for key in keys]
+    values = {}
+    for event_id, max_attendees, registration_count in conn.execute(
+        f'SELECT id, max_attendees, registration_count FROM events WHERE id IN ({_placeholders(ids)})',
+        ids
+    ).fetchall():
+        registration_count = registration_count or 0
+        values[str(event_id)] = {
+            'registration_count': registration_count,
+            'max_attendees': max_attendees,
+            'spots_available': (max_attendees - registration_count) if max_attendees else None
+        }
+    return values
+
+
+class Subscriber:
+    """One stream's topics and its bounded queue of pending messages"""
+
+    def __init__(self, topics, queue_size):
+        self.topics = topics
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def offer(self, message):
+        """Queue a message without blocking; a full queue closes the subscriber"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.close()
+            return False
+
+    def close(self):
+        """Drop anything queued and wake the stream up to end"""
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class TopicPublisher:
+    """Last values seen for one topic and the subscribers following it"""
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.kind, self.key = parse_topic(topic)
+        self.values = None
+        self.version = 0
+        self.subscribers = set()
+
+    def snapshot(self):
+        return ('snapshot', {'topic': self.topic, 'version': self.version, 'data': dict(self.values)})
+
+    def publish(self, values):
+        """Send subscribers the fields that changed; returns how many messages were queued"""
+        if self.values is None:
+            self.values = dict(values)
+            self.version += 1
+            message = self.snapshot()
+        else:
+            changed = {field: value for field, value in values.items() if self.values.get(field) != value}
+            if not changed:
+                return 0
+            self.values.update(changed)
+            self.version += 1
+            message = ('update', {'topic': self.topic, 'version': self.version, 'data': changed})
+        return sum(1 for subscriber in self.subscribers if subscriber.offer(message))
+
+
+class LiveHub:
+    """Per-process topic publishers fanned out to server-sent event streams"""
+
+    def __init__(self, pool, sources, interval=2.0, heartbeat=15.0, queue_size=32,
+                 max_subscribers=48, max_topics=8, stream_seconds=600, retry_ms=5000):
+        self.pool = pool
+        self.sources = sources
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.max_topics = max_topics
+        self.stream_seconds = stream_seconds
+        self.retry_ms = retry_ms
+        self._publishers = {}
+        self._subscribers = set()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._pid = None
+        self._thread = None
+        self._counts = dict.fromkeys(('polls', 'messages', 'dropped', 'errors'), 0)
+        self._last_poll_seconds = None
+        self._last_error = None
+
+    @classmethod
+    def from_config(cls, app, pool, engagement=None):
+        config = app.config
+        return cls(
+            pool,
+            {
+                'article': article_metrics(engagement),
+                'fundraising': fundraising_total(config.get('FUNDRAISING_GOAL', 0)),
+                'event': event_spots
+            },
+            interval=config.get('LIVE_POLL_INTERVAL', 2.0),
+            heartbeat=config.get('LIVE_HEARTBEAT', 15.0),
+            queue_size=config.get('LIVE_QUEUE_SIZE', 32),
+            max_subscribers=config.get('LIVE_MAX_SUBSCRIBERS', 48),
+            max_topics=config.get('LIVE_MAX_TOPICS', 8),
+            stream_seconds=config.get('LIVE_STREAM_SECONDS', 600)
+        )
+
+    # Background thread
+
+    def start(self):
+        """Start the polling thread in this process (after any fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped = False
+                self._thread = threading.Thread(target=self.run, name='live-hub', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        """Poll subscribed topics every interval until stopped"""
+        while not self._stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Live update poll failed: {e}")
+                with self._lock:
+                    self._counts['errors'] += 1
+                    self._last_error = str(e)[:200]
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    # Subscriptions
+
+    def subscribe(self, topics):
+        """Register a stream for the given topic names; raises LiveTopicError / LiveBusyError"""
+        topics = list(dict.fromkeys(topic.strip() for topic in topics if topic.strip()))
+        if not topics:
+            raise LiveTopicError('No topics given')
+        if len(topics) > self.max_topics:
+            raise LiveTopicError(f'At most {self.max_topics} topics per stream')
+        for topic in topics:
+            parse_topic(topic)
+
+        subscriber = Subscriber(topics, self.queue_size)
+        new_topic = False
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise LiveBusyError('Too many live streams, try again shortly')
+            self._subscribers.add(subscriber)
+            for topic in topics:
+                publisher = self._publishers.get(topic)
+                if publisher is None:
+                    publisher = self._publishers[topic] = TopicPublisher(topic)
+                    new_topic = True
+                elif publisher.values is not None:
+                    subscriber.offer(publisher.snapshot())
+                publisher.subscribers.add(subscriber)
+        if new_topic:
+            self._wake.set()  # first snapshot now rather than after a full interval
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Forget a stream; publishers nobody follows any more are dropped"""
+        with self._lock:
+            self._remove(subscriber)
+
+    def _remove(self, subscriber):
+        self._subscribers.discard(subscriber)
+        for topic in subscriber.topics:
+            publisher = self._publishers.get(topic)
+            if publisher is not None:
+                publisher.subscribers.discard(subscriber)
+                if not publisher.subscribers:
+                    del self._publishers[topic]
+
+    # Publishing
+
+    def poll(self):
+        """Load every subscribed topic once and publish what changed; returns messages queued"""
+        started = time.monotonic()
+        with self._lock:
+            keys = {}
+            for publisher in self._publishers.values():
+                keys.setdefault(publisher.kind, []).append(publisher.key)
+        if not keys:
+            return 0
+
+        loaded = {}
+        conn = self.pool.acquire()
+        try:
+            for kind, kind_keys in keys.items():
+                loaded[kind] = self.sources[kind](conn, kind_keys)
+        finally:
+            self.pool.release(conn)
+
+        messages = 0
+        with self._lock:
+            for publisher in list(self._publishers.values()):
+                values = loaded.get(publisher.kind, {}).get(publisher.key)
+                if values is not None:
+                    messages += publisher.publish(values)
+            lagging = [subscriber for subscriber in self._subscribers if subscriber.closed]
+            for subscriber in lagging:
+                self._remove(subscriber)
+            self._counts['polls'] += 1
+            self._counts['messages'] += messages
+            self._counts['dropped'] += len(lagging)
+            self._last_poll_seconds = round(time.monotonic() - started, 4)
+        if lagging:
+            logger.info(f"Dropped {len(lagging)} live streams that fell behind")
+        return messages
+
+    def stream(self, subscriber):
+        """Server-sent event body for a subscriber; unsubscribes when it ends"""
+        deadline = time.monotonic() + self.stream_seconds
+        try:
+            yield f'retry: {self.retry_ms}\n\n'.encode()
+            while time.monotonic() < deadline:
+                try:
+                    message = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield b': ping\n\n'
+                    continue
+                if message is None:
+                    break
+                event, payload = message
+                yield f'event: {event}\ndata: {json.dumps(payload, default=str)}\n\n'.encode()
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        """Streams, topics and publishing counters for this process"""
+        with self._lock:
+            stats = {
+                'subscribers': len(self._subscribers),
+                'topics': len(self._publishers),
+                'max_subscribers': self.max_subscribers
+            }
+            stats.update(self._counts)
+            stats['last_poll_seconds'] = self._last_poll_seconds
+            stats['last_error'] = self._last_error
+        stats['worker_running'] = self._thread is not None and self._pid == os.getpid()
+        return stats
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo live updates')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show publisher counters')
+    poll_parser = subparsers.add_parser('poll', help='Poll topics once and print their values')
+    poll_parser.add_argument('topics', nargs='+', help="e.g. article:12 fundraising event:3")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import live_hub
+
+    if args.command == 'status':
+        for key, value in live_hub.stats().items():
+            print(f"{key}: {value}")
+    elif args.command == 'poll':
+        subscriber = live_hub.subscribe(args.topics)
+        live_hub.poll()
+        while not subscriber.queue.empty():
+            event, payload = subscriber.queue.get_nowait()
+            print(f"{payload['topic']}: {json.dumps(payload['data'], default=str)}")
+        live_hub.unsubscribe(subscriber)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
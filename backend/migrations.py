@@ -0,0 +1,666 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Database Migrations
+Ordered, versioned schema migrations tracked in the schema_version table
+
+Usage:
+    python migrations.py status
+    python migrations.py upgrade [--target VERSION]
+"""
+
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+# Arbitrary key for the PostgreSQL advisory lock serialising migration runs
+MIGRATION_LOCK_ID = 48151623
+
+
+def _primary_key(dialect):
+    """Auto-incrementing integer primary key column definition"""
+    if dialect == 'postgresql':
+        return 'SERIAL PRIMARY KEY'
+    return 'INTEGER PRIMARY KEY AUTOINCREMENT'
+
+
+def _column_exists(cursor, table, column, dialect):
+    """Check whether a column is already present on a table"""
+    if dialect == 'postgresql':
+        cursor.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?
+        ''', (table, column))
+        return cursor.fetchone() is not None
+
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _0001_baseline_schema(cursor, dialect):
+    """Core tables that used to be created by init_database()"""
+    pk = _primary_key(dialect)
+    
+    # Contact submissions table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS contact_submissions (
+            id {pk},
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT,
+            subject TEXT NOT NULL,
+            message TEXT NOT NULL,
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            status TEXT DEFAULT 'new'
+        )
+    ''')
+    
+    # Newsletter subscriptions table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS newsletter_subscriptions (
+            id {pk},
+            email TEXT UNIQUE NOT NULL,
+            name TEXT,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            status TEXT DEFAULT 'active',
+            confirmation_token TEXT
+        )
+    ''')
+    
+    # Admin users table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS admin_users (
+            id {pk},
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            role TEXT DEFAULT 'admin'
+        )
+    ''')
+    
+    # Donations table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS donations (
+            id {pk},
+            donor_name TEXT NOT NULL,
+            donor_email TEXT,
+            phone_number TEXT,
+            amount REAL NOT NULL,
+            payment_method TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            transaction_id TEXT,
+            checkout_request_id TEXT,
+            merchant_request_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT
+        )
+    ''')
+    
+    # News articles table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS news_articles (
+            id {pk},
+            title TEXT NOT NULL,
+            slug TEXT UNIQUE NOT NULL,
+            excerpt TEXT,
+            content TEXT NOT NULL,
+            featured_image TEXT,
+            author TEXT DEFAULT 'Karachuonyo First Team',
+            status TEXT DEFAULT 'draft',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            published_at TIMESTAMP,
+            views INTEGER DEFAULT 0,
+            likes INTEGER DEFAULT 0,
+            shares INTEGER DEFAULT 0,
+            tags TEXT
+        )
+    ''')
+    
+    # Comments table for blog/news articles
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS comments (
+            id {pk},
+            article_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            comment TEXT NOT NULL,
+            approved INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Events table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS events (
+            id {pk},
+            title TEXT NOT NULL,
+            slug TEXT UNIQUE NOT NULL,
+            description TEXT,
+            location TEXT,
+            event_date TIMESTAMP NOT NULL,
+            end_date TIMESTAMP,
+            featured_image TEXT,
+            status TEXT DEFAULT 'upcoming',
+            max_attendees INTEGER,
+            registration_required BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Event registrations table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS event_registrations (
+            id {pk},
+            event_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT,
+            status TEXT DEFAULT 'confirmed',
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT,
+            FOREIGN KEY (event_id) REFERENCES events (id)
+        )
+    ''')
+    
+    # Agenda items table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS agenda_items (
+            id {pk},
+            title TEXT NOT NULL,
+            description TEXT,
+            category TEXT,
+            priority TEXT DEFAULT 'medium',
+            status TEXT DEFAULT 'planned',
+            target_date TIMESTAMP,
+            progress_percentage INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Volunteer registrations table
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS volunteer_registrations (
+            id {pk},
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            location TEXT,
+            skills TEXT,
+            availability TEXT,
+            experience TEXT,
+            motivation TEXT,
+            status TEXT DEFAULT 'pending',
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT
+        )
+    ''')
+    
+    # Databases created by older releases are missing some columns
+    legacy_columns = [
+        ('news_articles', 'likes', 'INTEGER DEFAULT 0'),
+        ('news_articles', 'shares', 'INTEGER DEFAULT 0'),
+        ('donations', 'phone_number', 'TEXT'),
+        ('donations', 'checkout_request_id', 'TEXT'),
+        ('donations', 'merchant_request_id', 'TEXT'),
+    ]
+    for table, column, definition in legacy_columns:
+        if not _column_exists(cursor, table, column, dialect):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Added {column} column to {table} table")
+
+
+def _0002_hot_path_indexes(cursor, dialect):
+    """Secondary indexes for callback lookups, duplicate checks and admin listings"""
+    # newsletter_subscriptions.email is already covered by its UNIQUE constraint's
+    # implicit index, so it does not get a second one here.
+    statements = [
+        'CREATE INDEX IF NOT EXISTS idx_donations_checkout_request_id '
+        'ON donations (checkout_request_id)',
+        'CREATE INDEX IF NOT EXISTS idx_volunteer_registrations_email '
+        'ON volunteer_registrations (email)',
+        'CREATE INDEX IF NOT EXISTS idx_event_registrations_event_email '
+        'ON event_registrations (event_id, email)',
+        'CREATE INDEX IF NOT EXISTS idx_event_registrations_event_status '
+        'ON event_registrations (event_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_contact_submissions_status_submitted '
+        'ON contact_submissions (status, submitted_at)',
+        'CREATE INDEX IF NOT EXISTS idx_news_articles_status_published '
+        'ON news_articles (status, published_at)',
+        'CREATE INDEX IF NOT EXISTS idx_events_status_date '
+        'ON events (status, event_date)',
+    ]
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def _0003_admin_listing_indexes(cursor, dialect):
+    """Indexes matching the keyset sort order of the admin list endpoints"""
+    statements = [
+        'CREATE INDEX IF NOT EXISTS idx_contact_submissions_submitted_id '
+        'ON contact_submissions (submitted_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_donations_created_id '
+        'ON donations (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_donations_status_created '
+        'ON donations (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_donations_method_created '
+        'ON donations (payment_method, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_news_articles_created_id '
+        'ON news_articles (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_events_date_id '
+        'ON events (event_date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_agenda_items_priority_created '
+        'ON agenda_items (priority, created_at, id)',
+    ]
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def _0004_event_registration_count(cursor, dialect):
+    """Denormalized confirmed-registration count on events, back-filled once"""
+    if not _column_exists(cursor, 'events', 'registration_count', dialect):
+        cursor.execute('ALTER TABLE events ADD COLUMN registration_count INTEGER DEFAULT 0')
+
+    cursor.execute('''
+        UPDATE events SET registration_count = (
+            SELECT COUNT(*) FROM event_registrations
+            WHERE event_registrations.event_id = events.id
+              AND event_registrations.status = 'confirmed'
+        )
+    ''')
+
+
+def _0005_unique_event_registration(cursor, dialect):
+    """One registration per email per event, enforced by the database"""
+    # Drop duplicates left by the old check-then-insert race, keeping the first
+    cursor.execute('''
+        DELETE FROM event_registrations
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM event_registrations GROUP BY event_id, email
+        )
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_event_registrations_event_email')
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_event_registrations_event_email '
+        'ON event_registrations (event_id, email)'
+    )
+    _0004_event_registration_count(cursor, dialect)
+
+
+def _0006_news_search(cursor, dialect):
+    """Full-text index over news articles (FTS5 on SQLite, GIN on PostgreSQL)"""
+    if dialect == 'postgresql':
+        # Spelled out as applied: search.PG_DOCUMENT must stay identical to it
+        # for the planner to use this index
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_news_articles_search
+            ON news_articles USING GIN ((
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(tags, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(excerpt, '')), 'C') ||
+                setweight(to_tsvector('english',
+                    regexp_replace(coalesce(content, ''), '<[^>]+>', ' ', 'g')), 'D')
+            ))
+        ''')
+        return
+
+    # rowid is the article id; the triggers call strip_html() (textutils.py),
+    # which db.py registers on every pooled connection
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS news_search USING fts5(
+            title, excerpt, body, tags,
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS news_search_insert AFTER INSERT ON news_articles
+        BEGIN
+            INSERT INTO news_search (rowid, title, excerpt, body, tags)
+            VALUES (new.id, new.title, coalesce(new.excerpt, ''),
+                    strip_html(new.content), coalesce(new.tags, ''));
+        END
+    ''')
+    # Only content columns fire this, so engagement counter updates do not reindex
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS news_search_update
+        AFTER UPDATE OF title, excerpt, content, tags ON news_articles
+        BEGIN
+            DELETE FROM news_search WHERE rowid = old.id;
+            INSERT INTO news_search (rowid, title, excerpt, body, tags)
+            VALUES (new.id, new.title, coalesce(new.excerpt, ''),
+                    strip_html(new.content), coalesce(new.tags, ''));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS news_search_delete AFTER DELETE ON news_articles
+        BEGIN
+            DELETE FROM news_search WHERE rowid = old.id;
+        END
+    ''')
+
+    cursor.execute('DELETE FROM news_search')
+    cursor.execute('''
+        INSERT INTO news_search (rowid, title, excerpt, body, tags)
+        SELECT id, title, coalesce(excerpt, ''), strip_html(content), coalesce(tags, '')
+        FROM news_articles
+    ''')
+    cursor.execute("INSERT INTO news_search (news_search) VALUES ('optimize')")
+
+
+def _0007_email_outbox(cursor, dialect):
+    """Queue of outgoing email delivered by outbox.py workers"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id {_primary_key(dialect)},
+            recipients TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT,
+            body TEXT,
+            sender TEXT,
+            reply_to TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at BIGINT NOT NULL,
+            locked_by TEXT,
+            locked_at BIGINT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_email_outbox_status_next_attempt '
+        'ON email_outbox (status, next_attempt_at, id)'
+    )
+
+
+def _0008_newsletter_broadcasts(cursor, dialect):
+    """Newsletter broadcasts and their per-recipient delivery log (broadcast.py)"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS newsletter_broadcasts (
+            id {_primary_key(dialect)},
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total_recipients INTEGER NOT NULL DEFAULT 0,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            last_subscriber_id INTEGER NOT NULL DEFAULT 0,
+            messages_per_second REAL,
+            locked_by TEXT,
+            heartbeat_at BIGINT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS newsletter_broadcast_recipients (
+            broadcast_id INTEGER NOT NULL REFERENCES newsletter_broadcasts (id) ON DELETE CASCADE,
+            subscriber_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            error TEXT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (broadcast_id, subscriber_id)
+        )
+    ''')
+    # Broadcasts stream active subscribers in id order
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_newsletter_subscriptions_status_id '
+        'ON newsletter_subscriptions (status, id)'
+    )
+
+
+def _0009_donation_status_detail(cursor, dialect):
+    """Reason a donation failed, shown by the status endpoint (donations.py)"""
+    if not _column_exists(cursor, 'donations', 'status_detail', dialect):
+        cursor.execute('ALTER TABLE donations ADD COLUMN status_detail TEXT')
+
+
+def _0010_mpesa_callback_inbox(cursor, dialect):
+    """Raw M-Pesa callbacks (callback_inbox.py) and unique checkout request ids"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS mpesa_callback_inbox (
+            id {_primary_key(dialect)},
+            checkout_request_id TEXT,
+            result_code INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'new',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            received_at BIGINT NOT NULL,
+            next_attempt_at BIGINT NOT NULL,
+            locked_by TEXT,
+            locked_at BIGINT,
+            processed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_mpesa_callback_inbox_status_next_attempt '
+        'ON mpesa_callback_inbox (status, next_attempt_at, id)'
+    )
+
+    # A checkout request belongs to one donation; detach any later duplicates
+    # (their transaction_id still holds the id) so the unique index can be built
+    cursor.execute('''
+        UPDATE donations SET checkout_request_id = NULL
+        WHERE checkout_request_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM donations
+            WHERE checkout_request_id IS NOT NULL
+            GROUP BY checkout_request_id
+        )
+    ''')
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_donations_checkout_request_id '
+        'ON donations (checkout_request_id)'
+    )
+
+
+def _0011_donation_reconciliation(cursor, dialect):
+    """When each open donation is next checked with Daraja (reconcile.py)"""
+    if not _column_exists(cursor, 'donations', 'next_check_at', dialect):
+        cursor.execute('ALTER TABLE donations ADD COLUMN next_check_at BIGINT')
+    if not _column_exists(cursor, 'donations', 'check_attempts', dialect):
+        cursor.execute('ALTER TABLE donations ADD COLUMN check_attempts INTEGER DEFAULT 0')
+    # Donations left pending before this migration are due straight away
+    cursor.execute('''
+        UPDATE donations SET next_check_at = 0
+        WHERE status IN ('pending_init', 'pending') AND next_check_at IS NULL
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_donations_status_next_check '
+        'ON donations (status, next_check_at)'
+    )
+
+
+def _0012_donation_rollups(cursor, dialect):
+    """Completed donation totals per hour, day and overall (fundraising.py)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS donation_rollups (
+            bucket TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            total_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+            donation_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, period_start, payment_method)
+        )
+    ''')
+    # Backfill from the completed donations, with the periods fundraising.py
+    # writes ('2024-05-01T10:00', '2024-05-01' and '' for all time)
+    if dialect == 'postgresql':
+        periods = {
+            'hour': "to_char({moment}, 'YYYY-MM-DD\"T\"HH24:00')",
+            'day': "to_char({moment}, 'YYYY-MM-DD')",
+        }
+    else:
+        periods = {
+            'hour': "strftime('%Y-%m-%dT%H:00', {moment})",
+            'day': "strftime('%Y-%m-%d', {moment})",
+        }
+    periods['all'] = "''"
+    for bucket, period in periods.items():
+        cursor.execute(f'''
+            INSERT INTO donation_rollups (bucket, period_start, payment_method, total_amount, donation_count)
+            SELECT '{bucket}', {period.format(moment='COALESCE(completed_at, created_at)')},
+                   COALESCE(NULLIF(payment_method, ''), 'unknown'), SUM(COALESCE(amount, 0)), COUNT(*)
+            FROM donations
+            WHERE status = 'completed'
+            GROUP BY 2, 3
+        ''')
+
+
+# (version, description, function) - append new migrations, never reorder or edit applied ones
+MIGRATIONS = [
+    (1, 'baseline schema', _0001_baseline_schema),
+    (2, 'hot path indexes', _0002_hot_path_indexes),
+    (3, 'admin listing indexes', _0003_admin_listing_indexes),
+    (4, 'event registration count', _0004_event_registration_count),
+    (5, 'unique event registration', _0005_unique_event_registration),
+    (6, 'news full-text search', _0006_news_search),
+    (7, 'email outbox', _0007_email_outbox),
+    (8, 'newsletter broadcasts', _0008_newsletter_broadcasts),
+    (9, 'donation status detail', _0009_donation_status_detail),
+    (10, 'mpesa callback inbox', _0010_mpesa_callback_inbox),
+    (11, 'donation reconciliation', _0011_donation_reconciliation),
+    (12, 'donation rollups', _0012_donation_rollups),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn):
+    """Highest applied migration version (0 for a fresh database)"""
+    _ensure_version_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def applied_migrations(conn):
+    """List of (version, description, applied_at) already recorded"""
+    _ensure_version_table(conn)
+    return conn.execute(
+        'SELECT version, description, applied_at FROM schema_version ORDER BY version'
+    ).fetchall()
+
+
+def pending_migrations(conn):
+    """Migrations newer than the database's current version"""
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def _lock_for_migration(conn, dialect):
+    """Start a transaction holding the database-wide migration lock"""
+    if dialect == 'postgresql':
+        conn.execute('SELECT pg_advisory_xact_lock(?)', (MIGRATION_LOCK_ID,))
+    else:
+        conn.execute('BEGIN IMMEDIATE')
+
+
+def apply_migrations(conn, dialect='sqlite', target=None):
+    """Apply pending migrations in order, each in its own transaction.
+
+    The migration lock is taken before re-reading the version, so several
+    workers starting at once apply each migration exactly once.
+    """
+    _ensure_version_table(conn)
+    applied = []
+
+    for version, description, migrate in MIGRATIONS:
+        if target is not None and version > target:
+            break
+
+        _lock_for_migration(conn, dialect)
+        try:
+            row = conn.execute(
+                'SELECT 1 FROM schema_version WHERE version = ?', (version,)
+            ).fetchone()
+            if row:
+                conn.rollback()
+                continue
+
+            migrate(conn.cursor(), dialect)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) failed")
+            raise
+
+        logger.info(f"Applied migration {version}: {description}")
+        applied.append(version)
+
+    return applied
+
+
+def main(argv=None):
+    """Command line entry point"""
+    from config import get_settings
+    from db import pool_from_url
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='Karachuonyo database migrations')
+    parser.add_argument('--database-url', default=settings['DATABASE_URL'],
+                        help='Database URL (defaults to DATABASE_URL)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show applied and pending migrations')
+    upgrade = subparsers.add_parser('upgrade', help='Apply pending migrations')
+    upgrade.add_argument('--target', type=int, help='Stop after this version')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    pool = pool_from_url(args.database_url, settings)
+    conn = pool.acquire()
+
+    try:
+        if args.command == 'status':
+            print(f"Database: {pool.dialect}")
+            print(f"Current version: {current_version(conn)}")
+            for version, description, applied_at in applied_migrations(conn):
+                print(f"  [applied] {version:04d} {description} ({applied_at})")
+            for version, description, _ in pending_migrations(conn):
+                print(f"  [pending] {version:04d} {description}")
+        elif args.command == 'upgrade':
+            applied = apply_migrations(conn, pool.dialect, target=args.target)
+            if applied:
+                print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+            else:
+                print('Database is up to date')
+            print(f"Current version: {current_version(conn)}")
+    finally:
+        pool.release(conn)
+        pool.close_all()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
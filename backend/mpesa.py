@@ -1,52 +1,145 @@
 import requests
 import base64
 import json
+import logging
+import threading
+import time
 from datetime import datetime
 import os
 
+from requests.adapters import HTTPAdapter
+
+from outbound import get_guard
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_URL = 'https://sandbox.safaricom.co.ke'
+
+# Refresh the OAuth token this long before Daraja expires it
+TOKEN_REFRESH_MARGIN = 60
+
+# Daraja's STK Push Query answers 500 with this code while the donor has not responded
+STILL_PROCESSING = '500.001.1001'
+
+def _server_error(response):
+    return response.status_code >= 500
+
+def _query_failure(response):
+    return _server_error(response) and STILL_PROCESSING not in response.text
+
 class MPesaAPI:
-    def __init__(self):
+    def __init__(self, base_url=None):
         self.consumer_key = os.getenv('MPESA_CONSUMER_KEY', 'test_key')
         self.consumer_secret = os.getenv('MPESA_CONSUMER_SECRET', 'test_secret')
         self.business_short_code = '174379'  # Test shortcode
         self.passkey = 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919'
-        self.base_url = 'https://sandbox.safaricom.co.ke'
-        self.callback_url = 'https://karachuonyo-backend.onrender.com/api/mpesa/callback'
+        # Safaricom's sandbox unless pointed elsewhere, e.g. at daraja_emulator.py
+        self.base_url = (base_url or os.getenv('MPESA_BASE_URL') or SANDBOX_URL).rstrip('/')
+        self.callback_url = os.getenv('MPESA_CALLBACK_URL') or 'https://karachuonyo-backend.onrender.com/api/mpesa/callback'
         self.access_token = None
-    
-    def get_access_token(self):
+        self.token_expires_at = 0.0  # time.monotonic() deadline
+        self._token_lock = threading.Lock()
+        self.token_refreshes = 0
+
+        # One keep-alive session for all Daraja calls, so donations reuse
+        # pooled TLS connections instead of handshaking every time
+        pool_size = int(os.getenv('MPESA_HTTP_POOL_SIZE') or 10)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        # Timeouts, retries and circuit breaker (reconfigured from app config)
+        self.guard = get_guard('mpesa', read_timeout=15.0)
+
+    def _token_is_fresh(self):
+        return (self.access_token is not None and
+                time.monotonic() < self.token_expires_at - TOKEN_REFRESH_MARGIN)
+
+    def get_access_token(self, rejected=None):
+        """Cached OAuth token, refreshed shortly before it expires.
+
+        Only one thread fetches a new token at a time. While a token is
+        still valid but inside the refresh margin, other threads keep using
+        it instead of waiting. Pass ``rejected`` with a token Daraja refused
+        (401) to force a refresh unless another thread already replaced it.
+        """
+        token = self.access_token
+        if rejected is None and self._token_is_fresh():
+            return token
+
+        still_valid = token is not None and time.monotonic() < self.token_expires_at
+        if rejected is None and still_valid:
+            if not self._token_lock.acquire(blocking=False):
+                return token
+        else:
+            self._token_lock.acquire()
+
+        try:
+            if self.access_token != rejected and self._token_is_fresh():
+                return self.access_token
+            return self._fetch_access_token()
+        finally:
+            self._token_lock.release()
+
+    def _fetch_access_token(self):
         credentials = f"{self.consumer_key}:{self.consumer_secret}"
         encoded = base64.b64encode(credentials.encode()).decode()
-        
+
         headers = {'Authorization': f'Basic {encoded}'}
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
-        
+
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            print(f"Access token request status: {response.status_code}")
-            print(f"Access token response: {response.text}")
-            
+            response = self.guard.call(
+                self.session.get, url, headers=headers, timeout=self.guard.timeout,
+                is_failure=_server_error
+            )
+            logger.info(f"Access token request status: {response.status_code}")
+
             if response.status_code == 200:
-                self.access_token = response.json()['access_token']
+                data = response.json()
+                self.access_token = data['access_token']
+                self.token_expires_at = time.monotonic() + int(data.get('expires_in') or 3599)
+                self.token_refreshes += 1
                 return self.access_token
             else:
-                print(f"Failed to get access token. Status: {response.status_code}, Response: {response.text}")
+                logger.error(f"Failed to get access token. Status: {response.status_code}, Response: {response.text}")
                 raise Exception(f'Failed to get access token: {response.status_code} - {response.text}')
         except requests.exceptions.RequestException as e:
-            print(f"Request exception: {e}")
+            logger.error(f"Request exception: {e}")
             raise Exception(f'Network error getting access token: {str(e)}')
-    
-    def stk_push(self, phone, amount, account_ref, description):
-        if not self.access_token:
-            self.get_access_token()
-        
+
+    def _post(self, path, payload, idempotent=False, is_failure=_server_error):
+        """POST to Daraja with the cached token, refreshing it once on a 401"""
+        url = f"{self.base_url}{path}"
+        token = self.get_access_token()
+        for attempt in range(2):
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json'
+            }
+            # STK pushes are not idempotent: retried only if never sent
+            response = self.guard.call(
+                self.session.post, url, json=payload, headers=headers,
+                timeout=self.guard.timeout, idempotent=idempotent, is_failure=is_failure
+            )
+            if response.status_code != 401 or attempt:
+                return response
+            logger.warning("Daraja rejected the access token; refreshing")
+            token = self.get_access_token(rejected=token)
+
+    def _password(self):
+        """(password, timestamp) pair Daraja expects on STK requests"""
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = base64.b64encode(f"{self.business_short_code}{self.passkey}{timestamp}".encode()).decode()
-        
+        return password, timestamp
+
+    def stk_push(self, phone, amount, account_ref, description):
+        password, timestamp = self._password()
+
         # Format phone number
         if phone.startswith('0'):
             phone = '254' + phone[1:]
-        
+
         payload = {
             'BusinessShortCode': self.business_short_code,
             'Password': password,
@@ -60,15 +153,37 @@ class MPesaAPI:
             'AccountReference': account_ref,
             'TransactionDesc': description
         }
-        
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
+
+        response = self._post('/mpesa/stkpush/v1/processrequest', payload)
+
+        return response.json()
+
+    def stk_push_query(self, checkout_request_id):
+        """Outcome of an STK push, for donations whose callback never came.
+
+        Returns Daraja's JSON: ``ResultCode`` once the donor has paid or
+        the request failed, or ``errorCode`` STILL_PROCESSING before that.
+        """
+        password, timestamp = self._password()
+        payload = {
+            'BusinessShortCode': self.business_short_code,
+            'Password': password,
+            'Timestamp': timestamp,
+            'CheckoutRequestID': checkout_request_id
         }
-        
-        url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
-        response = requests.post(url, json=payload, headers=headers)
-        
+        # Queries change nothing, so they are retried like GETs
+        response = self._post('/mpesa/stkpushquery/v1/query', payload,
+                              idempotent=True, is_failure=_query_failure)
         return response.json()
 
-mpesa = MPesaAPI()
\ No newline at end of file
+    def stats(self):
+        """Token cache state for /health (never the token itself)"""
+        remaining = self.token_expires_at - time.monotonic() if self.access_token else 0
+        return {
+            'base_url': self.base_url,
+            'token_cached': self.access_token is not None,
+            'token_expires_in': max(int(remaining), 0),
+            'token_refreshes': self.token_refreshes
+        }
+
+mpesa = MPesaAPI()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo News Catalog
+Published articles from the database and the seed list, indexed in memory
+
+The catalog keeps every published article keyed by slug, plus date-sorted
+indexes (all articles and one per category) of precomputed summaries, so
+/api/news and /api/news/categories only slice a list per request. Database
+articles win over seed articles with the same slug. A database article's
+category is its first tag, title-cased, matching the seed articles.
+
+Admin writes update the indexes of the worker that made them in place. Other
+workers notice through a version counter in the shared memory segment and
+reload from the database on their next read.
+"""
+
+import bisect
+import logging
+import threading
+from datetime import datetime
+
+from textutils import strip_html
+from sharedmem import SegmentBusy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEWS_LIMIT = 10
+MAX_NEWS_LIMIT = 50
+VERSION_KEY = 'news:catalog_version'
+WORDS_PER_MINUTE = 200
+
+_ARTICLE_COLUMNS = '''
+    id, title, slug, excerpt, content, featured_image, author,
+    created_at, updated_at, published_at, tags
+'''
+
+
+class NewsQueryError(ValueError):
+    """Raised for malformed list parameters"""
+
+
+def parse_list_args(args):
+    """Turn request args into (category, limit, offset)"""
+    try:
+        limit = int(args.get('limit', DEFAULT_NEWS_LIMIT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise NewsQueryError('limit and offset must be integers')
+    if limit < 1 or offset < 0:
+        raise NewsQueryError('limit must be at least 1 and offset not negative')
+
+    return args.get('category') or None, min(limit, MAX_NEWS_LIMIT), offset
+
+
+def _sort_key(timestamp):
+    """Comparable form of the ISO-ish timestamps used by both sources"""
+    return str(timestamp or '').replace(' ', 'T').rstrip('Z')[:19]
+
+
+def _display_date(timestamp):
+    try:
+        moment = datetime.fromisoformat(_sort_key(timestamp))
+    except ValueError:
+        return None
+    return f'{moment:%B} {moment.day}, {moment.year}'
+
+
+def _article_from_row(row):
+    """Database row -> article dict shaped like a seed article"""
+    tags = [tag.strip() for tag in (row[10] or '').split(',') if tag.strip()]
+    words = len(strip_html(row[4]).split())
+    published = row[9] or row[7]
+    return {
+        'id': row[0],
+        'slug': row[2],
+        'title': row[1],
+        'date': _display_date(published),
+        'category': tags[0].title() if tags else None,
+        'author': row[6],
+        'excerpt': row[3],
+        'content': row[4],
+        'read_time': f'{max(1, round(words / WORDS_PER_MINUTE))} min read',
+        'tags': tags,
+        'featured_image': row[5],
+        'published': True,
+        'created_at': row[7],
+        'updated_at': row[8],
+        'published_at': row[9]
+    }
+
+
+class NewsCatalog:
+    """In-memory, pre-sorted index of published news articles"""
+
+    def __init__(self, pool, seed_articles, segment=None):
+        self.pool = pool
+        self.segment = segment
+        self._seeds = {}
+        for slug, article in seed_articles.items():
+            if article.get('published', False):
+                self._seeds[slug] = dict(article, slug=slug)
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = 0
+        self._reloads = 0
+        self._incremental_updates = 0
+
+    # Index maintenance (caller holds self._lock)
+
+    def _reset(self):
+        self._articles = {}     # slug -> full article
+        self._summaries = {}    # slug -> article without content
+        self._db_slugs = {}     # database id -> slug
+        self._order = []        # ascending (sort key, slug) over all articles
+        self._by_category = {}  # lower-case category -> ascending (sort key, slug)
+        self._categories = {}   # lower-case category -> display name
+
+    def _entry(self, article):
+        return (_sort_key(article.get('published_at') or article.get('created_at')), article['slug'])
+
+    def _insert(self, article):
+        slug = article['slug']
+        self._articles[slug] = article
+        summary = dict(article)
+        summary.pop('content', None)
+        self._summaries[slug] = summary
+
+        entry = self._entry(article)
+        bisect.insort(self._order, entry)
+        category = (article.get('category') or '').lower()
+        if category:
+            bisect.insort(self._by_category.setdefault(category, []), entry)
+            self._categories.setdefault(category, article['category'])
+
+    def _remove(self, slug):
+        article = self._articles.pop(slug, None)
+        if article is None:
+            return
+        self._summaries.pop(slug)
+
+        entry = self._entry(article)
+        self._order.remove(entry)
+        category = (article.get('category') or '').lower()
+        if category:
+            entries = self._by_category[category]
+            entries.remove(entry)
+            if not entries:
+                del self._by_category[category]
+                del self._categories[category]
+
+    def _fetch(self, conn, article_id=None):
+        sql = f"SELECT {_ARTICLE_COLUMNS} FROM news_articles WHERE status = 'published'"
+        params = ()
+        if article_id is not None:
+            sql += ' AND id = ?'
+            params = (article_id,)
+        return [_article_from_row(row) for row in conn.execute(sql, params).fetchall()]
+
+    def _shared_version(self):
+        if self.segment is None:
+            return self._version
+        try:
+            return self.segment.get_counter(VERSION_KEY)
+        except SegmentBusy:
+            return self._version  # keep serving this worker's copy
+
+    def _reload(self):
+        """Rebuild every index from the database and the seed articles"""
+        version = self._shared_version()
+        conn = self.pool.acquire()
+        try:
+            db_articles = self._fetch(conn)
+        finally:
+            self.pool.release(conn)
+
+        self._reset()
+        for article in db_articles:
+            self._db_slugs[article['id']] = article['slug']
+            self._insert(article)
+        for slug, article in self._seeds.items():
+            if slug not in self._articles:
+                self._insert(article)
+
+        self._version = version
+        self._loaded = True
+        self._reloads += 1
+        logger.info(f"News catalog loaded: {len(self._articles)} articles")
+
+    def _sync(self):
+        """Load on first use, or reload after another worker changed the catalog"""
+        if self._loaded and self._shared_version() == self._version:
+            return
+        with self._lock:
+            if not self._loaded or self._shared_version() != self._version:
+                self._reload()
+
+    def _bump_version(self):
+        if self.segment is None:
+            self._version += 1
+            return
+        try:
+            version = self.segment.incr(VERSION_KEY)
+        except SegmentBusy:
+            # Other workers cannot be told; at least reload this one
+            self._loaded = False
+            return
+        if version != self._version + 1:
+            # Another worker changed the catalog meanwhile; pick that up on next read
+            self._loaded = False
+        self._version = version
+
+    # Reads
+
+    def list(self, category=None, limit=DEFAULT_NEWS_LIMIT, offset=0):
+        """One page of summaries, newest first; returns (summaries, total)"""
+        self._sync()
+        with self._lock:
+            entries = self._order if not category else self._by_category.get(category.lower(), [])
+            total = len(entries)
+            end = max(total - offset, 0)
+            page = entries[max(end - limit, 0):end]
+            return [self._summaries[slug] for _, slug in reversed(page)], total
+
+    def get(self, key):
+        """Full article by slug or database id, or None"""
+        self._sync()
+        with self._lock:
+            if key in self._articles:
+                return self._articles[key]
+            try:
+                slug = self._db_slugs.get(int(key))
+            except (TypeError, ValueError):
+                return None
+            return self._articles.get(slug)
+
+    def categories(self):
+        """Display names of categories with at least one published article"""
+        self._sync()
+        with self._lock:
+            return sorted(self._categories.values())
+
+    # Admin writes
+
+    def article_changed(self, article_id):
+        """Re-index one database article after it was created or updated"""
+        with self._lock:
+            if self._loaded:
+                conn = self.pool.acquire()
+                try:
+                    articles = self._fetch(conn, article_id)
+                finally:
+                    self.pool.release(conn)
+
+                self._drop_db_article(article_id)
+                for article in articles:
+                    self._remove(article['slug'])
+                    self._db_slugs[article_id] = article['slug']
+                    self._insert(article)
+                self._incremental_updates += 1
+            self._bump_version()
+
+    def article_deleted(self, article_id):
+        """Drop a database article, uncovering any seed article it replaced"""
+        with self._lock:
+            if self._loaded:
+                self._drop_db_article(article_id)
+                self._incremental_updates += 1
+            self._bump_version()
+
+    def _drop_db_article(self, article_id):
+        slug = self._db_slugs.pop(article_id, None)
+        if slug is None:
+            return
+        self._remove(slug)
+        if slug in self._seeds:
+            self._insert(self._seeds[slug])
+
+    def stats(self):
+        """Snapshot of catalog size and maintenance counters"""
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'articles': len(self._articles) if self._loaded else 0,
+                'categories': len(self._categories) if self._loaded else 0,
+                'version': self._version,
+                'reloads': self._reloads,
+                'incremental_updates': self._incremental_updates
+            }
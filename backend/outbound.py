@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Outbound Call Guard
+Timeouts, bounded retries and circuit breakers for external dependencies
+
+Every call to M-Pesa (Daraja) or the SMTP relay goes through an
+OutboundGuard named after the dependency. The guard supplies connect/read
+timeouts and retries failures a bounded number of times with jittered
+exponential backoff. Its circuit breaker opens after
+failure_threshold consecutive failures: calls are then rejected at once
+with CircuitOpenError instead of tying up a worker. After reset_timeout one
+trial call is let through (half-open), and its result closes or re-opens
+the circuit.
+
+Only calls that are safe to repeat are retried after a read failure; others
+(an STK push) are retried only when the connection was never established.
+
+RateLimiter paces calls that must stay under a provider's rate, such as
+newsletter sends and STK Push queries, across all the threads making them.
+
+Breaker state is per process. Each gunicorn worker notices a degraded
+dependency after its own first few failures.
+"""
+
+import logging
+import random
+import smtplib
+import socket
+import threading
+import time
+
+import requests
+from flask_mail import Connection
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    def allow(self):
+        """Whether a call may go ahead now (claims the half-open trial)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self.state = CLOSED
+
+    def release(self):
+        """End a call that says nothing about the dependency's health"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed (0 unless open)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+
+class RateLimiter:
+    """Token bucket shared by all calling threads (rate 0 = unlimited)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class OutboundGuard:
+    """Timeouts, retries and a circuit breaker for one external dependency"""
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff_base=0.25, backoff_max=2.0, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(
+            ('calls', 'successes', 'failures', 'retries', 'timeouts', 'rejected'), 0
+        )
+        self._last_error = None
+
+    @property
+    def timeout(self):
+        """(connect, read) tuple in the form requests accepts"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_base * 2 ** attempt, self.backoff_max)
+        return random.uniform(delay / 2, delay)
+
+    def call(self, fn, *args, retries=None, idempotent=True, is_failure=None, **kwargs):
+        """Call ``fn`` under the breaker, retrying failures with backoff.
+
+        ``is_failure(result)`` marks a returned value (e.g. a 5xx response)
+        as a failure; the last such value is returned once retries run out.
+        Non-idempotent calls are retried only for connection failures.
+        """
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('rejected')
+                raise CircuitOpenError(
+                    f'{self.name} unavailable (circuit open, retry in '
+                    f'{self.breaker.retry_after():.0f}s)'
+                )
+
+            self._count('calls')
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # A refused recipient or a bug: neither an outage nor proof of health
+                    self.breaker.release()
+                    raise
+                self._failed(e)
+                if attempt >= retries or not (idempotent or is_connect_error(e)):
+                    raise
+            else:
+                if is_failure is None or not is_failure(result):
+                    self.breaker.record_success()
+                    self._count('successes')
+                    return result
+                self._failed(f'unsuccessful response: {getattr(result, "status_code", result)}')
+                if attempt >= retries or not idempotent:
+                    return result
+
+            attempt += 1
+            self._count('retries')
+            time.sleep(self._backoff(attempt - 1))
+
+    def _failed(self, error):
+        self.breaker.record_failure()
+        self._count('failures')
+        if is_timeout(error):
+            self._count('timeouts')
+        with self._lock:
+            self._last_error = str(error)[:200]
+        logger.warning(f"Outbound call to {self.name} failed: {error}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['last_error'] = self._last_error
+        stats.update({
+            'state': self.breaker.state,
+            'times_opened': self.breaker.times_opened,
+            'retry_after': round(self.breaker.retry_after(), 1),
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout
+        })
+        return stats
+
+
+def is_timeout(error):
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return True
+    return isinstance(error, requests.exceptions.Timeout)
+
+
+def is_connect_error(error):
+    """The request never reached the dependency, so repeating it is safe"""
+    if isinstance(error, (ConnectionRefusedError, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests wraps urllib3's MaxRetryError, whose reason is the real failure
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def is_transient(error):
+    """Network-level and temporary SMTP failures; not programming errors"""
+    # SMTP errors subclass OSError, so they are classified before it
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    if isinstance(error, OSError):
+        return True
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def _open_smtp(mail, timeout):
+    """Flask-Mail's configure_host, plus the socket timeout it does not set"""
+    if mail.use_ssl:
+        host = smtplib.SMTP_SSL(mail.server, mail.port, timeout=timeout)
+    else:
+        host = smtplib.SMTP(mail.server, mail.port, timeout=timeout)
+    host.set_debuglevel(int(mail.debug))
+    if mail.use_tls:
+        host.starttls()
+    if mail.username and mail.password:
+        host.login(mail.username, mail.password)
+    return host
+
+
+class GuardedConnection(Connection):
+    """Flask-Mail connection opening its SMTP host with the guard's timeout"""
+
+    def __init__(self, mail, guard, guarded):
+        super().__init__(mail)
+        self.guard = guard
+        self.guarded = guarded
+
+    def configure_host(self):
+        timeout = self.guard.connect_timeout + self.guard.read_timeout
+        if self.guarded:
+            return self.guard.call(_open_smtp, self.mail, timeout, retries=0)
+        return _open_smtp(self.mail, timeout)
+
+
+class GuardedMail:
+    """Flask-Mail replacement whose SMTP connections use the guard's timeout and breaker"""
+
+    def __init__(self, state, guard):
+        self.state = state
+        self.guard = guard
+
+    def connect(self):
+        """Connection for a batch of sends; opening it goes through the breaker"""
+        return GuardedConnection(self.state, self.guard, guarded=True)
+
+    def send(self, message):
+        """Send one message on its own connection, retrying transient failures"""
+        def send_once():
+            with GuardedConnection(self.state, self.guard, guarded=False) as connection:
+                connection.send(message)
+        self.guard.call(send_once)
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(name, **options):
+    """The process-wide guard for dependency ``name`` (created on first use)"""
+    with _guards_lock:
+        if name not in _guards:
+            _guards[name] = OutboundGuard(name, **options)
+        return _guards[name]
+
+
+def configure_guard(name, failure_threshold=None, reset_timeout=None, **options):
+    """Create or reconfigure the guard for ``name`` from application config"""
+    guard = get_guard(name)
+    for key, value in options.items():
+        setattr(guard, key, value)
+    if failure_threshold is not None:
+        guard.breaker.failure_threshold = failure_threshold
+    if reset_timeout is not None:
+        guard.breaker.reset_timeout = reset_timeout
+    return guard
+
+
+def guard_stats():
+    """State and counters of every guard, for /health"""
+    with _guards_lock:
+        guards = dict(_guards)
+    return {name: guard.stats() for name, guard in guards.items()}
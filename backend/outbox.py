@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Email Outbox
+Durable queue of outgoing email, delivered by background workers
+
+Handlers call enqueue() inside their own transaction, so a notification is
+stored if and only if the submission that caused it is, and the request
+returns without touching SMTP. OutboxWorker claims due rows in batches,
+sends them over one reused SMTP connection, retries failures with
+exponential backoff and marks a message 'dead' after OUTBOX_MAX_ATTEMPTS.
+Rows left 'sending' by a crashed worker are released after a lease expires.
+
+The worker runs as a thread in each web process (OUTBOX_WORKER=thread) or
+as a separate process:
+
+    python outbox.py run        deliver until interrupted
+    python outbox.py status     queue depth by status
+    python outbox.py retry-dead requeue dead-lettered messages
+"""
+
+import argparse
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import ExitStack
+
+from flask_mail import Message
+
+from outbound import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('pending', 'sending', 'sent', 'dead')
+
+# Sent rows are kept, so /health counts only the rest, each off the status index
+UNDELIVERED_STATUSES = ('pending', 'sending', 'dead')
+
+
+def is_dev_mail():
+    """Development mode with the placeholder account only logs email"""
+    return (os.environ.get('FLASK_ENV') == 'development' and
+            os.environ.get('MAIL_USERNAME') == 'test@example.com')
+
+
+def enqueue(conn, message, delay=0):
+    """Queue a flask_mail Message on ``conn`` (committed by the caller)"""
+    conn.execute('''
+        INSERT INTO email_outbox
+        (recipients, subject, html, body, sender, reply_to, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        ','.join(message.recipients),
+        message.subject,
+        message.html,
+        message.body,
+        message.sender if isinstance(message.sender, str) else None,
+        message.reply_to,
+        int(time.time()) + delay
+    ))
+
+
+def queue_depth(conn):
+    """Undelivered message counts by status plus the age of the oldest due message"""
+    depth = {}
+    for status in UNDELIVERED_STATUSES:
+        depth[status] = conn.execute(
+            'SELECT COUNT(*) FROM email_outbox WHERE status = ?', (status,)
+        ).fetchone()[0]
+
+    oldest = conn.execute(
+        "SELECT MIN(next_attempt_at) FROM email_outbox WHERE status = 'pending'"
+    ).fetchone()[0]
+    depth['oldest_pending_seconds'] = max(int(time.time()) - oldest, 0) if oldest else 0
+    return depth
+
+
+class OutboxWorker:
+    """Claims due outbox rows and delivers them over a shared SMTP connection"""
+
+    def __init__(self, app, mail, pool, batch_size=50, poll_interval=2.0, max_attempts=6,
+                 retry_base=30, retry_max=3600, lease_seconds=300):
+        self.app = app
+        self.mail = mail
+        self.pool = pool
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._pid = None
+        self._thread = None
+        self._sent = 0
+        self._retried = 0
+        self._dead = 0
+        self._last_error = None
+
+    @classmethod
+    def from_config(cls, app, mail, pool):
+        config = app.config
+        return cls(
+            app, mail, pool,
+            batch_size=config.get('OUTBOX_BATCH_SIZE', 50),
+            poll_interval=config.get('OUTBOX_POLL_INTERVAL', 2.0),
+            max_attempts=config.get('OUTBOX_MAX_ATTEMPTS', 6),
+            retry_base=config.get('OUTBOX_RETRY_BASE', 30),
+            retry_max=config.get('OUTBOX_RETRY_MAX', 3600),
+            lease_seconds=config.get('OUTBOX_LEASE_SECONDS', 300)
+        )
+
+    # Background thread
+
+    def start(self):
+        """Start the delivery thread in this process (after any fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.worker_id = f'{socket.gethostname()}:{self._pid}'
+                self._stopped = False
+                self._thread = threading.Thread(target=self.run, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """Wake this process's worker after enqueueing (no-op without a thread)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        """Deliver until stopped, polling for due messages between batches"""
+        while not self._stopped:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Outbox delivery failed: {e}")
+
+    # Delivery
+
+    def drain(self):
+        """Deliver due messages until none are left; returns how many were sent"""
+        sent = 0
+        guard = getattr(self.mail, 'guard', None)
+        if guard is not None and guard.breaker.retry_after() > 0:
+            return 0  # relay circuit open; wait for the next trial window
+        self._release_expired()
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        with self.app.app_context(), ExitStack() as stack:
+            smtp = None
+            if not is_dev_mail():
+                try:
+                    smtp = stack.enter_context(self.mail.connect())
+                except CircuitOpenError as e:
+                    # The relay is known to be down: hand the batch back untouched
+                    logger.warning(f"Outbox delivery paused: {e}")
+                    self._unclaim(rows)
+                    return 0
+                except Exception as e:
+                    # No connection at all: every claimed message is retried later
+                    self._finish([], [(row, str(e)) for row in rows])
+                    return 0
+
+            while rows:
+                delivered, failed = self._deliver(smtp, rows)
+                self._finish(delivered, failed)
+                sent += len(delivered)
+                rows = self._claim() if not self._stopped else []
+        return sent
+
+    def _deliver(self, smtp, rows):
+        delivered, failed = [], []
+        for row in rows:
+            message = Message(
+                subject=row[2],
+                recipients=row[1].split(','),
+                html=row[3],
+                body=row[4],
+                sender=row[5] or self.app.config.get('MAIL_DEFAULT_SENDER'),
+                reply_to=row[6]
+            )
+            try:
+                if smtp is None:
+                    logger.info(f"[DEV MODE] Email would be sent to {message.recipients}: {message.subject}")
+                else:
+                    smtp.send(message)
+                delivered.append(row)
+            except Exception as e:
+                failed.append((row, str(e)))
+        return delivered, failed
+
+    def _claim(self):
+        """Mark up to batch_size due messages as ours and return them"""
+        now = int(time.time())
+        conn = self.pool.acquire()
+        try:
+            # Re-checking status in the outer WHERE makes concurrent claims safe
+            conn.execute('''
+                UPDATE email_outbox SET status = 'sending', locked_by = ?, locked_at = ?
+                WHERE status = 'pending' AND id IN (
+                    SELECT id FROM email_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT ?
+                )
+            ''', (self.worker_id, now, now, self.batch_size))
+            conn.commit()
+            return conn.execute('''
+                SELECT id, recipients, subject, html, body, sender, reply_to, attempts
+                FROM email_outbox
+                WHERE status = 'sending' AND locked_by = ? AND locked_at = ?
+                ORDER BY id
+            ''', (self.worker_id, now)).fetchall()
+        finally:
+            self.pool.release(conn)
+
+    def _finish(self, delivered, failed):
+        now = int(time.time())
+        retry, dead = [], []
+        for row, error in failed:
+            attempts = row[7] + 1
+            if attempts >= self.max_attempts:
+                dead.append((attempts, error[:500], row[0]))
+            else:
+                delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+                delay += random.uniform(0, delay / 4)
+                retry.append((attempts, error[:500], now + int(delay), row[0]))
+
+        conn = self.pool.acquire()
+        try:
+            if delivered:
+                conn.executemany('''
+                    UPDATE email_outbox
+                    SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP,
+                        locked_by = NULL, locked_at = NULL, last_error = NULL
+                    WHERE id = ?
+                ''', [(row[0],) for row in delivered])
+            if retry:
+                conn.executemany('''
+                    UPDATE email_outbox
+                    SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?,
+                        locked_by = NULL, locked_at = NULL
+                    WHERE id = ?
+                ''', retry)
+            if dead:
+                conn.executemany('''
+                    UPDATE email_outbox
+                    SET status = 'dead', attempts = ?, last_error = ?,
+                        locked_by = NULL, locked_at = NULL
+                    WHERE id = ?
+                ''', dead)
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+        with self._lock:
+            self._sent += len(delivered)
+            self._retried += len(retry)
+            self._dead += len(dead)
+            if failed:
+                self._last_error = failed[-1][1]
+        for attempts, error, row_id in dead:
+            logger.error(f"Outbox message {row_id} dead-lettered after {attempts} attempts: {error}")
+
+    def _unclaim(self, rows):
+        conn = self.pool.acquire()
+        try:
+            conn.executemany('''
+                UPDATE email_outbox SET status = 'pending', locked_by = NULL, locked_at = NULL
+                WHERE id = ? AND status = 'sending'
+            ''', [(row[0],) for row in rows])
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+    def _release_expired(self):
+        """Return messages claimed by a worker that never finished them"""
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                UPDATE email_outbox SET status = 'pending', locked_by = NULL, locked_at = NULL
+                WHERE status = 'sending' AND locked_at < ?
+            ''', (int(time.time()) - self.lease_seconds,))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+    def retry_dead(self):
+        """Requeue every dead-lettered message with a fresh attempt budget"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('''
+                UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE status = 'dead'
+            ''', (int(time.time()),))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            self.pool.release(conn)
+
+    def stats(self):
+        """Queue depth plus this process's delivery counters"""
+        conn = self.pool.acquire()
+        try:
+            depth = queue_depth(conn)
+        finally:
+            self.pool.release(conn)
+        with self._lock:
+            depth.update({
+                'worker_running': self._thread is not None and self._pid == os.getpid(),
+                'sent_by_this_process': self._sent,
+                'retried_by_this_process': self._retried,
+                'dead_by_this_process': self._dead,
+                'last_error': self._last_error
+            })
+        return depth
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo email outbox')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('run', help='Deliver queued email until interrupted')
+    subparsers.add_parser('status', help='Show queue depth')
+    subparsers.add_parser('retry-dead', help='Requeue dead-lettered email')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import app, outbox_worker
+
+    if args.command == 'run':
+        logger.info(f"Outbox worker {outbox_worker.worker_id} started")
+        try:
+            outbox_worker.run()
+        except KeyboardInterrupt:
+            outbox_worker.stop()
+    elif args.command == 'status':
+        for key, value in outbox_worker.stats().items():
+            print(f"{key}: {value}")
+    elif args.command == 'retry-dead':
+        print(f"Requeued {outbox_worker.retry_dead()} messages")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Keyset Pagination
+Cursor-based paging and server-side filtering for admin list endpoints
+
+Query parameters understood by parse_page_args():
+    after          opaque cursor returned as next_cursor by the previous page
+    limit          page size (bounded by MAX_PAGE_SIZE)
+    status         exact match on the table's status column
+    payment_method exact match (donations only)
+    from, to       inclusive/exclusive bounds on the table's date column, as
+                   an ISO date or datetime ('T' or space separated)
+    q              case-insensitive text match over the searchable columns
+    include_total  set to 1 to also count all rows matching the filters
+
+Every list endpoint answers with page_body(): its rows under a key named
+after the collection, plus next_cursor, has_more and total (also sent as
+the X-Next-Cursor and X-Total-Count headers).
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class PaginationError(ValueError):
+    """Raised for malformed cursors or page parameters"""
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page"""
+    values = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor()"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise PaginationError('Invalid cursor') from e
+
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError('Invalid cursor')
+    return values
+
+
+def _date_bound(column, operator, value, param, dialect):
+    """Filter comparing a date column with a from/to bound"""
+    text = value.strip()
+    try:
+        if len(text) == 10:
+            # A bare date sorts before every time that day in either stored format
+            return (f'{column} {operator} ?', (date.fromisoformat(text).isoformat(),))
+        moment = datetime.fromisoformat(text).replace(tzinfo=None).isoformat(sep=' ')
+    except ValueError:
+        raise PaginationError(f'{param} must be an ISO date or datetime')
+    if dialect == 'sqlite':
+        # SQLite keeps dates as text, written both 'T' and space separated
+        return (f'julianday({column}) {operator} julianday(?)', (moment,))
+    return (f'{column} {operator} ?', (moment,))
+
+
+def parse_page_args(args, spec, dialect='sqlite'):
+    """Turn request args into (filters, after, limit, include_total).
+
+    ``spec`` describes which filters a table supports:
+        {'status': 'status', 'payment_method': 'payment_method',
+         'date': 'created_at', 'search': ['name', 'email']}
+    Each filter is returned as a (sql_fragment, params) pair.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be at least 1')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    filters = []
+
+    for param in ('status', 'payment_method'):
+        column = spec.get(param)
+        value = args.get(param)
+        if column and value:
+            filters.append((f'{column} = ?', (value,)))
+
+    date_column = spec.get('date')
+    if date_column:
+        for param, operator in (('from', '>='), ('to', '<')):
+            if args.get(param):
+                filters.append(_date_bound(date_column, operator, args[param], param, dialect))
+
+    search_columns = spec.get('search')
+    query = (args.get('q') or '').strip()
+    if search_columns and query:
+        escaped = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f'%{escaped}%'
+        clause = ' OR '.join(f"LOWER({column}) LIKE ? ESCAPE '\\'" for column in search_columns)
+        filters.append((f'({clause})', (pattern,) * len(search_columns)))
+
+    include_total = args.get('include_total', '').lower() in ('1', 'true', 'yes')
+
+    return filters, args.get('after'), limit, include_total
+
+
+def keyset_page(cursor, table, columns, sort_columns, filters=None, after=None,
+                limit=DEFAULT_PAGE_SIZE, include_total=False):
+    """Fetch one page of ``table`` ordered by ``sort_columns`` descending.
+
+    ``sort_columns`` must be a unique key (end it with ``id``) and every sort
+    column must appear in ``columns``. Returns (rows, next_cursor, total);
+    total is None unless include_total is set.
+    """
+    filters = list(filters or [])
+    where = [fragment for fragment, _ in filters]
+    params = [value for _, values in filters for value in values]
+
+    total = None
+    if include_total:
+        count_sql = f'SELECT COUNT(*) FROM {table}'
+        if where:
+            count_sql += ' WHERE ' + ' AND '.join(where)
+        cursor.execute(count_sql, params)
+        total = cursor.fetchone()[0]
+
+    if after:
+        values = decode_cursor(after, len(sort_columns))
+        placeholders = ', '.join('?' for _ in sort_columns)
+        where.append(f"({', '.join(sort_columns)}) < ({placeholders})")
+        params.extend(values)
+
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{column} DESC' for column in sort_columns)
+    # Fetch one extra row to learn whether another page exists
+    sql += ' LIMIT ?'
+    params.append(limit + 1)
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        positions = [columns.index(column) for column in sort_columns]
+        next_cursor = encode_cursor([rows[-1][i] for i in positions])
+
+    return rows, next_cursor, total
+
+
+def page_headers(next_cursor, total):
+    """Response headers carrying pagination state for list-shaped payloads"""
+    headers = {}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        headers['X-Total-Count'] = str(total)
+    return headers
+
+
+def page_body(key, items, next_cursor, total):
+    """JSON body shared by every paginated admin list"""
+    return {
+        key: items,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'total': total
+    }
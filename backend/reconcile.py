@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Donation Reconciliation
+Settles donations whose M-Pesa callback never arrived
+
+Every open donation carries next_check_at, set when it is recorded and
+again when its STK push is accepted. DonationSweeper periodically takes
+the 'pending' donations that are due, off the (status, next_check_at)
+index, and asks Daraja's STK Push Query API for their outcome from a few
+threads over the shared MPesaAPI session, paced by a rate limit. Paid and
+failed donations are settled together in one transaction, which also adds
+the paid ones to the fundraising rollups. Donations the donor has not
+answered yet are checked again with exponential backoff, and given up as
+failed after max_checks queries. 'pending_init' donations that are due
+were never pushed (their process died, or the push queue outlasted its
+worst case), and due 'pushing' ones lost their process mid-push; both
+are failed without a query. Giving up is not final for the donor: the
+failed row keeps its checkout id (a push still in flight records it
+when it returns), so a successful callback that arrives later still
+completes the donation (see callback_inbox.py).
+
+Rows are claimed by moving next_check_at forward with a compare-and-set,
+so sweepers in several processes never query the same donation at once.
+
+    python reconcile.py run      sweep every MPESA_SWEEP_INTERVAL seconds
+    python reconcile.py once     one sweep, then print its metrics
+    python reconcile.py status   backlog and counters
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fundraising import record_completed
+from mpesa import STILL_PROCESSING
+from outbound import CircuitOpenError, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+NEVER_PUSHED = 'The M-Pesa prompt was never sent, please try again'
+NOT_CONFIRMED = 'M-Pesa did not confirm this payment'
+
+
+def backlog(conn, now=None):
+    """Open donations overdue for a check, by status"""
+    now = int(time.time()) if now is None else now
+    counts = {}
+    for status in ('pending_init', 'pushing', 'pending'):
+        counts[status] = conn.execute(
+            'SELECT COUNT(*) FROM donations WHERE status = ? AND next_check_at <= ?',
+            (status, now)
+        ).fetchone()[0]
+    return counts
+
+
+class DonationSweeper:
+    """Queries Daraja for stale pending donations and settles them in bulk"""
+
+    def __init__(self, pool, api, initiator=None, interval=60, batch_size=50, concurrency=4,
+                 rate_limit=5, max_checks=10, retry_base=60, retry_max=3600, lease_seconds=300):
+        self.pool = pool
+        self.api = api
+        self.initiator = initiator
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate_limit)
+        self.max_checks = max_checks
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._pid = None
+        self._thread = None
+        self._counts = dict.fromkeys(
+            ('sweeps', 'queried', 'completed', 'failed', 'expired', 'rescheduled', 'errors'), 0
+        )
+        self._last_sweep = None
+        self._last_error = None
+
+    @classmethod
+    def from_config(cls, app, pool, api, initiator=None):
+        config = app.config
+        return cls(
+            pool, api, initiator,
+            interval=config.get('MPESA_SWEEP_INTERVAL', 60),
+            batch_size=config.get('MPESA_SWEEP_BATCH_SIZE', 50),
+            concurrency=config.get('MPESA_SWEEP_CONCURRENCY', 4),
+            rate_limit=config.get('MPESA_SWEEP_RATE_LIMIT', 5),
+            max_checks=config.get('MPESA_SWEEP_MAX_CHECKS', 10),
+            retry_base=config.get('MPESA_RECONCILE_AFTER', 180)
+        )
+
+    # Background thread
+
+    def start(self):
+        """Start the sweeping thread in this process (after any fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped = False
+                self._thread = threading.Thread(target=self.run, name='donation-sweeper', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        """Sweep every interval until stopped"""
+        while not self._stopped:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Donation sweep failed: {e}")
+                with self._lock:
+                    self._last_error = str(e)[:200]
+            self._wake.wait(self.interval)
+
+    # Sweeping
+
+    def sweep(self, max_batches=None):
+        """Settle every due donation; returns this sweep's metrics"""
+        started = time.monotonic()
+        totals = dict.fromkeys(('queried', 'completed', 'failed', 'expired', 'rescheduled', 'errors'), 0)
+        totals['expired'] = self._expire_unpushed()
+
+        batches = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='stk-query') as executor:
+            while not self._stopped and (max_batches is None or batches < max_batches):
+                if self.api.guard.breaker.retry_after() > 0:
+                    break  # Daraja is down; the backlog waits for the next sweep
+                rows = self._claim()
+                if not rows:
+                    break
+                results = list(executor.map(self._query, rows))
+                for key, count in self._settle(rows, results).items():
+                    totals[key] += count
+                batches += 1
+
+        totals['seconds'] = round(time.monotonic() - started, 3)
+        totals['finished_at'] = datetime.now().isoformat()
+        with self._lock:
+            self._counts['sweeps'] += 1
+            for key in ('queried', 'completed', 'failed', 'expired', 'rescheduled', 'errors'):
+                self._counts[key] += totals[key]
+            self._last_sweep = totals
+        if any(totals[key] for key in ('completed', 'failed', 'expired', 'errors')):
+            logger.info(f"Donation sweep: {totals}")
+        return totals
+
+    def _claim(self):
+        """Due pending donations, leased to this sweeper by moving next_check_at on"""
+        now = int(time.time())
+        lease_until = now + self.lease_seconds
+        conn = self.pool.acquire()
+        try:
+            candidates = conn.execute('''
+                SELECT id, checkout_request_id, check_attempts, next_check_at, amount, payment_method
+                FROM donations
+                WHERE status = 'pending' AND next_check_at <= ?
+                ORDER BY next_check_at
+                LIMIT ?
+            ''', (now, self.batch_size)).fetchall()
+            claimed = []
+            for donation_id, checkout_request_id, attempts, next_check_at, amount, method in candidates:
+                cursor = conn.execute(
+                    'UPDATE donations SET next_check_at = ? WHERE id = ? AND next_check_at = ?',
+                    (lease_until, donation_id, next_check_at)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append((donation_id, checkout_request_id, attempts or 0, amount, method))
+            conn.commit()
+            return claimed
+        finally:
+            self.pool.release(conn)
+
+    def _query(self, row):
+        """Daraja's answer for one donation, or the exception it raised"""
+        if not row[1]:
+            return {'ResultCode': 'unknown', 'ResultDesc': NOT_CONFIRMED}
+        self.limiter.wait()
+        try:
+            return self.api.stk_push_query(row[1])
+        except Exception as e:
+            return e
+
+    def _settle(self, rows, results):
+        now = int(time.time())
+        completed_at = datetime.now().isoformat()
+        completed, failed, rescheduled = [], [], []
+        counts = dict.fromkeys(('queried', 'completed', 'failed', 'rescheduled', 'errors'), 0)
+        published = []
+
+        amounts = {row[0]: (row[3], row[4]) for row in rows}
+        for (donation_id, checkout_request_id, attempts, _, _), result in zip(rows, results):
+            attempts += 1
+            if isinstance(result, CircuitOpenError):
+                # Not asked at all: look again next sweep without using up a check
+                rescheduled.append((now, attempts - 1, donation_id))
+                continue
+            counts['queried'] += 1
+            if isinstance(result, Exception) or not isinstance(result, dict):
+                counts['errors'] += 1
+                with self._lock:
+                    self._last_error = str(result)[:200]
+                result = {}
+
+            result_code = str(result.get('ResultCode', ''))
+            if result_code == '0':
+                completed.append((completed_at, attempts, donation_id))
+                published.append((donation_id, 'completed', None, checkout_request_id))
+            elif result_code or attempts >= self.max_checks:
+                detail = result.get('ResultDesc') if result_code else NOT_CONFIRMED
+                failed.append((detail, attempts, donation_id))
+                published.append((donation_id, 'failed', detail, checkout_request_id))
+            else:
+                # Still waiting on the donor (STILL_PROCESSING) or Daraja errored
+                if result.get('errorCode') not in (None, STILL_PROCESSING):
+                    logger.warning(f"STK query for donation {donation_id}: {result.get('errorMessage')}")
+                delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+                rescheduled.append((now + delay, attempts, donation_id))
+
+        counts['completed'] = len(completed)
+        counts['failed'] = len(failed)
+        counts['rescheduled'] = len(rescheduled)
+
+        conn = self.pool.acquire()
+        try:
+            # One UPDATE per donation, so only those this sweep completed are rolled up
+            newly_completed = []
+            for row in completed:
+                cursor = conn.execute('''
+                    UPDATE donations SET status = 'completed', completed_at = ?, check_attempts = ?
+                    WHERE id = ? AND status = 'pending'
+                ''', row)
+                if cursor.rowcount == 1:
+                    newly_completed.append((*amounts[row[2]], completed_at))
+            record_completed(conn, newly_completed)
+            if failed:
+                conn.executemany('''
+                    UPDATE donations SET status = 'failed', status_detail = ?, check_attempts = ?
+                    WHERE id = ? AND status = 'pending'
+                ''', failed)
+            if rescheduled:
+                conn.executemany('''
+                    UPDATE donations SET next_check_at = ?, check_attempts = ?
+                    WHERE id = ? AND status = 'pending'
+                ''', rescheduled)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release(conn)
+
+        if self.initiator is not None:
+            for donation_id, status, detail, checkout_request_id in published:
+                self.initiator.publish(donation_id, status, detail=detail,
+                                       checkout_request_id=checkout_request_id)
+        return counts
+
+    def _expire_unpushed(self):
+        """Fail 'pending_init' and 'pushing' donations whose STK push never completed"""
+        now = int(time.time())
+        expired = []
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute('''
+                SELECT id, status FROM donations
+                WHERE status IN ('pending_init', 'pushing') AND next_check_at <= ?
+                ORDER BY next_check_at
+                LIMIT ?
+            ''', (now, self.batch_size * 10)).fetchall()
+            for donation_id, status in rows:
+                # Without a checkout id an interrupted push cannot be queried
+                detail = NEVER_PUSHED if status == 'pending_init' else NOT_CONFIRMED
+                cursor = conn.execute('''
+                    UPDATE donations SET status = 'failed', status_detail = ?
+                    WHERE id = ? AND status = ?
+                ''', (detail, donation_id, status))
+                if cursor.rowcount == 1:
+                    expired.append((donation_id, detail))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+        if self.initiator is not None:
+            for donation_id, detail in expired:
+                self.initiator.publish(donation_id, 'failed', detail=detail)
+        return len(expired)
+
+    def stats(self):
+        """Backlog plus this process's sweep counters and last sweep metrics"""
+        conn = self.pool.acquire()
+        try:
+            stats = {'backlog': backlog(conn)}
+        finally:
+            self.pool.release(conn)
+        with self._lock:
+            stats.update(self._counts)
+            stats['last_sweep'] = self._last_sweep
+            stats['last_error'] = self._last_error
+        stats['worker_running'] = self._thread is not None and self._pid == os.getpid()
+        return stats
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Karachuonyo donation reconciliation')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('run', help='Sweep until interrupted')
+    subparsers.add_parser('once', help='Run a single sweep')
+    subparsers.add_parser('status', help='Show backlog and counters')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app import donation_sweeper
+
+    if args.command == 'run':
+        try:
+            donation_sweeper.run()
+        except KeyboardInterrupt:
+            donation_sweeper.stop()
+    elif args.command == 'once':
+        for key, value in donation_sweeper.sweep().items():
+            print(f"{key}: {value}")
+    elif args.command == 'status':
+        for key, value in donation_sweeper.stats().items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Response Cache
+Read-through cache of serialized public GET responses
+
+Responses are keyed by route and normalized query string and stored with a
+TTL and a set of tags. Admin write handlers call invalidate(tag); tags are
+versioned counters (in the shared memory segment when available), so an
+invalidation is a single increment that every worker sees, and entries
+stored under an older tag version are treated as misses.
+
+Backends:
+    memory  per-process LRU bounded by entry count and total bytes
+    shared  the fixed-size cache in sharedmem.py, shared by all workers
+
+Entries also keep gzip/brotli variants of their body, compressed on first
+request for that encoding, so hot responses are not recompressed per hit.
+With COMPRESSION_ENABLED off they are always replayed as stored.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, request
+
+from compression import DEFAULT_MIN_SIZE, compress, encoded_etag, is_compressible, negotiate
+from http_cache import is_not_modified, not_modified_response, strong_etag
+from sharedmem import SegmentBusy
+
+logger = logging.getLogger(__name__)
+
+TAG_PREFIX = 'cache-tag:'
+
+
+class CachedResponse:
+    """A stored response body with the metadata needed to replay it"""
+
+    __slots__ = ('body', 'status', 'mimetype', 'tag_versions', 'stored_at', 'expires_at',
+                 'etag', 'modified_at', 'variants')
+
+    def __init__(self, body, status, mimetype, tag_versions, stored_at, expires_at,
+                 etag=None, modified_at=None, variants=None):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.tag_versions = tag_versions
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        # Validators are computed once when the entry is stored
+        self.etag = etag or strong_etag(body)
+        self.modified_at = modified_at
+        # Content-Encoding -> compressed body
+        self.variants = variants or {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.variants.values())
+
+    @property
+    def last_modified(self):
+        if self.modified_at is None:
+            return None
+        return datetime.fromtimestamp(self.modified_at, timezone.utc)
+
+    def to_response(self, encoding=None, vary=True):
+        """Replay the entry, using the ``encoding`` variant if one is stored"""
+        if encoding in self.variants:
+            response = Response(self.variants[encoding], status=self.status, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(encoded_etag(self.etag, encoding))
+        else:
+            response = Response(self.body, status=self.status, mimetype=self.mimetype)
+            response.set_etag(self.etag)
+        if vary and is_compressible(self.mimetype):
+            response.vary.add('Accept-Encoding')
+        if self.modified_at is not None:
+            response.last_modified = self.last_modified
+        return response
+
+    def to_bytes(self):
+        meta = {slot: getattr(self, slot) for slot in self.__slots__
+                if slot not in ('body', 'variants')}
+        meta['variants'] = {encoding: len(data) for encoding, data in self.variants.items()}
+        parts = [self.body] + list(self.variants.values())
+        return json.dumps(meta, separators=(',', ':')).encode() + b'\n' + b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        header, payload = data.split(b'\n', 1)
+        meta = json.loads(header)
+        lengths = meta.pop('variants')
+        end = len(payload) - sum(lengths.values())
+        body, variants = payload[:end], {}
+        for encoding, length in lengths.items():
+            variants[encoding] = payload[end:end + length]
+            end += length
+        return cls(body=body, variants=variants, **meta)
+
+
+class MemoryBackend:
+    """Per-process LRU bounded by entry count and total body bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if entry.size > self.max_bytes:
+            return False
+        with self._lock:
+            # Sizes are recorded at set time: an entry re-set after gaining a
+            # variant is the same object, so its old size cannot be recomputed
+            if self._entries.pop(key, None) is not None:
+                self._bytes -= self._sizes.pop(key)
+            self._entries[key] = entry
+            self._sizes[key] = entry.size
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+
+class SharedBackend:
+    """Entries in the shared memory segment, visible to every worker"""
+
+    name = 'shared'
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def get(self, key):
+        data = self.segment.cache_get(key)
+        return CachedResponse.from_bytes(data) if data is not None else None
+
+    def set(self, key, entry):
+        ttl = max(entry.expires_at - time.time(), 0.001)
+        return self.segment.cache_set(key, entry.to_bytes(), ttl=ttl)
+
+    def delete(self, key):
+        self.segment.cache_delete(key)
+
+    def clear(self):
+        self.segment.cache_clear()
+
+    def stats(self):
+        stats = self.segment.stats()
+        return {key: value for key, value in stats.items() if key.startswith('cache_')}
+
+
+class ResponseCache:
+    """Read-through cache for Flask views, invalidated by tag"""
+
+    def __init__(self, backend, segment=None, default_ttl=60, enabled=True,
+                 compression=True, compress_min_size=DEFAULT_MIN_SIZE):
+        self.backend = backend
+        self.segment = segment
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self.compression = compression
+        self.compress_min_size = compress_min_size
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._stores = 0
+        self._rejected = 0
+        self._invalidations = 0
+        self._compressions = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # Tags
+
+    def tag_version(self, tag):
+        """Current version of a tag, or None if the shared segment is locked up"""
+        if self.segment is not None:
+            try:
+                return self.segment.get_counter(TAG_PREFIX + tag)
+            except SegmentBusy:
+                return None
+        with self._lock:
+            return self._tag_versions.get(tag, 0)
+
+    def invalidate(self, *tags):
+        """Expire every entry stored under any of ``tags`` (in all workers)"""
+        for tag in tags:
+            if self.segment is not None:
+                try:
+                    self.segment.incr(TAG_PREFIX + tag)
+                except SegmentBusy:
+                    # Other workers keep their entries for tag until they expire
+                    logger.error(f"Could not invalidate cache tag {tag}: shared segment locked up")
+            else:
+                with self._lock:
+                    self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+            self._count('_invalidations')
+
+    # Entries
+
+    @staticmethod
+    def request_key():
+        """Route plus query string with parameters sorted, ignoring their order"""
+        args = sorted(request.args.items(multi=True))
+        return f'{request.path}?{urlencode(args)}' if args else request.path
+
+    def lookup(self, key):
+        """Fresh entry for ``key``, or None"""
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count('_misses')
+            return None
+
+        if entry.expires_at < time.time() or any(
+            self.tag_version(tag) != version for tag, version in entry.tag_versions.items()
+        ):
+            self.backend.delete(key)
+            self._count('_stale')
+            self._count('_misses')
+            return None
+
+        self._count('_hits')
+        return entry
+
+    def store(self, key, response, tags, ttl, tag_versions=None):
+        """Keep a successful, fully buffered response for ``ttl`` seconds; the entry or None"""
+        if tag_versions is None:
+            tag_versions = {tag: self.tag_version(tag) for tag in tags}
+        if None in tag_versions.values():
+            # Versions unknown, so the entry could never be invalidated
+            self._count('_rejected')
+            return None
+        now = time.time()
+        last_modified = response.last_modified
+        entry = CachedResponse(
+            body=response.get_data(),
+            status=response.status_code,
+            mimetype=response.mimetype,
+            tag_versions=tag_versions,
+            stored_at=now,
+            expires_at=now + ttl,
+            modified_at=last_modified.timestamp() if last_modified else None
+        )
+        if self.backend.set(key, entry):
+            self._count('_stores')
+        else:
+            self._count('_rejected')
+        return entry
+
+    def respond(self, key, entry):
+        """Response for a cached entry, encoded as the client prefers"""
+        encoding = None
+        if self.compression and entry.size >= self.compress_min_size \
+                and is_compressible(entry.mimetype):
+            encoding = negotiate(request.headers.get('Accept-Encoding'))
+        if encoding and encoding not in entry.variants:
+            entry.variants[encoding] = compress(entry.body, encoding)
+            self._count('_compressions')
+            self.backend.set(key, entry)
+        return entry.to_response(encoding, vary=self.compression)
+
+    def cached(self, tags, ttl=None):
+        """Decorator caching a view's 200 responses under ``tags``"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                key = self.request_key()
+                entry = self.lookup(key)
+                if entry is not None:
+                    if is_not_modified(entry.etag, entry.last_modified):
+                        response = not_modified_response(entry.etag, entry.last_modified)
+                    else:
+                        response = self.respond(key, entry)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                # Read tag versions before the view runs, so a write that lands
+                # while it is rendering leaves the stored entry already stale
+                tag_versions = {tag: self.tag_version(tag) for tag in tags}
+                response = view(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200 \
+                        and not response.is_streamed:
+                    entry = self.store(key, response, tags, ttl or self.default_ttl, tag_versions)
+                    if entry is not None:
+                        response = self.respond(key, entry)
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Hit/miss counters for this process plus backend usage"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            stats = {
+                'enabled': self.enabled,
+                'backend': self.backend.name,
+                'hits': self._hits,
+                'misses': self._misses,
+                'stale': self._stale,
+                'stores': self._stores,
+                'rejected': self._rejected,
+                'invalidations': self._invalidations,
+                'compressions': self._compressions,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else None,
+                'default_ttl': self.default_ttl
+            }
+        stats['storage'] = self.backend.stats()
+        return stats
+
+
+def create_response_cache(config, segment=None):
+    """ResponseCache configured from the Flask config"""
+    if config.get('RESPONSE_CACHE_BACKEND', 'memory') == 'shared' and segment is not None:
+        backend = SharedBackend(segment)
+    else:
+        backend = MemoryBackend(
+            max_entries=config.get('RESPONSE_CACHE_MAX_ENTRIES', 512),
+            max_bytes=config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        )
+    return ResponseCache(
+        backend,
+        segment=segment,
+        default_ttl=config.get('RESPONSE_CACHE_TTL', 60),
+        enabled=config.get('RESPONSE_CACHE_ENABLED', True),
+        compression=config.get('COMPRESSION_ENABLED', True),
+        compress_min_size=config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+    )
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo News Search
+Ranked full-text search over published news articles
+
+SQLite keeps an FTS5 index (news_search) of each article's title, excerpt,
+tags and HTML-stripped content. Triggers on news_articles (migration 6)
+keep it in step with every insert, update and delete, using the
+strip_html() SQL function (textutils.py) registered on each pooled
+connection. Results are ordered by bm25 with title and tag matches
+weighted above body text.
+
+PostgreSQL has no FTS5; the same query runs against a GIN-indexed
+to_tsvector() expression and is ranked with ts_rank_cd.
+"""
+
+import re
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# bm25 column weights: title, excerpt, body, tags
+BM25_WEIGHTS = (10.0, 4.0, 1.0, 6.0)
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# The expression migration 6 indexes on PostgreSQL; it must match that
+# migration exactly for the planner to use the expression index
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(excerpt, '')), 'C') || "
+    "setweight(to_tsvector('english', "
+    "regexp_replace(coalesce(content, ''), '<[^>]+>', ' ', 'g')), 'D')"
+)
+
+
+class SearchError(ValueError):
+    """Raised for missing or malformed search parameters"""
+
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    Every word must match (implicit AND); the last word also matches as a
+    prefix so partially typed queries find results. FTS5 operators and
+    punctuation in the input are treated as plain separators.
+    """
+    terms = _TERM_RE.findall(text.lower())
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def parse_search_args(args):
+    """Turn request args into (query, limit, offset)"""
+    query = (args.get('q') or '').strip()
+    if not query:
+        raise SearchError('q is required')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_SEARCH_LIMIT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise SearchError('limit and offset must be integers')
+    if limit < 1 or offset < 0:
+        raise SearchError('limit must be at least 1 and offset not negative')
+
+    return query, min(limit, MAX_SEARCH_LIMIT), offset
+
+
+def _search_sqlite(cursor, query, limit, offset):
+    match = fts_query(query)
+    if match is None:
+        return [], 0
+
+    # CROSS JOIN pins news_search as the outer loop; otherwise the planner
+    # may walk every published article and probe the FTS index per row
+
+    cursor.execute('''
+        SELECT COUNT(*)
+        FROM news_search
+        CROSS JOIN news_articles ON news_articles.id = news_search.rowid
+        WHERE news_search MATCH ? AND news_articles.status = 'published'
+    ''', (match,))
+    total = cursor.fetchone()[0]
+
+    cursor.execute(f'''
+        SELECT news_articles.id, news_articles.title, news_articles.slug,
+               news_articles.excerpt, news_articles.featured_image, news_articles.author,
+               news_articles.published_at, news_articles.tags,
+               snippet(news_search, -1, '<mark>', '</mark>', '…', 24),
+               bm25(news_search, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS rank
+        FROM news_search
+        CROSS JOIN news_articles ON news_articles.id = news_search.rowid
+        WHERE news_search MATCH ? AND news_articles.status = 'published'
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    ''', (match, limit, offset))
+    # bm25 is lower-is-better; flip it so clients see higher-is-better scores
+    return [row[:9] + (-row[9],) for row in cursor.fetchall()], total
+
+
+def _search_postgres(cursor, query, limit, offset):
+    cursor.execute(f'''
+        SELECT COUNT(*) FROM news_articles
+        WHERE status = 'published' AND ({PG_DOCUMENT}) @@ plainto_tsquery('english', ?)
+    ''', (query,))
+    total = cursor.fetchone()[0]
+
+    cursor.execute(f'''
+        SELECT id, title, slug, excerpt, featured_image, author, published_at, tags,
+               ts_headline('english', regexp_replace(coalesce(content, ''), '<[^>]+>', ' ', 'g'),
+                           plainto_tsquery('english', ?),
+                           'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8'),
+               ts_rank_cd({PG_DOCUMENT}, plainto_tsquery('english', ?)) AS rank
+        FROM news_articles
+        WHERE status = 'published' AND ({PG_DOCUMENT}) @@ plainto_tsquery('english', ?)
+        ORDER BY rank DESC, id DESC
+        LIMIT ? OFFSET ?
+    ''', (query, query, query, limit, offset))
+    return cursor.fetchall(), total
+
+
+def search_articles(cursor, dialect, query, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    """Ranked published articles matching ``query``; returns (results, total)"""
+    search = _search_postgres if dialect == 'postgresql' else _search_sqlite
+    rows, total = search(cursor, query, limit, offset)
+
+    results = []
+    for row in rows:
+        results.append({
+            'id': row[0],
+            'title': row[1],
+            'slug': row[2],
+            'excerpt': row[3],
+            'featured_image': row[4],
+            'author': row[5],
+            'published_at': row[6],
+            'tags': row[7].split(',') if row[7] else [],
+            'snippet': row[8],
+            'score': round(float(row[9]), 4)
+        })
+    return results, total
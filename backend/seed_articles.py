@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Seed Articles
+Launch news articles shipped with the code rather than stored in the database
+
+They are merged with published news_articles rows by news_catalog.py; a
+database article with the same slug takes precedence over a seed article.
+"""
+
+SEED_ARTICLES = {
+    'ward-cleanup-drive': {
+        'id': 'ward-cleanup-drive',
+        'title': 'Ward Clean-Up Drive Launched',
+        'date': 'August 24, 2025',
+        'category': 'Community',
+        'author': 'Karachuonyo First Team',
+        'excerpt': 'We flagged off a community clean-up across trading centers with youth groups and churches.',
+        'content': '''<p>In a remarkable display of community spirit, the Karachuonyo First campaign launched a comprehensive ward clean-up drive across all major trading centers in our constituency. This initiative, which began early Saturday morning, brought together youth groups, church organizations, and community volunteers in an unprecedented show of unity.</p>
+        
+        <h2>Community Mobilization</h2>
+        <p>The clean-up drive saw participation from over 200 volunteers, including members from various youth groups such as the Karachuonyo Youth Network, local church congregations, and community-based organizations. The enthusiasm and dedication shown by our young people was particularly inspiring.</p>
+        
+        <blockquote>"This is what true leadership looks like - bringing people together for the common good of our community," said Mary Otieno, a local church leader who participated in the drive.</blockquote>
+        
+        <h2>Areas Covered</h2>
+        <p>The clean-up exercise covered major trading centers including:</p>
+        <ul>
+            <li>Kendu Bay Market and surrounding areas</li>
+            <li>Homa Hills Trading Center</li>
+            <li>Kadel Market Square</li>
+            <li>Nyadhi Shopping Center</li>
+        </ul>
+        
+        <h2>Environmental Impact</h2>
+        <p>The initiative resulted in the collection of over 50 bags of waste, clearing of drainage systems, and general beautification of our trading centers. This effort not only improved the aesthetic appeal of our markets but also contributed to better health and sanitation conditions for traders and customers alike.</p>
+        
+        <h2>Moving Forward</h2>
+        <p>This clean-up drive is just the beginning of our comprehensive environmental conservation program. We plan to make this a monthly initiative, with each session focusing on different areas within our ward. Additionally, we are working on establishing permanent waste management systems in all major trading centers.</p>
+        
+        <p>The success of this initiative demonstrates what we can achieve when we work together as a community. It reflects our commitment to not just talking about change, but actively implementing solutions that improve the lives of our people.</p>''',
+        'read_time': '5 min read',
+        'tags': ['community', 'environment', 'youth'],
+        'featured_image': '/images/cleanup-drive.jpg',
+        'published': True,
+        'created_at': '2025-08-24T08:00:00Z',
+        'updated_at': '2025-08-24T08:00:00Z'
+    },
+    'bursary-vetting-guidelines': {
+        'id': 'bursary-vetting-guidelines',
+        'title': 'Bursary Vetting Guidelines',
+        'date': 'August 18, 2025',
+        'category': 'Education',
+        'author': 'Karachuonyo First Team',
+        'excerpt': 'Transparent criteria and timelines to ensure fairness and inclusion.',
+        'content': '''<p>Education remains the cornerstone of our development agenda, and we are committed to ensuring that every child in Karachuonyo has access to quality education regardless of their family's financial situation. Today, we are proud to announce the comprehensive bursary vetting guidelines that will govern the distribution of educational support in our constituency.</p>
+        
+        <h2>Transparency First</h2>
+        <p>Our bursary program is built on the principles of transparency, fairness, and inclusivity. We believe that every family deserves to know exactly how bursaries are allocated and what criteria are used in the selection process.</p>
+        
+        <h2>Eligibility Criteria</h2>
+        <p>The following criteria will be used to assess bursary applications:</p>
+        <ul>
+            <li><strong>Financial Need:</strong> Family income assessment and economic circumstances</li>
+            <li><strong>Academic Performance:</strong> Student's academic record and potential</li>
+            <li><strong>Community Involvement:</strong> Family's participation in community activities</li>
+            <li><strong>Special Circumstances:</strong> Orphaned students, students with disabilities, and other vulnerable cases</li>
+        </ul>
+        
+        <h2>Application Process</h2>
+        <p>The application process has been streamlined to make it accessible to all families:</p>
+        <ol>
+            <li>Application forms available at all chief's offices and online</li>
+            <li>Required documents clearly listed and easily obtainable</li>
+            <li>Community-based vetting committees in each location</li>
+            <li>Appeals process for disputed decisions</li>
+        </ol>
+        
+        <blockquote>"Education is not a privilege for the few, but a right for all. These guidelines ensure that deserving students get the support they need to achieve their dreams," emphasized our Education Coordinator.</blockquote>
+        
+        <h2>Timeline and Deadlines</h2>
+        <p>Applications will be accepted twice a year:</p>
+        <ul>
+            <li><strong>First Term:</strong> Applications due by December 15th</li>
+            <li><strong>Second Term:</strong> Applications due by April 15th</li>
+        </ul>
+        
+        <h2>Accountability Measures</h2>
+        <p>To ensure accountability and proper use of funds:</p>
+        <ul>
+            <li>Regular monitoring of beneficiaries' academic progress</li>
+            <li>Direct payment to educational institutions</li>
+            <li>Annual public reporting on bursary distribution</li>
+            <li>Community feedback mechanisms</li>
+        </ul>
+        
+        <p>We encourage all families with school-going children to familiarize themselves with these guidelines and to apply when the application windows open. Together, we can ensure that no child in Karachuonyo is denied education due to financial constraints.</p>''',
+        'read_time': '4 min read',
+        'tags': ['education', 'bursary', 'transparency'],
+        'featured_image': '/images/education-bursary.jpg',
+        'published': True,
+        'created_at': '2025-08-18T10:00:00Z',
+        'updated_at': '2025-08-18T10:00:00Z'
+    },
+    'water-nyadhi-project': {
+        'id': 'water-nyadhi-project',
+        'title': 'Water for Nyadhi – Project Update',
+        'date': 'August 2, 2025',
+        'category': 'Development',
+        'author': 'Karachuonyo First Team',
+        'excerpt': 'Borehole survey completed; rig mobilization scheduled pending NEMA greenlight.',
+        'content': '''<p>Access to clean, safe water is a fundamental human right, and we are making significant progress in ensuring that the people of Nyadhi have reliable access to this precious resource. Today, we provide a comprehensive update on the Water for Nyadhi project, which represents a major milestone in our infrastructure development agenda.</p>
+        
+        <h2>Project Background</h2>
+        <p>The Nyadhi community has faced water scarcity challenges for decades, with residents often walking long distances to access clean water. This project aims to drill a high-capacity borehole that will serve over 500 households and several institutions including schools and health facilities.</p>
+        
+        <h2>Survey Completion</h2>
+        <p>We are pleased to report that the comprehensive borehole survey has been successfully completed by certified hydrogeologists. The survey results are highly encouraging:</p>
+        <ul>
+            <li><strong>Water Table Depth:</strong> 45 meters - well within drilling capacity</li>
+            <li><strong>Estimated Yield:</strong> 15,000 liters per hour - sufficient for community needs</li>
+            <li><strong>Water Quality:</strong> Preliminary tests indicate excellent quality</li>
+            <li><strong>Sustainability:</strong> Aquifer shows signs of good recharge potential</li>
+        </ul>
+        
+        <h2>Environmental Compliance</h2>
+        <p>As responsible stewards of our environment, we have submitted all required documentation to the National Environment Management Authority (NEMA) for environmental impact assessment. This includes:</p>
+        <ul>
+            <li>Environmental Impact Assessment (EIA) report</li>
+            <li>Community consultation reports</li>
+            <li>Hydrogeological survey findings</li>
+            <li>Waste management and site restoration plans</li>
+        </ul>
+        
+        <blockquote>"We are committed to ensuring that this project not only provides water but also protects our environment for future generations," stated our Project Coordinator.</blockquote>
+        
+        <h2>Next Steps</h2>
+        <p>Upon receiving NEMA clearance, which we expect within the next two weeks, we will immediately proceed with:</p>
+        <ol>
+            <li>Drilling rig mobilization to site</li>
+            <li>Commencement of drilling operations</li>
+            <li>Installation of pumping equipment</li>
+            <li>Construction of distribution network</li>
+            <li>Community training on maintenance</li>
+        </ol>
+        
+        <h2>Community Involvement</h2>
+        <p>This project has been a true community effort from the beginning. Local residents have contributed through:</p>
+        <ul>
+            <li>Site identification and access provision</li>
+            <li>Local labor and materials where possible</li>
+            <li>Formation of a water management committee</li>
+            <li>Commitment to ongoing maintenance and sustainability</li>
+        </ul>
+        
+        <h2>Expected Timeline</h2>
+        <p>Based on current progress and pending approvals:</p>
+        <ul>
+            <li><strong>NEMA Approval:</strong> Expected by August 15, 2025</li>
+            <li><strong>Drilling Commencement:</strong> August 20, 2025</li>
+            <li><strong>Project Completion:</strong> September 30, 2025</li>
+            <li><strong>Community Handover:</strong> October 5, 2025</li>
+        </ul>
+        
+        <p>The Water for Nyadhi project exemplifies our commitment to addressing the real, everyday challenges facing our people. Clean water access will not only improve health outcomes but also free up time for productive activities, particularly for women and children who currently bear the burden of water collection.</p>
+        
+        <p>We will continue to provide regular updates on this project and welcome community feedback and involvement at every stage.</p>''',
+        'read_time': '6 min read',
+        'tags': ['development', 'water', 'infrastructure'],
+        'featured_image': '/images/water-project.jpg',
+        'published': True,
+        'created_at': '2025-08-02T09:00:00Z',
+        'updated_at': '2025-08-02T09:00:00Z'
+    }
+}
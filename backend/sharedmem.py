@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Shared Memory Segment
+Cross-worker counters and a fixed-size key/value cache in one mmap
+
+gunicorn forks its workers from the master, so an anonymous shared mmap
+created in the master (see gunicorn.conf.py) is inherited by every worker
+and all of them see the same counters and cache entries. Without a master
+hook (flask run, tests) the segment is created lazily in the process.
+
+Python cannot do atomic read-modify-write on a raw buffer, so cache slots
+are guarded by striped process-shared locks (updates to different keys
+rarely contend) and the counter table by its own lock. The locks are
+semaphores inherited across fork; no network service is involved. They
+are only ever waited on for lock_timeout seconds: a worker killed while
+holding one (gunicorn's timeout sends SIGKILL) would otherwise hang every
+other worker. On a timeout cache reads miss, cache writes are dropped and
+counter operations raise SegmentBusy, which callers turn into a
+process-local fallback, until the workers are restarted.
+
+Drained counters give their slots back (backward-shift deletion keeps the
+linear probing intact), so per-article keys do not fill the table.
+
+Layout:
+    counters  COUNTER_SLOTS x [hash u64 | value i64 | key 48s]
+    cache     CACHE_SLOTS   x [hash u64 | expires f64 | length u32 | pad | value]
+"""
+
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_COUNTER = struct.Struct('<Qq48s')
+_CACHE_HEADER = struct.Struct('<QdI4x')
+_STATS = struct.Struct('<8q')
+
+# Indexes into each stripe's stats block
+_HITS, _MISSES, _SETS, _EVICTIONS, _OVERSIZE, _EXPIRED, _COUNTER_FULL, _INCREMENTS = range(8)
+_STAT_NAMES = ('cache_hits', 'cache_misses', 'cache_sets', 'cache_evictions',
+               'cache_oversize', 'cache_expired', 'counter_table_full', 'counter_increments')
+
+MAX_KEY_BYTES = 48
+
+
+class SegmentBusy(RuntimeError):
+    """A shared lock was not free within lock_timeout (its holder may have died)"""
+
+
+def _key_hash(key):
+    """Non-zero 64-bit hash of a key (zero marks an empty slot)"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class SharedSegment:
+    """Counters and cache living in an anonymous MAP_SHARED mapping"""
+
+    def __init__(self, counter_slots=4096, cache_slots=256, cache_value_size=65536, stripes=16,
+                 lock_timeout=0.5):
+        self.counter_slots = counter_slots
+        self.lock_timeout = lock_timeout
+        self.cache_slots = cache_slots
+        self.cache_value_size = cache_value_size
+        self.stripes = stripes
+        self.cache_slot_size = _CACHE_HEADER.size + cache_value_size
+
+        # One stats block per cache stripe plus one for the counter table
+        self._stats_offset = 0
+        self._counter_stats = stripes
+        self._counter_offset = self._stats_offset + (stripes + 1) * _STATS.size
+        self._cache_offset = self._counter_offset + counter_slots * _COUNTER.size
+        self.size = self._cache_offset + cache_slots * self.cache_slot_size
+
+        self._buf = mmap.mmap(-1, self.size, flags=mmap.MAP_SHARED)
+        self._locks = [multiprocessing.Lock() for _ in range(stripes)]
+        self._counter_lock = multiprocessing.Lock()
+        self.created_by = os.getpid()
+        self.lock_timeouts = 0  # per process: the stats blocks need the very locks that timed out
+
+    @contextmanager
+    def _holding(self, lock):
+        """Hold a shared lock, giving up with SegmentBusy after lock_timeout seconds"""
+        if not lock.acquire(timeout=self.lock_timeout):
+            self.lock_timeouts += 1
+            if self.lock_timeouts == 1 or self.lock_timeouts % 1000 == 0:
+                logger.error(f"Shared memory lock not released within {self.lock_timeout}s "
+                             f"({self.lock_timeouts} timeouts in pid {os.getpid()}); "
+                             f"restart the workers if this persists")
+            raise SegmentBusy('Shared memory lock timed out')
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _stat(self, stripe, index, delta=1):
+        """Bump a statistic; caller holds the lock owning that stats block"""
+        offset = self._stats_offset + stripe * _STATS.size + index * 8
+        value = struct.unpack_from('<q', self._buf, offset)[0]
+        struct.pack_into('<q', self._buf, offset, value + delta)
+
+    # Counters
+
+    def _find_counter(self, key, key_hash, create):
+        """Slot offset for a counter key (linear probing), or None"""
+        encoded = key.encode('utf-8')
+        if len(encoded) > MAX_KEY_BYTES:
+            raise ValueError(f'Counter key longer than {MAX_KEY_BYTES} bytes: {key}')
+
+        start = key_hash % self.counter_slots
+        for probe in range(self.counter_slots):
+            offset = self._counter_offset + ((start + probe) % self.counter_slots) * _COUNTER.size
+            slot_hash, _, slot_key = _COUNTER.unpack_from(self._buf, offset)
+            if slot_hash == 0:
+                if not create:
+                    return None
+                _COUNTER.pack_into(self._buf, offset, key_hash, 0, encoded)
+                return offset
+            if slot_hash == key_hash and slot_key.rstrip(b'\0') == encoded:
+                return offset
+        return None
+
+    def _delete_counter(self, index):
+        """Free slot ``index``, shifting later probes back so lookups still find them"""
+        empty = index
+        probe = index
+        while True:
+            probe = (probe + 1) % self.counter_slots
+            offset = self._counter_offset + probe * _COUNTER.size
+            slot = _COUNTER.unpack_from(self._buf, offset)
+            if slot[0] == 0:
+                break
+            home = slot[0] % self.counter_slots
+            # Move the entry back unless its home lies cyclically in (empty, probe]
+            if (probe - home) % self.counter_slots >= (probe - empty) % self.counter_slots:
+                _COUNTER.pack_into(self._buf, self._counter_offset + empty * _COUNTER.size, *slot)
+                empty = probe
+        _COUNTER.pack_into(self._buf, self._counter_offset + empty * _COUNTER.size, 0, 0, b'')
+
+    def incr(self, key, delta=1):
+        """Atomically add ``delta`` to a counter and return the new value.
+
+        Raises MemoryError when the table is full and SegmentBusy on a lock timeout.
+        """
+        key_hash = _key_hash(key)
+        with self._holding(self._counter_lock):
+            offset = self._find_counter(key, key_hash, create=True)
+            if offset is None:
+                self._stat(self._counter_stats, _COUNTER_FULL)
+                raise MemoryError('Shared counter table is full')
+            slot_hash, value, slot_key = _COUNTER.unpack_from(self._buf, offset)
+            value += delta
+            _COUNTER.pack_into(self._buf, offset, slot_hash, value, slot_key)
+            self._stat(self._counter_stats, _INCREMENTS)
+            return value
+
+    def get_counter(self, key):
+        """Current value of a counter (0 if it was never incremented); may raise SegmentBusy"""
+        key_hash = _key_hash(key)
+        with self._holding(self._counter_lock):
+            offset = self._find_counter(key, key_hash, create=False)
+            if offset is None:
+                return 0
+            return _COUNTER.unpack_from(self._buf, offset)[1]
+
+    def drain_counters(self, prefix):
+        """Return {key: value} for non-zero counters under ``prefix`` and free their slots.
+
+        Returns {} if the counter lock times out; the values wait for the next drain.
+        """
+        encoded_prefix = prefix.encode('utf-8')
+        drained = {}
+        try:
+            with self._holding(self._counter_lock):
+                slot = 0
+                while slot < self.counter_slots:
+                    offset = self._counter_offset + slot * _COUNTER.size
+                    slot_hash, value, slot_key = _COUNTER.unpack_from(self._buf, offset)
+                    if slot_hash and slot_key.startswith(encoded_prefix):
+                        if value:
+                            drained[slot_key.rstrip(b'\0').decode('utf-8')] = value
+                        self._delete_counter(slot)
+                        continue  # another entry may have shifted into this slot
+                    slot += 1
+        except SegmentBusy:
+            return {}
+        return drained
+
+    # Cache
+
+    def _cache_slot(self, key_hash):
+        slot = key_hash % self.cache_slots
+        return self._cache_offset + slot * self.cache_slot_size, slot % self.stripes
+
+    def cache_get(self, key):
+        """Cached bytes for ``key``, or None if absent, expired or its stripe is locked up"""
+        key_hash = _key_hash(key)
+        offset, stripe = self._cache_slot(key_hash)
+        try:
+            with self._holding(self._locks[stripe]):
+                slot_hash, expires, length = _CACHE_HEADER.unpack_from(self._buf, offset)
+                if slot_hash != key_hash:
+                    self._stat(stripe, _MISSES)
+                    return None
+                if expires and expires < time.time():
+                    _CACHE_HEADER.pack_into(self._buf, offset, 0, 0.0, 0)
+                    self._stat(stripe, _EXPIRED)
+                    self._stat(stripe, _MISSES)
+                    return None
+                start = offset + _CACHE_HEADER.size
+                value = bytes(self._buf[start:start + length])
+                self._stat(stripe, _HITS)
+                return value
+        except SegmentBusy:
+            return None
+
+    def cache_set(self, key, value, ttl=None):
+        """Store bytes under ``key``; returns False if the value does not fit or was dropped"""
+        key_hash = _key_hash(key)
+        offset, stripe = self._cache_slot(key_hash)
+        try:
+            with self._holding(self._locks[stripe]):
+                if len(value) > self.cache_value_size:
+                    self._stat(stripe, _OVERSIZE)
+                    return False
+                slot_hash = _CACHE_HEADER.unpack_from(self._buf, offset)[0]
+                if slot_hash and slot_hash != key_hash:
+                    self._stat(stripe, _EVICTIONS)
+                expires = time.time() + ttl if ttl else 0.0
+                start = offset + _CACHE_HEADER.size
+                self._buf[start:start + len(value)] = value
+                _CACHE_HEADER.pack_into(self._buf, offset, key_hash, expires, len(value))
+                self._stat(stripe, _SETS)
+                return True
+        except SegmentBusy:
+            return False
+
+    def cache_delete(self, key):
+        """Drop ``key`` from the cache if present"""
+        key_hash = _key_hash(key)
+        offset, stripe = self._cache_slot(key_hash)
+        try:
+            with self._holding(self._locks[stripe]):
+                if _CACHE_HEADER.unpack_from(self._buf, offset)[0] == key_hash:
+                    _CACHE_HEADER.pack_into(self._buf, offset, 0, 0.0, 0)
+                    return True
+        except SegmentBusy:
+            pass
+        return False
+
+    def cache_clear(self):
+        """Empty every cache slot (except in stripes whose lock timed out)"""
+        for stripe in range(self.stripes):
+            try:
+                with self._holding(self._locks[stripe]):
+                    for slot in range(stripe, self.cache_slots, self.stripes):
+                        offset = self._cache_offset + slot * self.cache_slot_size
+                        _CACHE_HEADER.pack_into(self._buf, offset, 0, 0.0, 0)
+            except SegmentBusy:
+                continue
+
+    def stats(self):
+        """Segment sizes and counters aggregated over all workers"""
+        totals = [0] * len(_STAT_NAMES)
+        locked_up = 0
+        for block, lock in enumerate(self._locks + [self._counter_lock]):
+            try:
+                with self._holding(lock):
+                    values = _STATS.unpack_from(self._buf, self._stats_offset + block * _STATS.size)
+            except SegmentBusy:
+                locked_up += 1
+                continue
+            totals = [a + b for a, b in zip(totals, values)]
+
+        counters_used = None
+        try:
+            with self._holding(self._counter_lock):
+                counters_used = 0
+                for slot in range(self.counter_slots):
+                    offset = self._counter_offset + slot * _COUNTER.size
+                    if struct.unpack_from('<Q', self._buf, offset)[0]:
+                        counters_used += 1
+        except SegmentBusy:
+            pass
+
+        stats = dict(zip(_STAT_NAMES, totals))
+        stats.update({
+            'size_bytes': self.size,
+            'created_by': self.created_by,
+            'shared_with_master': self.created_by != os.getpid(),
+            'counter_slots': self.counter_slots,
+            'counter_slots_used': counters_used,
+            'cache_slots': self.cache_slots,
+            'cache_value_size': self.cache_value_size,
+            'locks_timed_out': locked_up,
+            'lock_timeouts_here': self.lock_timeouts
+        })
+        return stats
+
+
+_segment = None
+
+
+def create_segment(counter_slots=4096, cache_slots=256, cache_value_size=65536, lock_timeout=0.5):
+    """Create the process-wide segment (call in the gunicorn master before fork)"""
+    global _segment
+    _segment = SharedSegment(counter_slots, cache_slots, cache_value_size, lock_timeout=lock_timeout)
+    logger.info(f"Created shared memory segment ({_segment.size} bytes) in pid {os.getpid()}")
+    return _segment
+
+
+def get_segment(**sizes):
+    """The inherited segment, or a process-local one if no master created it"""
+    if _segment is None:
+        return create_segment(**sizes)
+    return _segment
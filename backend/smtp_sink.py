@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo SMTP Sink
+Local stand-in for the SMTP relay, for tests and throughput runs
+
+Speaks just enough SMTP (no TLS, no auth) for smtplib and Flask-Mail, counts
+what it receives and throws the messages away, keeping only the most recent
+few for inspection. Setting ``fail_rate`` rejects that share of messages
+with a 451, to exercise retries.
+
+    python smtp_sink.py [--port 2525]
+
+then point the backend at it with MAIL_SERVER=127.0.0.1 MAIL_PORT=2525
+MAIL_USE_TLS=false. In tests, SMTPSink.mail() gives a Flask-Mail stand-in
+connected to the sink.
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+from collections import deque
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink._count('connections')
+        self.reply('220 karachuonyo-sink ESMTP')
+        sender, recipients = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 karachuonyo-sink' if verb == 'HELO' else '250-karachuonyo-sink\r\n250 8BITMIME')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw[1:] if raw.startswith(b'..') else raw)
+                if sink.fail_rate and random.random() < sink.fail_rate:
+                    sink._count('rejected')
+                    self.reply('451 Temporary failure, try again')
+                else:
+                    sink._record(sender, recipients, b''.join(data))
+                    self.reply('250 OK queued')
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SinkMail:
+    """Flask-Mail stand-in whose connections go to a sink, not the configured relay"""
+
+    def __init__(self, port, host='127.0.0.1'):
+        from flask_mail import Mail
+
+        self.state = Mail().init_mail({
+            'MAIL_SERVER': host,
+            'MAIL_PORT': port,
+            'MAIL_USE_TLS': False,
+            'MAIL_DEFAULT_SENDER': 'test@example.com'
+        })
+
+    def connect(self):
+        # Mail.connect() always uses the current app's state (suppressed when testing)
+        from flask_mail import Connection
+
+        return Connection(self.state)
+
+
+class SMTPSink:
+    """Threaded SMTP server counting received messages"""
+
+    def __init__(self, host='127.0.0.1', port=0, fail_rate=0.0, keep=100):
+        self.fail_rate = fail_rate
+        self.messages = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._counts = {'connections': 0, 'messages': 0, 'recipients': 0, 'rejected': 0}
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = None
+        self.started_at = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def _record(self, sender, recipients, data):
+        with self._lock:
+            self._counts['messages'] += 1
+            self._counts['recipients'] += len(recipients)
+            self.messages.append({'sender': sender, 'recipients': recipients, 'data': data})
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        stats['messages_per_second'] = round(stats['messages'] / elapsed, 1) if elapsed else 0.0
+        return stats
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def mail(self):
+        """Object to hand to OutboxWorker / BroadcastEngine in place of Flask-Mail"""
+        return SinkMail(self.port, self.address[0])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local SMTP sink')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    sink = SMTPSink(args.host, args.port, fail_rate=args.fail_rate).start()
+    print(f"SMTP sink listening on {args.host}:{sink.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(sink.stats())
+    except KeyboardInterrupt:
+        sink.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
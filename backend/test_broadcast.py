@@ -0,0 +1,173 @@
+"""
+Newsletter broadcast tests.
+
+Sends a broadcast to a few thousand subscribers through a local SMTP sink,
+stopping half way to check that a resumed run reaches everyone exactly once,
+and kills a run in the middle of a batch to check that another process
+taking it over does not mail the recipients already recorded.
+Runs against a throwaway SQLite file, or the database in TEST_DATABASE_URL
+when set.
+
+    python -m pytest test_broadcast.py
+    python test_broadcast.py [subscribers]   e.g. 100000 for a throughput run
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-broadcast-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'broadcast.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db_pool, email_templates, init_database  # noqa: E402
+from broadcast import BroadcastEngine  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+SUBSCRIBERS = 2000
+
+
+def add_subscribers(count):
+    """Insert ``count`` active subscribers unique to this run"""
+    tag = f'{os.getpid()}-{time.time_ns()}'
+    conn = db_pool.acquire()
+    try:
+        for start in range(0, count, 5000):
+            conn.executemany(
+                'INSERT INTO newsletter_subscriptions (email, name, status) VALUES (?, ?, ?)',
+                [(f'reader{i}-{tag}@example.com', f'Reader {i}', 'active')
+                 for i in range(start, min(start + 5000, count))]
+            )
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM newsletter_subscriptions WHERE status = 'active'").fetchone()[0]
+    finally:
+        db_pool.release(conn)
+
+
+def engine(sink, **options):
+    return BroadcastEngine(app, sink.mail(), db_pool, email_templates, **options)
+
+
+def test_broadcast_resumes_without_duplicates():
+    init_database()
+    active = add_subscribers(SUBSCRIBERS)
+
+    with SMTPSink(keep=None) as sink:
+        broadcasts = engine(sink, batch_size=250, concurrency=4)
+        broadcast_id = broadcasts.create(
+            'Campaign update for {{ name }}',
+            '<p>Dear {{ name }},</p><p>Rally on Saturday.</p>',
+            'Dear {{ name }},\nRally on Saturday.\n'
+        )
+
+        # Stop after two batches, as a crash between batches would
+        progress = broadcasts.run(broadcast_id, max_batches=2)
+        assert progress['status'] == 'paused'
+        assert progress['sent'] == 500
+
+        progress = broadcasts.run(broadcast_id)
+        delivered = [recipient for message in sink.messages for recipient in message['recipients']]
+        connections = sink.stats()['connections']
+
+    assert progress['status'] == 'completed'
+    assert progress['sent'] == active and progress['failed'] == 0
+    assert len(delivered) == active == len(set(delivered))
+    # Connections are reused across batches: one per sending thread per run
+    assert connections <= 2 * 4
+    assert progress['messages_per_second']
+
+
+class _DyingMail:
+    """Flask-Mail stand-in whose connections die after ``limit`` sends in total"""
+
+    def __init__(self, mail, limit):
+        self.mail = mail
+        self.limit = limit
+        self.sends = 0
+
+    def connect(self):
+        outer = self
+        connection = self.mail.connect()
+
+        class Connection:
+            def __enter__(self):
+                connection.__enter__()
+                return self
+
+            def __exit__(self, *exc):
+                return connection.__exit__(*exc)
+
+            def send(self, message):
+                outer.sends += 1
+                if outer.sends > outer.limit:
+                    raise RuntimeError('worker killed')
+                connection.send(message)
+
+        return Connection()
+
+
+def test_takeover_after_interrupted_batch():
+    init_database()
+    active = add_subscribers(300)
+
+    with SMTPSink(keep=None) as sink:
+        first = BroadcastEngine(app, _DyingMail(sink.mail(), 130), db_pool, email_templates,
+                                batch_size=1000, concurrency=2, record_every=10)
+        broadcast_id = first.create('Takeover', '<p>Hi {{ name }}</p>')
+        first.run(broadcast_id)
+
+        # The batch never finished, so the checkpoint did not move
+        conn = db_pool.acquire()
+        try:
+            assert conn.execute('SELECT last_subscriber_id FROM newsletter_broadcasts WHERE id = ?',
+                                (broadcast_id,)).fetchone()[0] == 0
+            # As a killed worker leaves it: still 'running', heartbeat gone stale
+            conn.execute('''
+                UPDATE newsletter_broadcasts SET status = 'running', heartbeat_at = ? WHERE id = ?
+            ''', (int(time.time()) - 3600, broadcast_id))
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+
+        second = engine(sink, batch_size=1000, concurrency=2)
+        second.worker_id = 'another-host:1'
+        progress = second.run(broadcast_id)
+        delivered = [recipient for message in sink.messages for recipient in message['recipients']]
+
+    assert progress['status'] == 'completed'
+    assert progress['sent'] == active
+    assert len(delivered) == active == len(set(delivered))
+
+
+def test_rate_limit_paces_sends():
+    init_database()
+    with SMTPSink() as sink:
+        broadcasts = engine(sink, batch_size=50, concurrency=2, rate_limit=200)
+        broadcast_id = broadcasts.create('Pacing', '<p>Hi {{ name }}</p>')
+        add_subscribers(100)
+        started = time.monotonic()
+        # Only the first batch: 50 messages at 200/s take at least ~0.25s
+        broadcasts.run(broadcast_id, max_batches=1)
+        assert time.monotonic() - started >= 0.2
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else SUBSCRIBERS
+    init_database()
+    active = add_subscribers(count)
+    with SMTPSink() as sink:
+        broadcasts = engine(
+            sink,
+            batch_size=app.config['BROADCAST_BATCH_SIZE'],
+            concurrency=app.config['BROADCAST_CONCURRENCY']
+        )
+        broadcast_id = broadcasts.create('Campaign update', '<p>Dear {{ name }},</p><p>Rally on Saturday.</p>')
+        started = time.monotonic()
+        progress = broadcasts.run(broadcast_id)
+        elapsed = time.monotonic() - started
+        print(f"{progress['sent']} of {active} subscribers in {elapsed:.1f}s "
+              f"({progress['sent'] / elapsed:.0f} messages/s, sink saw {sink.stats()['connections']} connections)")
@@ -0,0 +1,164 @@
+"""
+Response compression tests.
+
+Checks Accept-Encoding negotiation, that the middleware compresses large
+text-like 200 responses (suffixing their ETag and adding Accept-Encoding
+to Vary once) and leaves everything else alone, that streamed responses
+are flushed chunk by chunk, and that cached entries keep one compressed
+variant per encoding unless compression is turned off.
+
+    python -m pytest test_compression.py
+    python test_compression.py
+"""
+
+import gzip
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, Response, jsonify, stream_with_context  # noqa: E402
+
+from compression import CompressionMiddleware, available_encodings, negotiate  # noqa: E402
+from response_cache import MemoryBackend, ResponseCache  # noqa: E402
+
+BIG = {'articles': [{'title': f'Article {i}', 'excerpt': 'Karachuonyo news ' * 8} for i in range(40)]}
+
+
+def _json_bytes(payload):
+    with Flask(__name__).app_context():
+        return jsonify(payload).get_data()
+
+
+def _site():
+    site = Flask(__name__)
+
+    @site.route('/big')
+    def big():
+        response = jsonify(BIG)
+        response.set_etag('abc')
+        response.vary.add('Origin')
+        response.vary.add('Accept-Encoding')
+        return response
+
+    @site.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @site.route('/image')
+    def image():
+        return Response(b'\x89PNG' + b'\0' * 4096, mimetype='image/png')
+
+    @site.route('/encoded')
+    def encoded():
+        response = Response(gzip.compress(b'x' * 4096), mimetype='text/csv')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @site.route('/no-transform')
+    def no_transform():
+        response = Response('y' * 4096, mimetype='text/plain')
+        response.headers['Cache-Control'] = 'no-transform'
+        return response
+
+    @site.route('/missing')
+    def missing():
+        return Response('z' * 4096, status=404, mimetype='text/plain')
+
+    @site.route('/stream')
+    def stream():
+        def rows():
+            for i in range(3):
+                yield f'{{"row": {i}}}\n' * 50
+        return Response(stream_with_context(rows()), mimetype='application/x-ndjson')
+
+    site.wsgi_app = CompressionMiddleware(site.wsgi_app, min_size=1024)
+    return site
+
+
+def test_negotiation():
+    best = available_encodings()[0]
+    assert negotiate(None) is None
+    assert negotiate('identity') is None
+    assert negotiate('gzip') == 'gzip'
+    assert negotiate('GZIP;q=0.5, deflate') == 'gzip'
+    assert negotiate('gzip;q=0') is None
+    assert negotiate('*') == best
+    assert negotiate('br;q=1.0, gzip;q=0.8') == best
+    assert negotiate('br;q=0.2, gzip;q=0.8') == 'gzip'
+    assert negotiate('gzip;q=oops, *;q=0') is None
+
+
+def test_middleware_compresses_only_what_it_should():
+    client = _site().test_client()
+
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) == len(response.data) < len(_json_bytes(BIG))
+    assert gzip.decompress(response.data) == _json_bytes(BIG)
+    assert response.headers['ETag'] == '"abc-gzip"'
+    assert response.headers.get_all('Vary') == ['Origin, Accept-Encoding']
+
+    identity = client.get('/big')
+    assert 'Content-Encoding' not in identity.headers and identity.headers['ETag'] == '"abc"'
+    assert client.head('/big', headers={'Accept-Encoding': 'gzip'}).headers.get('Content-Encoding') is None
+
+    for path in ('/small', '/image', '/no-transform', '/missing'):
+        assert 'Content-Encoding' not in client.get(path, headers={'Accept-Encoding': 'gzip'}).headers
+    encoded = client.get('/encoded', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(encoded.data) == b'x' * 4096
+
+
+def test_streamed_responses_flush_every_chunk():
+    site = _site()
+    with site.test_request_context('/stream', headers={'Accept-Encoding': 'gzip'}) as context:
+        environ = context.request.environ
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['headers'] = dict(headers)
+
+    body = site.wsgi_app(environ, start_response)
+    assert captured['headers']['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in captured['headers']
+
+    decompressor = zlib.decompressobj(31)
+    received = []
+    for chunk in body:
+        # Each row batch decodes on arrival rather than at the end of the stream
+        received.append(decompressor.decompress(chunk))
+    body.close()
+    assert [part.count(b'\n') for part in received if part] == [50, 50, 50]
+
+
+def test_cached_variants_follow_configuration():
+    for enabled in (True, False):
+        cache = ResponseCache(MemoryBackend(), compression=enabled, compress_min_size=1024)
+        site = Flask(__name__)
+
+        @site.route('/news')
+        @cache.cached(tags=['news'])
+        def news():
+            return jsonify(BIG)
+
+        client = site.test_client()
+        for expected in ('MISS', 'HIT'):
+            response = client.get('/news', headers={'Accept-Encoding': 'gzip'})
+            assert response.headers['X-Cache'] == expected
+            if enabled:
+                assert gzip.decompress(response.data) == _json_bytes(BIG)
+                assert response.headers.get_all('Vary') == ['Accept-Encoding']
+            else:
+                assert response.data == _json_bytes(BIG)
+                assert 'Content-Encoding' not in response.headers and 'Vary' not in response.headers
+        # Compressed once, then replayed from the stored variant
+        assert cache.stats()['compressions'] == (1 if enabled else 0)
+
+
+if __name__ == '__main__':
+    test_negotiation()
+    test_middleware_compresses_only_what_it_should()
+    test_streamed_responses_flush_every_chunk()
+    test_cached_variants_follow_configuration()
+    print('OK')
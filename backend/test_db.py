@@ -0,0 +1,39 @@
+"""
+Database adapter tests.
+
+Checks the qmark to pyformat translation used by the PostgreSQL adapter:
+placeholders become %s, but question marks inside string literals and
+quoted identifiers are left alone and every literal % is doubled, since
+psycopg2 formats the whole statement.
+
+    python -m pytest test_db.py
+    python test_db.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import _qmark_to_pyformat  # noqa: E402
+
+
+def test_placeholders_outside_quotes_only():
+    assert _qmark_to_pyformat('SELECT id FROM donations WHERE id = ? AND status = ?') == \
+        'SELECT id FROM donations WHERE id = %s AND status = %s'
+    assert _qmark_to_pyformat(
+        "SELECT 'why?', \"odd?name\" FROM t WHERE note = 'it''s ? here' AND id = ?"
+    ) == "SELECT 'why?', \"odd?name\" FROM t WHERE note = 'it''s ? here' AND id = %s"
+
+
+def test_percent_signs_are_escaped():
+    assert _qmark_to_pyformat("SELECT title FROM news_articles WHERE title LIKE '%vote%' AND id > ?") == \
+        "SELECT title FROM news_articles WHERE title LIKE '%%vote%%' AND id > %s"
+    assert _qmark_to_pyformat('SELECT amount % 100 FROM donations WHERE id = ?') == \
+        'SELECT amount %% 100 FROM donations WHERE id = %s'
+
+
+if __name__ == '__main__':
+    test_placeholders_outside_quotes_only()
+    test_percent_signs_are_escaped()
+    print('OK')
@@ -0,0 +1,313 @@
+"""
+M-Pesa donation tests.
+
+Posts a burst of donations against the Daraja emulator, which takes a
+while to answer each STK push, checking that the endpoint returns
+donation ids at once and that the status endpoint follows each donation
+from 'pending_init' through the push to the callback, and that repeated
+or early callbacks are applied, and added to the fundraising totals,
+exactly once. A push whose answer is lost stays 'pushing' for the
+sweeper, while one that never reached Daraja fails. Runs against a throwaway
+SQLite file, or the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_donations.py
+    python test_donations.py [donations]   e.g. 2000 for a load run
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-donations-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'donations.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, callback_processor, db_pool, donation_initiator, init_database, mpesa  # noqa: E402
+from daraja_emulator import DarajaEmulator  # noqa: E402
+from donations import DonationInitiator  # noqa: E402
+import fundraising  # noqa: E402
+
+DONATIONS = 200
+PUSH_DELAY = 0.05
+REJECTED_PHONE = '0123'
+
+
+def _deliver(url, body):
+    """Emulator callback delivery straight into the app"""
+    app.test_client().post(urlparse(url).path, json=body)
+
+
+def emulator(**options):
+    options.setdefault('deliver', _deliver)
+    daraja = DarajaEmulator(**options).start()
+    mpesa.base_url = daraja.base_url
+    return daraja
+
+
+def _wait_for(client, donation_id, statuses, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f'/api/donations/{donation_id}/status').get_json()
+        if status['status'] in statuses:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'donation {donation_id} stuck in {status["status"]}')
+
+
+def _donate(client, phone='0712345678'):
+    return client.post('/api/donations/mpesa', json={
+        'amount': 100, 'phone': phone, 'donor_name': 'Test Donor', 'donor_email': 'donor@example.com'
+    })
+
+
+def _callback(checkout_request_id, result_code=0, receipt='RCPT001'):
+    callback = {'Body': {'stkCallback': {
+        'MerchantRequestID': 'mr-test',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.' if result_code == 0
+                      else 'Request cancelled by user',
+    }}}
+    if result_code == 0:
+        callback['Body']['stkCallback']['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': 100},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+            {'Name': 'PhoneNumber', 'Value': 254712345678}
+        ]}
+    return callback
+
+
+def test_burst_of_donations_is_pushed_in_background():
+    init_database()
+    base_url = mpesa.base_url
+    daraja = emulator(latency=PUSH_DELAY, callback_delay=0.5)
+    client = app.test_client()
+    try:
+        started = time.monotonic()
+        ids = []
+        for _ in range(DONATIONS):
+            response = _donate(client)
+            assert response.status_code == 202
+            ids.append(response.get_json()['donation_id'])
+        # Accepting the burst does not wait on a single STK push round trip each
+        assert time.monotonic() - started < DONATIONS * PUSH_DELAY / 2
+
+        checkout_ids = [_wait_for(client, i, ('pending', 'completed'))['checkout_request_id'] for i in ids]
+        assert len(set(checkout_ids)) == DONATIONS
+
+        # Daraja calls back once each donor has answered the prompt
+        deadline = time.monotonic() + 30
+        while daraja.stats()['callbacks_delivered'] < DONATIONS and time.monotonic() < deadline:
+            time.sleep(0.05)
+        callback_processor.drain()
+        assert all(_wait_for(client, i, ('completed',))['status'] == 'completed' for i in ids)
+
+        rejected = _donate(client, REJECTED_PHONE).get_json()['donation_id']
+        status = _wait_for(client, rejected, ('failed',))
+        assert 'Invalid PhoneNumber' in status['detail']
+
+        assert client.get('/api/donations/999999999/status').status_code == 404
+        assert donation_initiator.stats()['pushed'] >= DONATIONS
+    finally:
+        mpesa.base_url = base_url
+        daraja.stop()
+
+
+def test_callbacks_are_applied_once():
+    init_database()
+    conn = db_pool.acquire()
+    try:
+        tag = time.time_ns()
+        ids = []
+        for i in range(3):
+            cursor = conn.execute('''
+                INSERT INTO donations (donor_name, amount, payment_method, status, checkout_request_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ('Test Donor', 100, 'mpesa', 'pending', f'ws_CO_{tag}_{i}'))
+            ids.append(cursor.lastrowid)
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+    client = app.test_client()
+
+    # Safaricom retries: the same success callback three times, and a late failure
+    for _ in range(3):
+        client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_0', receipt=f'R{tag}'))
+    client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_0', result_code=1032))
+    client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_1', result_code=1032))
+    # A callback that arrives before its push is recorded is held for a retry
+    client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_early'))
+    client.post('/api/mpesa/callback', data='not json', content_type='application/json')
+
+    before = callback_processor.stats()
+    assert callback_processor.drain() == 7
+    after = callback_processor.stats()
+    processed = {name: after[f'{name}_by_this_process'] - before[f'{name}_by_this_process']
+                 for name in ('applied', 'duplicate', 'retried', 'invalid')}
+    assert processed == {'applied': 2, 'duplicate': 3, 'retried': 1, 'invalid': 1}
+
+    completed = client.get(f'/api/donations/{ids[0]}/status').get_json()
+    assert completed['status'] == 'completed'
+    failed = client.get(f'/api/donations/{ids[1]}/status').get_json()
+    assert failed['status'] == 'failed' and failed['detail'] == 'Request cancelled by user'
+    assert client.get(f'/api/donations/{ids[2]}/status').get_json()['status'] == 'pending'
+
+    conn = db_pool.acquire()
+    try:
+        receipt = conn.execute('SELECT transaction_id FROM donations WHERE id = ?', (ids[0],)).fetchone()[0]
+    finally:
+        db_pool.release(conn)
+    assert receipt == f'R{tag}'
+
+
+def test_rollups_count_each_completion_once():
+    init_database()
+    client = app.test_client()
+    before = client.get('/api/donations/summary').get_json()
+    assert before['currency'] == 'KES'
+
+    tag = time.time_ns()
+    conn = db_pool.acquire()
+    try:
+        for i, amount in enumerate((100, 250.5, 1000)):
+            conn.execute('''
+                INSERT INTO donations (donor_name, amount, payment_method, status, checkout_request_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ('Test Donor', amount, 'mpesa', 'pending', f'ws_CO_{tag}_r{i}'))
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+
+    for i in range(3):
+        client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_r{i}', result_code=0 if i < 2 else 1032))
+    client.post('/api/mpesa/callback', json=_callback(f'ws_CO_{tag}_r0'))
+    callback_processor.drain()
+
+    after = client.get('/api/donations/summary').get_json()
+    assert after['donation_count'] == before['donation_count'] + 2
+    assert round(after['total_amount'] - before['total_amount'], 2) == 350.5
+
+    breakdown = client.get('/api/admin/donations/summary?bucket=hour').get_json()
+    assert breakdown['by_payment_method']['mpesa']['donation_count'] >= 2
+    assert sum(p['donation_count'] for p in breakdown['series']) >= 2
+    assert client.get('/api/admin/donations/summary?bucket=week').status_code == 400
+
+    # The incremental totals match a full recount
+    conn = db_pool.acquire()
+    try:
+        fundraising.rebuild(conn)
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+    assert client.get('/api/donations/summary').get_json() == after
+
+
+class _FailingPush:
+    """Stands in for MPesaAPI, raising the given error from every STK push"""
+
+    guard = mpesa.guard
+
+    def __init__(self, error):
+        self.error = error
+
+    def stk_push(self, **kwargs):
+        raise self.error
+
+
+def test_unanswered_push_is_left_for_reconciliation():
+    init_database()
+    outcomes = {}
+    for name, error in (('lost', requests.exceptions.ReadTimeout('read timed out')),
+                        ('unsent', requests.exceptions.ConnectTimeout('connect timed out'))):
+        initiator = DonationInitiator(db_pool, _FailingPush(error), workers=1)
+        conn = db_pool.acquire()
+        try:
+            donation_id = conn.execute('''
+                INSERT INTO donations (donor_name, amount, payment_method, status)
+                VALUES (?, ?, ?, ?)
+            ''', ('Test Donor', 100, 'mpesa', 'pending_init')).lastrowid
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+        initiator.submit(donation_id, '0712345678', 100, f'DONATION_{donation_id}', 'Donation').result()
+        conn = db_pool.acquire()
+        try:
+            outcomes[name] = (initiator.status(conn, donation_id)['status'], initiator.stats())
+        finally:
+            db_pool.release(conn)
+
+    # The donor may already have the prompt: not failed, and left to the sweeper
+    status, stats = outcomes['lost']
+    assert status == 'pushing' and stats['unconfirmed'] == 1 and stats['failed'] == 0
+    status, stats = outcomes['unsent']
+    assert status == 'failed' and stats['unconfirmed'] == 0 and stats['failed'] == 1
+
+
+def load_run(count, **options):
+    """Donations against the emulator: accept latency and time until all settle"""
+    init_database()
+    daraja = emulator(**options)
+    client = app.test_client()
+    latencies, ids = [], []
+    started = time.monotonic()
+    try:
+        for _ in range(count):
+            sent = time.monotonic()
+            response = _donate(client)
+            latencies.append(time.monotonic() - sent)
+            if response.status_code == 202:
+                ids.append(response.get_json()['donation_id'])
+        accepted = time.monotonic() - started
+
+        # Stands in for the callback worker thread that tests leave switched off
+        stop = threading.Event()
+
+        def apply_callbacks():
+            while not stop.wait(0.2):
+                callback_processor.drain()
+
+        threading.Thread(target=apply_callbacks, daemon=True).start()
+        settled = {}
+        deadline = time.monotonic() + 120
+        while len(settled) < len(ids) and time.monotonic() < deadline:
+            for donation_id in ids:
+                if donation_id not in settled:
+                    status = client.get(f'/api/donations/{donation_id}/status').get_json()['status']
+                    if status in ('completed', 'failed'):
+                        settled[donation_id] = status
+            time.sleep(0.2)
+        stop.set()
+    finally:
+        daraja.stop()
+
+    latencies.sort()
+    print(f"{len(ids)} of {count} donations accepted in {accepted:.2f}s "
+          f"(p50 {statistics.median(latencies) * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms)")
+    print(f"{list(settled.values()).count('completed')} completed, "
+          f"{list(settled.values()).count('failed')} failed, "
+          f"{len(ids) - len(settled)} unsettled after {time.monotonic() - started:.1f}s")
+    print(f"emulator: {daraja.stats()}")
+    print(f"stk pushes: {donation_initiator.stats()}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # e.g. python test_donations.py 2000 -> load run with Daraja-like latency and failures
+        load_run(int(sys.argv[1]), latency=0.3, jitter=0.7, error_rate=0.01,
+                 cancel_rate=0.1, callback_delay=2.0)
+    else:
+        test_burst_of_donations_is_pushed_in_background()
+        test_callbacks_are_applied_once()
+        test_rollups_count_each_completion_once()
+        test_unanswered_push_is_left_for_reconciliation()
+        print('OK')
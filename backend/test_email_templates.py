@@ -0,0 +1,88 @@
+"""
+Email template tests.
+
+Renders every registered notification with the sample context through a
+strict registry, checking that the compiled templates give the same
+output as compiling on every call, that only the HTML body is escaped,
+and that unknown template names and missing variables are errors rather
+than blank emails.
+
+    python -m pytest test_email_templates.py
+    python test_email_templates.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask  # noqa: E402
+from flask_mail import Mail  # noqa: E402
+from jinja2 import UndefinedError  # noqa: E402
+
+from email_templates import SAMPLE_CONTEXT, TEMPLATES, EmailTemplateRegistry  # noqa: E402
+
+
+def _raises(error, call, *args, **kwargs):
+    try:
+        call(*args, **kwargs)
+    except error:
+        return True
+    return False
+
+
+def test_every_template_renders():
+    registry = EmailTemplateRegistry(strict=True)
+    assert registry.names() == sorted(TEMPLATES)
+
+    for name in registry.names():
+        rendered = registry.render(name, **SAMPLE_CONTEXT)
+        assert rendered.subject and '\n' not in rendered.subject, name
+        assert rendered.html.strip().startswith('<h2>'), name
+        assert rendered.text and '<' not in rendered.text, name
+        assert '{{' not in rendered.html + rendered.text, name
+
+        uncompiled = registry.render_uncompiled(name, **SAMPLE_CONTEXT)
+        assert (uncompiled.subject, uncompiled.html, uncompiled.text) == \
+            (rendered.subject, rendered.html, rendered.text), name
+
+    reply = registry.render('contact_reply', **SAMPLE_CONTEXT)
+    assert 'Dear Achieng Otieno' in reply.text
+    assert 'When does the borehole work start?<br>Thank you.' in reply.html
+
+
+def test_only_html_is_escaped():
+    registry = EmailTemplateRegistry(strict=True)
+    context = dict(SAMPLE_CONTEXT, name='<b>Otieno & sons</b>', subject='Roads & <bridges>')
+    rendered = registry.render('contact_admin', **context)
+    assert '&lt;b&gt;Otieno &amp; sons&lt;/b&gt;' in rendered.html
+    assert '<b>Otieno & sons</b>' in rendered.text
+    assert rendered.subject == 'New Contact Form Submission: Roads & <bridges>'
+
+
+def test_unknown_names_and_missing_values_fail():
+    registry = EmailTemplateRegistry(strict=True)
+    assert _raises(KeyError, registry.render, 'no_such_template', **SAMPLE_CONTEXT)
+    assert _raises(KeyError, registry.source, 'no_such_template')
+    assert _raises(UndefinedError, registry.render, 'contact_admin', name='Achieng Otieno')
+
+    # The lenient registry the app uses leaves missing optional values blank
+    lenient = EmailTemplateRegistry()
+    assert 'Dear Supporter' in lenient.render('newsletter_welcome').text
+
+    site = Flask(__name__)
+    site.config['MAIL_DEFAULT_SENDER'] = 'test@example.com'
+    Mail(site)
+    with site.app_context():
+        assert _raises(KeyError, registry.message, 'no_such_template', recipients=['a@example.com'])
+        message = registry.message('newsletter_welcome', recipients=['a@example.com'], name='Achieng')
+    assert message.recipients == ['a@example.com']
+    assert message.subject == 'Welcome to Karachuonyo First Newsletter!'
+    assert 'Dear Achieng' in message.html and message.body.startswith('Welcome to Karachuonyo First!')
+
+
+if __name__ == '__main__':
+    test_every_template_renders()
+    test_only_html_is_escaped()
+    test_unknown_names_and_missing_values_fail()
+    print('OK')
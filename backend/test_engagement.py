@@ -0,0 +1,153 @@
+"""
+Article engagement buffer tests.
+
+Records views, likes and shares from many threads (and from forked
+workers sharing a segment) and checks that they are visible as pending
+at once, are written to news_articles by a single flush, and that a
+failed flush keeps its deltas for the next one. Runs against a throwaway
+SQLite file, or the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_engagement.py
+    python test_engagement.py
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-engagement-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'engagement.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest  # noqa: E402
+
+from app import db_pool, init_database  # noqa: E402
+from engagement import EngagementBuffer  # noqa: E402
+from sharedmem import SharedSegment  # noqa: E402
+
+THREADS = 8
+VIEWS_PER_THREAD = 250
+
+
+def _add_article():
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.execute('''
+            INSERT INTO news_articles (title, slug, content, status, views, likes, shares)
+            VALUES (?, ?, ?, 'published', 100, 5, 0)
+        ''', ('Engagement test', f'engagement-test-{time.time_ns()}', 'Body'))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        db_pool.release(conn)
+
+
+def _counts(article_id):
+    conn = db_pool.acquire()
+    try:
+        return conn.execute(
+            'SELECT views, likes, shares FROM news_articles WHERE id = ?', (article_id,)
+        ).fetchone()
+    finally:
+        db_pool.release(conn)
+
+
+class _EmptyDatabasePool:
+    """Connections to a database without news_articles, so every flush fails"""
+
+    def acquire(self):
+        return sqlite3.connect(':memory:')
+
+    def release(self, conn):
+        conn.close()
+
+
+def test_deltas_coalesce_into_one_flush():
+    init_database()
+    first, second = _add_article(), _add_article()
+    buffer = EngagementBuffer(db_pool, flush_interval=3600, flush_threshold=10 ** 6)
+
+    def visit():
+        for i in range(VIEWS_PER_THREAD):
+            buffer.add(first if i % 2 else second, 'views')
+        buffer.add(first, 'likes')
+
+    threads = [threading.Thread(target=visit) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Pending deltas are visible before anything is written
+    half = THREADS * VIEWS_PER_THREAD // 2
+    assert buffer.pending(first) == {'views': half, 'likes': THREADS, 'shares': 0}
+    assert _counts(first) == (100, 5, 0)
+
+    assert buffer.flush() == 2
+    assert _counts(first) == (100 + half, 5 + THREADS, 0)
+    assert _counts(second) == (100 + half, 5, 0)
+    assert buffer.pending(first) == {'views': 0, 'likes': 0, 'shares': 0}
+    stats = buffer.stats()
+    assert stats['flushes'] == 1 and stats['rows_written'] == 2
+    assert stats['deltas_written'] == THREADS * VIEWS_PER_THREAD + THREADS
+    buffer.stop()
+
+
+def _shared_visits(buffer, article_id):
+    for _ in range(VIEWS_PER_THREAD):
+        buffer.add(article_id, 'views')
+    buffer.add(article_id, 'shares', 2)
+
+
+def test_forked_workers_share_pending_deltas():
+    init_database()
+    article_id = _add_article()
+    segment = SharedSegment(counter_slots=256, cache_slots=4, cache_value_size=64)
+    buffer = EngagementBuffer(db_pool, flush_interval=3600, flush_threshold=10 ** 6, segment=segment)
+
+    fork = multiprocessing.get_context('fork')
+    workers = [fork.Process(target=_shared_visits, args=(buffer, article_id)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert worker.exitcode == 0
+
+    # Whichever worker flushes writes the deltas every worker recorded
+    assert buffer.pending(article_id) == {'views': 4 * VIEWS_PER_THREAD, 'likes': 0, 'shares': 8}
+    assert buffer.flush() == 1
+    assert _counts(article_id) == (100 + 4 * VIEWS_PER_THREAD, 5, 8)
+    assert segment.stats()['counter_slots_used'] == 0
+    buffer.stop()
+
+
+def test_failed_flush_keeps_its_deltas():
+    init_database()
+    article_id = _add_article()
+    buffer = EngagementBuffer(_EmptyDatabasePool(), flush_interval=3600, flush_threshold=10 ** 6)
+    buffer.add(article_id, 'views', 3)
+    buffer.add(article_id, 'likes')
+
+    with pytest.raises(sqlite3.OperationalError):
+        buffer.flush()
+    assert buffer.pending(article_id) == {'views': 3, 'likes': 1, 'shares': 0}
+    assert buffer.stats()['failures'] == 1
+
+    buffer.pool = db_pool
+    assert buffer.flush() == 1
+    assert _counts(article_id) == (103, 6, 0)
+    buffer.stop()
+
+
+if __name__ == '__main__':
+    test_deltas_coalesce_into_one_flush()
+    test_forked_workers_share_pending_deltas()
+    test_failed_flush_keeps_its_deltas()
+    print('OK')
@@ -0,0 +1,96 @@
+"""
+Concurrency stress test for event RSVP capacity.
+
+Hammers a single event from many threads and checks that confirmed
+registrations never exceed max_attendees. Runs against a throwaway SQLite
+file, or the database in TEST_DATABASE_URL when set (e.g. a scratch
+PostgreSQL database).
+
+    python -m pytest test_event_registration.py
+    python test_event_registration.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-rsvp-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'rsvp.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db_pool, init_database  # noqa: E402
+
+CAPACITY = 25
+ATTENDEES = 200
+THREADS = 32
+
+
+def test_concurrent_rsvps_never_overbook():
+    init_database()
+    # Switch threads as often as possible to widen any check-then-act window
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    client = app.test_client()
+
+    response = client.post('/api/admin/events', json={
+        'title': f'Stress Rally {os.getpid()}',
+        'event_date': '2030-01-01T10:00:00',
+        'registration_required': True,
+        'max_attendees': CAPACITY
+    })
+    event_id = response.get_json()['id']
+
+    start = threading.Barrier(THREADS)
+
+    def rsvp(i):
+        if i < THREADS:
+            start.wait()
+        # Every fifth request retries an earlier email to exercise the unique index
+        email = f'attendee{i - i % 5}@example.com' if i % 5 == 4 else f'attendee{i}@example.com'
+        response = app.test_client().post(
+            f'/api/events/{event_id}/register',
+            json={'name': f'Attendee {i}', 'email': email}
+        )
+        return response.status_code, response.get_json()
+
+    try:
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            results = list(executor.map(rsvp, range(ATTENDEES)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    accepted = [body for status, body in results if status == 200]
+    errors = [body['error'] for status, body in results if status != 200]
+
+    assert len(accepted) == CAPACITY
+    assert set(errors) <= {'This event is fully booked', 'You are already registered for this event'}
+
+    conn = db_pool.acquire()
+    try:
+        confirmed = conn.execute(
+            "SELECT COUNT(*) FROM event_registrations WHERE event_id = ? AND status = 'confirmed'",
+            (event_id,)
+        ).fetchone()[0]
+        distinct_emails = conn.execute(
+            'SELECT COUNT(DISTINCT email) FROM event_registrations WHERE event_id = ?',
+            (event_id,)
+        ).fetchone()[0]
+        counter = conn.execute(
+            'SELECT registration_count FROM events WHERE id = ?', (event_id,)
+        ).fetchone()[0]
+    finally:
+        db_pool.release(conn)
+
+    assert confirmed == CAPACITY
+    assert distinct_emails == CAPACITY
+    assert counter == CAPACITY
+
+
+if __name__ == '__main__':
+    test_concurrent_rsvps_never_overbook()
+    print(f'OK: {ATTENDEES} concurrent RSVPs, {CAPACITY} seats, no overbooking')
@@ -0,0 +1,110 @@
+"""
+Conditional GET tests.
+
+Fetches public endpoints and replays their validators: a matching
+If-None-Match (for the identity or a compressed representation) or a
+recent enough If-Modified-Since must get a bodyless 304 with the same
+ETag and Cache-Control, and anything else the full response. Endpoints
+without a policy get neither. Runs against a throwaway SQLite file, or
+the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_http_cache.py
+    python test_http_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-http-cache-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'http_cache.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.http import http_date  # noqa: E402
+
+from app import app, init_database  # noqa: E402
+
+
+def _publish_article(client):
+    title = f'Validators {time.time_ns()}'
+    response = client.post('/api/admin/news', json={
+        'title': title, 'content': '<p>' + 'Kendu Bay water project. ' * 80 + '</p>',
+        'status': 'published', 'tags': 'water'
+    })
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def test_etag_and_last_modified_revalidation():
+    init_database()
+    client = app.test_client()
+    article_id = _publish_article(client)
+    url = f'/api/news/{article_id}'
+
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    last_modified = first.last_modified
+    assert last_modified is not None
+    assert first.headers['Cache-Control'] == app.config['HTTP_CACHE_POLICIES']['get_news_article']
+
+    revalidated = client.get(url, headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+    assert revalidated.headers['Cache-Control'] == first.headers['Cache-Control']
+
+    assert client.get(url, headers={'If-None-Match': '"stale", ' + etag}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': '"stale"'}).status_code == 200
+
+    # If-Modified-Since is only consulted without If-None-Match
+    assert client.get(url, headers={'If-Modified-Since': http_date(last_modified)}).status_code == 304
+    earlier = http_date(last_modified - timedelta(seconds=5))
+    assert client.get(url, headers={'If-Modified-Since': earlier}).status_code == 200
+    assert client.get(url, headers={
+        'If-None-Match': '"stale"', 'If-Modified-Since': http_date(last_modified)
+    }).status_code == 200
+
+
+def test_compressed_representation_revalidates():
+    init_database()
+    client = app.test_client()
+    url = f'/api/news/{_publish_article(client)}'
+
+    identity = client.get(url).headers['ETag']
+    gzipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] not in (identity, None)
+
+    # Either tag answers for the article, whichever encoding is asked for now
+    for etag in (identity, gzipped.headers['ETag']):
+        response = client.get(url, headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert response.status_code == 304 and response.headers['ETag'] == etag
+
+
+def test_uncached_views_and_endpoints_without_policy():
+    init_database()
+    client = app.test_client()
+
+    # Search is not response-cached: its ETag is hashed per request
+    first = client.get('/api/news/search?q=water')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert client.get('/api/news/search?q=water',
+                      headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    admin = client.get('/api/admin/news')
+    assert admin.status_code == 200
+    assert 'Cache-Control' not in admin.headers or 'public' not in admin.headers['Cache-Control']
+    assert client.get('/api/admin/news', headers={'If-None-Match': '*'}).status_code == 200
+
+
+if __name__ == '__main__':
+    test_etag_and_last_modified_revalidation()
+    test_compressed_representation_revalidates()
+    test_uncached_views_and_endpoints_without_policy()
+    print('OK')
@@ -0,0 +1,170 @@
+"""
+Live update tests.
+
+Subscribes several streams to the same topics and checks they share one
+publisher per topic, get a snapshot and then only the fields that change,
+that /api/live streams events and heartbeats uncompressed, and that a
+client too slow to drain its queue is dropped instead of buffered for, and
+that the stream cap follows the gunicorn thread count. Runs against a throwaway SQLite file, or the database in TEST_DATABASE_URL
+when set.
+
+    python -m pytest test_live.py
+    python test_live.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-live-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'live.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest  # noqa: E402
+
+from app import app, db_pool, init_database, live_hub  # noqa: E402
+from live import LiveBusyError, LiveHub, LiveTopicError  # noqa: E402
+
+
+def _add_article():
+    conn = db_pool.acquire()
+    try:
+        slug = f'live-test-{time.time_ns()}'
+        cursor = conn.execute('''
+            INSERT INTO news_articles (title, slug, content, status, views, likes, shares)
+            VALUES (?, ?, ?, 'published', 10, 2, 1)
+        ''', ('Live test', slug, 'Body'))
+        conn.commit()
+        return cursor.lastrowid, slug
+    finally:
+        db_pool.release(conn)
+
+
+def _messages(subscriber):
+    messages = []
+    while not subscriber.queue.empty():
+        messages.append(subscriber.queue.get_nowait())
+    return messages
+
+
+def test_subscribers_share_publishers_and_get_deltas():
+    init_database()
+    client = app.test_client()
+    article_id, slug = _add_article()
+    topics = [f'article:{article_id}', 'fundraising']
+
+    first = live_hub.subscribe(topics)
+    second = live_hub.subscribe(topics + [f'article:{slug}'])
+    try:
+        assert live_hub.stats()['topics'] == 3
+        live_hub.poll()
+        snapshots = {payload['topic']: payload['data'] for _, payload in _messages(first)}
+        assert snapshots[f'article:{article_id}'] == {'views': 10, 'likes': 2, 'shares': 1}
+        assert 'total_amount' in snapshots['fundraising']
+        assert [event for event, _ in _messages(second)] == ['snapshot'] * 3
+
+        assert client.post(f'/api/news/{article_id}/like').status_code == 200
+        live_hub.poll()
+        updates = _messages(first)
+        assert updates == [('update', {'topic': f'article:{article_id}', 'version': 2, 'data': {'likes': 3}})]
+        assert len(_messages(second)) == 2  # the same article by id and by slug
+
+        # Nothing changed, nothing sent
+        assert live_hub.poll() == 0
+    finally:
+        live_hub.unsubscribe(first)
+        live_hub.unsubscribe(second)
+    assert live_hub.stats()['topics'] == 0
+
+
+def test_stream_endpoint():
+    init_database()
+    client = app.test_client()
+    article_id, _ = _add_article()
+
+    assert client.get('/api/live?topics=nonsense').status_code == 400
+    assert client.get('/api/live').status_code == 400
+
+    # A publisher with values already known answers new streams at once
+    watcher = live_hub.subscribe([f'article:{article_id}'])
+    live_hub.poll()
+    heartbeat, live_hub.heartbeat = live_hub.heartbeat, 0.05
+    try:
+        response = client.get(f'/api/live?topics=article:{article_id}',
+                              headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert 'Content-Encoding' not in response.headers
+        assert live_hub.stats()['subscribers'] == 2
+
+        chunks = response.response
+        assert next(chunks) == b'retry: 5000\n\n'
+        event, data = next(chunks).decode().strip().split('\n')
+        assert event == 'event: snapshot'
+        assert json.loads(data[len('data: '):])['data']['views'] == 10
+        assert next(chunks) == b': ping\n\n'
+        response.close()
+        assert live_hub.stats()['subscribers'] == 1
+    finally:
+        live_hub.heartbeat = heartbeat
+        live_hub.unsubscribe(watcher)
+
+
+def test_slow_subscriber_is_dropped():
+    counter = {'value': 0}
+
+    def source(conn, keys):
+        return {key: {'count': counter['value']} for key in keys}
+
+    hub = LiveHub(db_pool, {'event': source}, queue_size=2, max_subscribers=2)
+    fast = hub.subscribe(['event:1'])
+    slow = hub.subscribe(['event:1'])
+    with pytest.raises(LiveBusyError):
+        hub.subscribe(['event:1'])
+    with pytest.raises(LiveTopicError):
+        hub.subscribe(['event:one'])
+
+    for value in range(5):
+        counter['value'] = value
+        hub.poll()
+        assert len(_messages(fast)) == 1
+
+    # The slow stream's backlog was discarded and it ends at its next read
+    assert slow.closed and list(hub.stream(slow)) == [b'retry: 5000\n\n']
+    stats = hub.stats()
+    assert stats['dropped'] == 1 and stats['subscribers'] == 1
+    hub.unsubscribe(fast)
+    assert hub.stats()['topics'] == 0
+
+
+def _live_settings(**environ):
+    """GUNICORN_THREADS and LIVE_MAX_SUBSCRIBERS as gunicorn.conf.py would load them"""
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('GUNICORN_THREADS', 'LIVE_MAX_SUBSCRIBERS')}
+    env.update(environ)
+    script = ("import runpy; c = runpy.run_path('gunicorn.conf.py'); "
+              "print(c['threads'], c['settings']['LIVE_MAX_SUBSCRIBERS'])")
+    output = subprocess.run([sys.executable, '-c', script], env=env, check=True, capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return tuple(int(value) for value in output.split())
+
+
+def test_stream_cap_follows_gunicorn_threads():
+    assert _live_settings() == (64, 48)
+    assert _live_settings(GUNICORN_THREADS='16') == (16, 12)
+    assert _live_settings(GUNICORN_THREADS='16', LIVE_MAX_SUBSCRIBERS='4') == (16, 4)
+    assert live_hub.max_subscribers == app.config['LIVE_MAX_SUBSCRIBERS'] < app.config['GUNICORN_THREADS']
+
+
+if __name__ == '__main__':
+    test_subscribers_share_publishers_and_get_deltas()
+    test_stream_endpoint()
+    test_slow_subscriber_is_dropped()
+    test_stream_cap_follows_gunicorn_threads()
+    print('OK')
@@ -0,0 +1,140 @@
+"""
+Schema migration tests.
+
+Applies every migration to an empty SQLite database and checks they run
+once each in version order, that a second run changes nothing, what
+`migrations.py status` prints before and after an upgrade, and that a
+database left at the baseline schema with data in it upgrades with its
+fundraising rollups and search index filled from the existing rows.
+
+    python -m pytest test_migrations.py
+    python test_migrations.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fundraising  # noqa: E402
+from db import pool_from_url  # noqa: E402
+from migrations import MIGRATIONS, apply_migrations, applied_migrations, current_version, main  # noqa: E402
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def _database(name):
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='karachuonyo-migrations-'), name)}"
+    return url, pool_from_url(url, {})
+
+
+def _schema(conn):
+    return conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+    ).fetchall()
+
+
+def _status(url):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert main(['--database-url', url, 'status']) == 0
+    return out.getvalue()
+
+
+def test_apply_in_order_then_nothing_to_do():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+
+    _, pool = _database('fresh.db')
+    conn = pool.acquire()
+    try:
+        assert current_version(conn) == 0
+        assert apply_migrations(conn, pool.dialect, target=3) == [1, 2, 3]
+        assert apply_migrations(conn, pool.dialect) == versions[3:]
+        assert [row[0] for row in applied_migrations(conn)] == versions
+        assert [row[1] for row in applied_migrations(conn)] == [m[1] for m in MIGRATIONS]
+
+        schema = _schema(conn)
+        assert apply_migrations(conn, pool.dialect) == []
+        assert _schema(conn) == schema and current_version(conn) == LATEST
+    finally:
+        pool.release(conn)
+        pool.close_all()
+
+
+def test_status_lists_applied_and_pending():
+    url, pool = _database('status.db')
+    conn = pool.acquire()
+    try:
+        apply_migrations(conn, pool.dialect, target=LATEST - 2)
+    finally:
+        pool.release(conn)
+        pool.close_all()
+
+    before = _status(url)
+    assert f'Current version: {LATEST - 2}' in before
+    assert '[applied] 0001 baseline schema' in before
+    pending = [line.strip() for line in before.splitlines() if '[pending]' in line]
+    assert pending == [f'[pending] {version:04d} {description}'
+                       for version, description, _ in MIGRATIONS[-2:]]
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert main(['--database-url', url, 'upgrade']) == 0
+    assert f'Applied migrations: {LATEST - 1}, {LATEST}' in out.getvalue()
+    after = _status(url)
+    assert f'Current version: {LATEST}' in after and '[pending]' not in after
+
+
+def test_baseline_database_upgrades_with_its_data():
+    _, pool = _database('baseline.db')
+    conn = pool.acquire()
+    try:
+        assert apply_migrations(conn, pool.dialect, target=1) == [1]
+        conn.executemany('''
+            INSERT INTO donations (donor_name, amount, payment_method, status, created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            ('A', 100, 'mpesa', 'completed', '2024-05-01 09:00:00', '2024-05-01T09:05:10.250000'),
+            ('B', 250.5, 'mpesa', 'completed', '2024-05-01 09:30:00', '2024-05-01 09:59:59'),
+            ('C', 1000, 'card', 'completed', '2024-05-02 14:00:00', None),
+            ('D', 75, '', 'completed', '2024-05-02 15:00:00', '2024-05-02 15:01:00'),
+            ('E', 500, 'mpesa', 'pending', '2024-05-02 16:00:00', None),
+        ])
+        conn.execute('''
+            INSERT INTO news_articles (title, slug, content, status)
+            VALUES ('Borehole commissioned', 'borehole', '<p>Water for <b>Kendu Bay</b></p>', 'published')
+        ''')
+        conn.commit()
+
+        assert apply_migrations(conn, pool.dialect) == list(range(2, LATEST + 1))
+
+        # The inlined backfill agrees with fundraising.rebuild() row for row
+        rollups = 'SELECT * FROM donation_rollups ORDER BY bucket, period_start, payment_method'
+        migrated = conn.execute(rollups).fetchall()
+        fundraising.rebuild(conn)
+        conn.commit()
+        assert conn.execute(rollups).fetchall() == migrated
+        assert fundraising.totals(conn) == {'total_amount': 1425.5, 'donation_count': 4}
+        assert ('hour', '2024-05-01T09:00', 'mpesa', 350.5, 2) in migrated
+        assert ('day', '2024-05-02', 'unknown', 75.0, 1) in migrated
+
+        # Existing articles were indexed, with their HTML stripped
+        assert conn.execute(
+            "SELECT body FROM news_search WHERE news_search MATCH 'kendu'"
+        ).fetchall() == [('Water for Kendu Bay',)]
+        # Columns added by later migrations exist on the old rows
+        assert conn.execute('SELECT status_detail, check_attempts FROM donations LIMIT 1').fetchone()
+    finally:
+        pool.release(conn)
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    test_apply_in_order_then_nothing_to_do()
+    test_status_lists_applied_and_pending()
+    test_baseline_database_upgrades_with_its_data()
+    print('OK')
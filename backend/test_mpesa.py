@@ -1,20 +1,152 @@
+"""
+M-Pesa client tests.
+
+Runs MPesaAPI against the local Daraja emulator: token caching and refresh
+after Daraja revokes a token, a single token request however many threads
+need one, an STK push followed by its callback and STK Push Query, and
+recovery from injected 503s. No network access needed.
+
+    python -m pytest test_mpesa.py
+    python test_mpesa.py          checks the configured Daraja credentials instead
+"""
+
 import os
-from dotenv import load_dotenv
-from mpesa import mpesa
-
-# Load environment variables
-load_dotenv()
-
-print('=== M-Pesa Configuration Test ===')
-print(f'Consumer Key: {os.getenv("MPESA_CONSUMER_KEY", "NOT_SET")[:20]}...')
-print(f'Consumer Secret: {os.getenv("MPESA_CONSUMER_SECRET", "NOT_SET")[:20]}...')
-print('\n=== Testing M-Pesa Access Token ===')
-
-try:
-    token = mpesa.get_access_token()
-    if token:
-        print(f'✅ Success: {token[:20]}...')
-    else:
-        print('❌ Failed: No token returned')
-except Exception as e:
-    print(f'❌ Error: {str(e)}')
\ No newline at end of file
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from daraja_emulator import DarajaEmulator  # noqa: E402
+from mpesa import MPesaAPI  # noqa: E402
+from outbound import OutboundGuard  # noqa: E402
+
+
+def _api(emulator, retries=2):
+    api = MPesaAPI(base_url=emulator.base_url)
+    api.guard = OutboundGuard('mpesa-emulator', connect_timeout=1, read_timeout=2, retries=retries,
+                              backoff_base=0.01, failure_threshold=100)
+    return api
+
+
+def test_token_cached_and_refreshed_when_revoked():
+    with DarajaEmulator(callback_delay=60) as emulator:
+        api = _api(emulator)
+        for _ in range(5):
+            assert api.stk_push('0712345678', 10, 'DONATION_1', 'Donation')['ResponseCode'] == '0'
+        assert emulator.stats()['tokens'] == 1
+
+        emulator.revoke_tokens()
+        assert api.stk_push('0712345678', 10, 'DONATION_2', 'Donation')['ResponseCode'] == '0'
+        stats = emulator.stats()
+        assert stats['tokens'] == 2 and stats['rejected_tokens'] == 1 and stats['pushes'] == 6
+
+
+def _concurrently(count, target):
+    """Run ``target`` in ``count`` threads released together; their results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        results[index] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_token_fetched_once_by_concurrent_callers():
+    with DarajaEmulator(latency=0.2, callback_delay=60) as emulator:
+        api = _api(emulator)
+
+        # A cold start: one request for a token, everyone else waits for it
+        tokens = _concurrently(16, api.get_access_token)
+        assert len(set(tokens)) == 1 and emulator.stats()['tokens'] == 1
+
+        # Nearing expiry: one thread refreshes, the rest keep the old token meanwhile
+        old = tokens[0]
+        api.token_expires_at = time.monotonic() + 30
+
+        def timed():
+            started = time.monotonic()
+            return api.get_access_token(), time.monotonic() - started
+
+        results = _concurrently(16, timed)
+        refreshed = [token for token, _ in results if token != old]
+        assert len(refreshed) == 1 and emulator.stats()['tokens'] == 2
+        assert all(elapsed < 0.15 for token, elapsed in results if token == old)
+        assert api.get_access_token() == refreshed[0]
+
+        # A revoked token is replaced once, however many requests it fails
+        emulator.revoke_tokens()
+        pushes = _concurrently(8, lambda: api.stk_push('0712345678', 10, 'DONATION_5', 'Donation'))
+        assert all(push['ResponseCode'] == '0' for push in pushes)
+        stats = emulator.stats()
+        assert stats['tokens'] == 3 and stats['rejected_tokens'] == 8
+        assert api.stats()['token_refreshes'] == 3
+
+
+def test_push_callback_and_query():
+    callbacks = []
+    delivered = threading.Event()
+
+    def deliver(url, body):
+        callbacks.append((url, body))
+        delivered.set()
+
+    with DarajaEmulator(callback_delay=0.2, deliver=deliver) as emulator:
+        api = _api(emulator)
+        pushed = api.stk_push('0712345678', 250, 'DONATION_3', 'Donation')
+        checkout_request_id = pushed['CheckoutRequestID']
+
+        # Before the donor answers, Daraja reports the request as in progress
+        assert api.stk_push_query(checkout_request_id)['errorCode'] == '500.001.1001'
+        assert delivered.wait(5)
+
+        url, body = callbacks[0]
+        assert url == api.callback_url
+        callback = body['Body']['stkCallback']
+        assert callback['CheckoutRequestID'] == checkout_request_id and callback['ResultCode'] == 0
+        items = {item['Name']: item['Value'] for item in callback['CallbackMetadata']['Item']}
+        assert items['Amount'] == 250 and items['PhoneNumber'] == 254712345678
+
+        assert api.stk_push_query(checkout_request_id)['ResultCode'] == '0'
+        assert api.guard.breaker.state == 'closed'
+
+
+def test_injected_errors_are_retried():
+    with DarajaEmulator(callback_delay=60) as emulator:
+        api = _api(emulator, retries=8)
+        pushed = api.stk_push('0712345678', 10, 'DONATION_4', 'Donation')
+        emulator.error_rate = 0.25
+        for _ in range(40):
+            # Queries are idempotent, so injected 503s are retried until one succeeds
+            assert api.stk_push_query(pushed['CheckoutRequestID'])['errorCode'] == '500.001.1001'
+        assert emulator.stats()['errors_injected'] > 0
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from mpesa import mpesa
+
+    # Load environment variables
+    load_dotenv()
+
+    print('=== M-Pesa Configuration Test ===')
+    print(f'Base URL: {mpesa.base_url}')
+    print(f'Consumer Key: {os.getenv("MPESA_CONSUMER_KEY", "NOT_SET")[:20]}...')
+    print(f'Consumer Secret: {os.getenv("MPESA_CONSUMER_SECRET", "NOT_SET")[:20]}...')
+    print('\n=== Testing M-Pesa Access Token ===')
+
+    try:
+        token = mpesa.get_access_token()
+        if token:
+            print(f'✅ Success: {token[:20]}...')
+        else:
+            print('❌ Failed: No token returned')
+    except Exception as e:
+        print(f'❌ Error: {str(e)}')
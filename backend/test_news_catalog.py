@@ -0,0 +1,149 @@
+"""
+News catalog tests.
+
+Builds catalogs over seed articles and published database rows and checks
+newest-first pages, category indexes, lookups by slug and id, and that a
+database article shadows the seed article with its slug until deleted.
+Two catalogs sharing a segment stand in for two gunicorn workers: a write
+through one updates it in place and makes the other reload. Runs against
+a throwaway SQLite file, or the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_news_catalog.py
+    python test_news_catalog.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-catalog-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'catalog.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db_pool, init_database  # noqa: E402
+from news_catalog import NewsCatalog  # noqa: E402
+from sharedmem import SharedSegment  # noqa: E402
+
+
+def _seed(slug, category, created_at, published=True):
+    return {
+        'id': slug,
+        'title': f'Seed {slug}',
+        'category': category,
+        'excerpt': 'Seed excerpt',
+        'content': '<p>Seed body</p>',
+        'tags': [category.lower()],
+        'published': published,
+        'created_at': created_at
+    }
+
+
+def _execute(sql, params=()):
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        db_pool.release(conn)
+
+
+def _add_article(slug, tags, published_at, status='published'):
+    return _execute('''
+        INSERT INTO news_articles (title, slug, excerpt, content, status, tags, published_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (f'Stored {slug}', slug, 'Stored excerpt', '<p>' + 'word ' * 450 + '</p>',
+          status, tags, published_at))
+
+
+def test_pages_categories_and_lookups():
+    init_database()
+    run = time.time_ns()
+    category = f'Ward{run}'
+    seeds = {
+        f'old-{run}': _seed(f'old-{run}', category, '2024-01-01T08:00:00Z'),
+        f'shadowed-{run}': _seed(f'shadowed-{run}', category, '2024-02-01T08:00:00Z'),
+        f'hidden-{run}': _seed(f'hidden-{run}', category, '2024-03-01T08:00:00Z', published=False),
+    }
+    newest = _add_article(f'new-{run}', f'{category.lower()}, water', '2024-04-01 09:30:00')
+    _add_article(f'shadowed-{run}', category.lower(), '2024-01-15T00:00:00')
+    _add_article(f'draft-{run}', category.lower(), None, status='draft')
+
+    catalog = NewsCatalog(db_pool, seeds)
+    page, total = catalog.list(category.lower(), limit=2)
+    assert total == 3
+    assert [article['slug'] for article in page] == [f'new-{run}', f'shadowed-{run}']
+    assert 'content' not in page[0]
+    assert catalog.list(category, limit=2, offset=2)[0][0]['slug'] == f'old-{run}'
+    assert catalog.list(category, offset=5) == ([], 3)
+
+    # The stored row replaces the seed article with the same slug
+    assert catalog.get(f'shadowed-{run}')['title'] == f'Stored shadowed-{run}'
+    article = catalog.get(str(newest))
+    assert article['slug'] == f'new-{run}'
+    assert article['category'] == category.title()
+    assert article['date'] == 'April 1, 2024'
+    assert article['read_time'] == '2 min read'
+    assert catalog.get(f'hidden-{run}') is None and catalog.get('999999999') is None
+    assert category.title() in catalog.categories()
+
+    everything, overall = catalog.list(limit=50)
+    assert overall >= 3 and len(everything) == min(overall, 50)
+    keys = [article.get('published_at') or article.get('created_at') for article in everything]
+    assert keys == sorted(keys, key=lambda key: str(key).replace(' ', 'T'), reverse=True)
+
+
+def test_writes_reach_other_workers():
+    init_database()
+    run = time.time_ns()
+    category = f'Health{run}'
+    slug = f'clinic-{run}'
+    seeds = {slug: _seed(slug, category, '2024-01-01T08:00:00Z')}
+    segment = SharedSegment(counter_slots=64, cache_slots=4, cache_value_size=64)
+    writer = NewsCatalog(db_pool, seeds, segment=segment)
+    reader = NewsCatalog(db_pool, seeds, segment=segment)
+    assert writer.get(slug)['title'] == f'Seed {slug}'
+    assert reader.get(slug)['title'] == f'Seed {slug}'
+
+    article_id = _add_article(slug, category.lower(), '2024-05-01T10:00:00')
+    writer.article_changed(article_id)
+    assert writer.stats()['reloads'] == 1  # updated in place
+    assert writer.get(slug)['title'] == f'Stored {slug}'
+    assert reader.get(slug)['title'] == f'Stored {slug}'
+    assert reader.stats()['reloads'] == 2
+
+    _execute('UPDATE news_articles SET tags = ? WHERE id = ?', (f'other{run}', article_id))
+    writer.article_changed(article_id)
+    assert reader.list(category) == ([], 0)  # moved out with its first tag
+    assert reader.get(article_id)['category'] == f'Other{run}'
+
+    _execute('DELETE FROM news_articles WHERE id = ?', (article_id,))
+    writer.article_deleted(article_id)
+    assert reader.get(slug)['title'] == f'Seed {slug}'
+    assert reader.get(article_id) is None
+    assert f'Other{run}' not in reader.categories()
+    assert writer.stats()['incremental_updates'] == 3
+
+
+def test_news_endpoints():
+    init_database()
+    client = app.test_client()
+    response = client.get('/api/news?limit=2')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['articles']) == min(body['total'], 2)
+    assert client.get('/api/news?limit=x').status_code == 400
+    assert client.get('/api/news/ward-cleanup-drive').get_json()['article']['title'] == \
+        'Ward Clean-Up Drive Launched'
+    assert client.get('/api/news/no-such-article').status_code == 404
+
+
+if __name__ == '__main__':
+    test_pages_categories_and_lookups()
+    test_writes_reach_other_workers()
+    test_news_endpoints()
+    print('OK')
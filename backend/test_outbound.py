@@ -0,0 +1,156 @@
+"""
+Outbound call guard tests.
+
+Checks that a hung dependency costs at most the configured timeouts, that
+the circuit opens after repeated failures and then fails fast, that a
+successful half-open trial closes it again, and that errors which are not
+outages (a refused recipient, a bug) neither count against the circuit
+nor reset it. Uses a local HTTP server that
+never answers in place of Daraja.
+
+    python -m pytest test_outbound.py
+    python test_outbound.py
+"""
+
+import os
+import smtplib
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mpesa import MPesaAPI  # noqa: E402
+import requests  # noqa: E402
+
+from outbound import CircuitOpenError, OutboundGuard, is_connect_error, is_transient  # noqa: E402
+
+
+class _HungHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(2)
+
+    do_POST = do_GET
+
+
+def test_hung_dependency_times_out_then_circuit_opens():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _HungHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        api = MPesaAPI()
+        api.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        api.guard = OutboundGuard('mpesa-test', connect_timeout=0.5, read_timeout=0.2, retries=1,
+                                  backoff_base=0.01, failure_threshold=2, reset_timeout=60)
+
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            api.stk_push('0712345678', 10, 'test', 'Donation')
+        # Token GET: one attempt plus one retry, each bounded by the read timeout
+        assert time.monotonic() - started < 1.5
+        assert api.guard.breaker.state == 'open'
+
+        started = time.monotonic()
+        with pytest.raises(CircuitOpenError):
+            api.stk_push('0712345678', 10, 'test', 'Donation')
+        assert time.monotonic() - started < 0.05
+        assert api.guard.stats()['rejected'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_half_open_trial_closes_circuit():
+    guard = OutboundGuard('trial-test', retries=0, failure_threshold=1, reset_timeout=0.05)
+
+    def fail():
+        raise ConnectionRefusedError('refused')
+
+    with pytest.raises(ConnectionRefusedError):
+        guard.call(fail)
+    assert guard.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        guard.call(lambda: 'ok')
+
+    time.sleep(0.06)
+    assert guard.call(lambda: 'ok') == 'ok'
+    assert guard.breaker.state == 'closed'
+
+
+def test_permanent_smtp_errors_are_not_retried():
+    permanent = [
+        smtplib.SMTPRecipientsRefused({'nobody@example.com': (550, b'No such user')}),
+        smtplib.SMTPAuthenticationError(535, b'Authentication failed'),
+        smtplib.SMTPResponseException(554, b'Transaction failed')
+    ]
+    for error in permanent:
+        assert not is_transient(error), error
+
+    assert is_transient(smtplib.SMTPRecipientsRefused({'busy@example.com': (450, b'Mailbox busy')}))
+    assert is_transient(smtplib.SMTPResponseException(421, b'Try again later'))
+    assert is_transient(smtplib.SMTPServerDisconnected('gone'))
+    assert is_transient(socket.timeout('timed out'))
+
+    guard = OutboundGuard('smtp-test', retries=3, failure_threshold=1, backoff_base=0)
+    calls = []
+
+    def refuse():
+        calls.append(1)
+        raise permanent[0]
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        guard.call(refuse)
+    # Answered at once, not retried, and the circuit stays closed
+    assert len(calls) == 1 and guard.breaker.state == 'closed'
+
+
+def test_non_transient_errors_leave_the_breaker_alone():
+    guard = OutboundGuard('bug-test', retries=0, failure_threshold=2, reset_timeout=0.05)
+
+    def fail():
+        raise ConnectionRefusedError('refused')
+
+    def bug():
+        raise KeyError('ResponseCode')
+
+    with pytest.raises(ConnectionRefusedError):
+        guard.call(fail)
+    with pytest.raises(KeyError):
+        guard.call(bug)
+    # The bug did not wipe out the earlier failure: one more opens the circuit
+    with pytest.raises(ConnectionRefusedError):
+        guard.call(fail)
+    assert guard.breaker.state == 'open'
+
+    # Nor does it close the circuit as a half-open trial, or keep the trial slot
+    time.sleep(0.06)
+    with pytest.raises(KeyError):
+        guard.call(bug)
+    assert guard.breaker.state == 'half_open'
+    assert guard.call(lambda: 'ok') == 'ok'
+    assert guard.breaker.state == 'closed'
+
+
+def test_refused_connection_is_a_connect_error():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    with pytest.raises(requests.exceptions.ConnectionError) as raised:
+        requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+    assert is_connect_error(raised.value)
+    assert not is_connect_error(requests.exceptions.ConnectionError('Connection reset by peer'))
+
+
+if __name__ == '__main__':
+    test_hung_dependency_times_out_then_circuit_opens()
+    test_half_open_trial_closes_circuit()
+    test_permanent_smtp_errors_are_not_retried()
+    test_non_transient_errors_leave_the_breaker_alone()
+    test_refused_connection_is_a_connect_error()
+    print('OK')
@@ -0,0 +1,154 @@
+"""
+Email outbox tests.
+
+Submissions must queue their notifications without touching SMTP, and the
+worker must deliver them through a local SMTP sink, retry failures and
+dead-letter messages that keep failing. A submission whose notifications
+cannot be queued is not stored either. Runs against a throwaway SQLite
+file, or the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_outbox.py
+    python test_outbox.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-outbox-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'outbox.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask_mail import Message  # noqa: E402
+
+import outbox  # noqa: E402
+from app import app, db_pool, init_database  # noqa: E402
+from outbox import OutboxWorker, enqueue  # noqa: E402
+from smtp_sink import SinkMail, SMTPSink  # noqa: E402
+
+
+def outbox_rows(recipient):
+    conn = db_pool.acquire()
+    try:
+        return conn.execute(
+            'SELECT status, attempts, last_error FROM email_outbox WHERE recipients = ? ORDER BY id',
+            (recipient,)
+        ).fetchall()
+    finally:
+        db_pool.release(conn)
+
+
+def queue(recipient):
+    conn = db_pool.acquire()
+    try:
+        with app.app_context():
+            message = Message(subject='Outbox test', recipients=[recipient], body='Hello')
+        enqueue(conn, message)
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+
+
+def test_submission_queues_email_and_worker_delivers_it():
+    init_database()
+    email = f'contact{os.getpid()}@example.com'
+
+    started = time.perf_counter()
+    response = app.test_client().post('/api/contact', json={
+        'name': 'Outbox Tester',
+        'email': email,
+        'subject': 'Water project',
+        'message': 'When does the borehole work start?'
+    })
+    elapsed = time.perf_counter() - started
+    assert response.status_code in (200, 201), response.get_json()
+    # The auto-reply is queued with the submission, not sent inline
+    assert [row[0] for row in outbox_rows(email)] == ['pending']
+    assert elapsed < 1.0
+
+    # Notifications carry both the HTML and the plain-text rendering
+    conn = db_pool.acquire()
+    try:
+        html, body = conn.execute(
+            'SELECT html, body FROM email_outbox WHERE recipients = ?', (email,)
+        ).fetchone()
+    finally:
+        db_pool.release(conn)
+    assert '<h2>Thank you for your message!</h2>' in html
+    assert body.startswith('Thank you for your message!') and '<' not in body
+
+    with SMTPSink() as sink:
+        worker = OutboxWorker(app, sink.mail(), db_pool, batch_size=10)
+        assert worker.drain() >= 2
+        delivered = [recipient for message in sink.messages for recipient in message['recipients']]
+
+    assert email in delivered
+    assert [row[0] for row in outbox_rows(email)] == ['sent']
+
+
+def test_failures_retry_then_dead_letter():
+    init_database()
+    email = f'retry{os.getpid()}@example.com'
+    queue(email)
+
+    # Nothing listening: the whole batch is put back for a later attempt
+    with SMTPSink() as sink:
+        closed_port = sink.port
+    worker = OutboxWorker(app, SinkMail(closed_port), db_pool, max_attempts=2, retry_base=0)
+    assert worker.drain() == 0
+    status, attempts, last_error = outbox_rows(email)[0]
+    assert (status, attempts) == ('pending', 1)
+    assert last_error
+
+    # The relay rejects every message: one more attempt exhausts the budget
+    with SMTPSink(fail_rate=1.0) as sink:
+        worker = OutboxWorker(app, sink.mail(), db_pool, max_attempts=2, retry_base=0)
+        worker.drain()
+    assert outbox_rows(email)[0][:2] == ('dead', 2)
+
+    # Requeued dead letters go out once the relay recovers
+    assert worker.retry_dead() >= 1
+    with SMTPSink() as sink:
+        worker = OutboxWorker(app, sink.mail(), db_pool)
+        worker.drain()
+    assert outbox_rows(email)[0][0] == 'sent'
+
+
+def test_submission_fails_with_its_notifications():
+    init_database()
+    email = f'unqueued{time.time_ns()}@example.com'
+
+    def broken_enqueue(conn, message, delay=0):
+        raise RuntimeError('email_outbox is unavailable')
+
+    outbox.enqueue = broken_enqueue
+    try:
+        response = app.test_client().post('/api/contact', json={
+            'name': 'Outbox Tester',
+            'email': email,
+            'subject': 'Water project',
+            'message': 'When does the borehole work start?'
+        })
+    finally:
+        outbox.enqueue = enqueue
+    assert response.status_code == 500
+
+    conn = db_pool.acquire()
+    try:
+        stored = conn.execute(
+            'SELECT COUNT(*) FROM contact_submissions WHERE email = ?', (email,)
+        ).fetchone()[0]
+    finally:
+        db_pool.release(conn)
+    assert stored == 0 and outbox_rows(email) == []
+
+
+if __name__ == '__main__':
+    test_submission_queues_email_and_worker_delivers_it()
+    test_failures_retry_then_dead_letter()
+    test_submission_fails_with_its_notifications()
+    print('OK')
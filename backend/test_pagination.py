@@ -0,0 +1,155 @@
+"""
+Keyset pagination tests.
+
+Round-trips cursors and rejects tampered ones, pages through rows whose
+sort keys tie so that none is skipped or repeated, filters dates stored
+both 'T' and space separated with date and datetime bounds, and checks
+that every admin list endpoint answers with the same page shape. Runs
+against an in-memory SQLite table and a throwaway SQLite file, or the
+database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_pagination.py
+    python test_pagination.py
+"""
+
+import base64
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import date, datetime
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-pagination-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'pagination.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, init_database  # noqa: E402
+from pagination import (  # noqa: E402
+    PaginationError, decode_cursor, encode_cursor, keyset_page, parse_page_args
+)
+
+COLUMNS = ['id', 'name', 'created_at']
+SORT = ['created_at', 'id']
+
+
+def _table(created):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, created_at TIMESTAMP)')
+    conn.executemany('INSERT INTO items (name, created_at) VALUES (?, ?)',
+                     [(f'item {i}', value) for i, value in enumerate(created)])
+    return conn.cursor()
+
+
+def _pages(cursor, limit, filters=None):
+    """Every page of items as lists of ids, following next_cursor"""
+    pages, after = [], None
+    while True:
+        rows, after, _ = keyset_page(cursor, 'items', COLUMNS, SORT, filters=filters,
+                                     after=after, limit=limit)
+        pages.append([row[0] for row in rows])
+        if after is None:
+            return pages
+
+
+def _raises(call, *args):
+    try:
+        call(*args)
+    except PaginationError:
+        return True
+    return False
+
+
+def test_cursor_round_trip_and_tampering():
+    values = [datetime(2024, 5, 1, 10, 30), date(2024, 5, 2), 42, 'Kendu Bay']
+    cursor = encode_cursor(values)
+    assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+    assert decode_cursor(cursor, 4) == ['2024-05-01T10:30:00', '2024-05-02', 42, 'Kendu Bay']
+
+    assert _raises(decode_cursor, cursor, 3)  # built for another sort key
+    assert _raises(decode_cursor, cursor[:-3], 4)
+    assert _raises(decode_cursor, 'not a cursor!', 2)
+    assert _raises(decode_cursor, '', 2)
+    forged = base64.urlsafe_b64encode(b'{"id": 1}').decode()
+    assert _raises(decode_cursor, forged, 1)
+
+    # Bad cursors reach clients as 400s, not server errors
+    init_database()
+    client = app.test_client()
+    for path in ('/api/admin/donations', '/api/admin/news', '/api/admin/contacts'):
+        assert client.get(f'{path}?after=garbage').status_code == 400
+        assert client.get(f'{path}?limit=0').status_code == 400
+
+
+def test_equal_sort_keys_break_ties_on_id():
+    cursor = _table(['2024-05-01 10:00:00'] * 7 + ['2024-05-02 09:00:00'] * 3)
+    pages = _pages(cursor, limit=3)
+    ids = [row_id for page in pages for row_id in page]
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert ids == [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+    rows, next_cursor, total = keyset_page(cursor, 'items', COLUMNS, SORT, limit=10,
+                                           include_total=True)
+    assert len(rows) == 10 and next_cursor is None and total == 10
+
+
+def test_date_filters_across_stored_formats():
+    cursor = _table([
+        '2024-04-30 23:59:59',
+        '2024-05-01T08:00',
+        '2024-05-01 09:15:00',
+        '2024-05-01T12:00:00',
+        '2024-05-01 18:45:00.250000',
+        '2024-05-02T00:00:00',
+    ])
+
+    def ids(args):
+        filters = parse_page_args(args, {'date': 'created_at'})[0]
+        return sorted(row_id for page in _pages(cursor, 2, filters) for row_id in page)
+
+    # Whole days: 'from' takes the day in, 'to' leaves it out
+    assert ids({'from': '2024-05-01', 'to': '2024-05-02'}) == [2, 3, 4, 5]
+    # Times compare as times whichever separator the row or the bound uses
+    assert ids({'from': '2024-05-01T09:00'}) == [3, 4, 5, 6]
+    assert ids({'from': '2024-05-01 09:00:00', 'to': '2024-05-01T12:00'}) == [3]
+    assert ids({'to': '2024-05-01 08:00:01'}) == [1, 2]
+    assert ids({'from': '2024-05-01T18:00:00Z'}) == [5, 6]
+
+    for bad in ('yesterday', '2024-13-01', '01/05/2024'):
+        assert _raises(parse_page_args, {'from': bad}, {'date': 'created_at'})
+
+    # Other dialects compare typed timestamps, so the column is used as is
+    filters = parse_page_args({'from': '2024-05-01T09:00', 'to': '2024-05-02'},
+                              {'date': 'created_at'}, dialect='postgresql')[0]
+    assert filters == [('created_at >= ?', ('2024-05-01 09:00:00',)),
+                       ('created_at < ?', ('2024-05-02',))]
+
+
+def test_admin_lists_share_one_shape():
+    init_database()
+    client = app.test_client()
+    lists = {
+        '/api/admin/contacts': 'contacts',
+        '/api/admin/donations': 'donations',
+        '/api/admin/news': 'articles',
+        '/api/admin/events': 'events',
+        '/api/admin/agenda': 'agenda_items',
+    }
+    for path, key in lists.items():
+        response = client.get(f'{path}?limit=1&include_total=1')
+        assert response.status_code == 200, path
+        body = response.get_json()
+        assert set(body) == {key, 'next_cursor', 'has_more', 'total'}, path
+        assert len(body[key]) <= 1 and body['total'] == int(response.headers['X-Total-Count'])
+        assert body['has_more'] == (body['next_cursor'] is not None)
+        assert response.headers.get('X-Next-Cursor') == body['next_cursor']
+
+
+if __name__ == '__main__':
+    test_cursor_round_trip_and_tampering()
+    test_equal_sort_keys_break_ties_on_id()
+    test_date_filters_across_stored_formats()
+    test_admin_lists_share_one_shape()
+    print('OK')
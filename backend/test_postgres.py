@@ -0,0 +1,313 @@
+"""
+PostgreSQL backend tests.
+
+Drives the PostgreSQL pool and connection adapter against a fake psycopg2
+(installed only while each test runs), checking that qmark SQL reaches the
+driver as pyformat with its parameters, that lastrowid asks the session
+for lastval(), that connections are rolled back on release and discarded
+when closed, and that an exhausted pool times out. The baseline and index
+migrations are run through the same adapter to check their PostgreSQL
+branches and the schema-scoped column lookup.
+
+With a PostgreSQL server in TEST_POSTGRES_URL every migration is also
+applied for real, in a throwaway schema that is dropped afterwards;
+without one that test is skipped.
+
+    python -m pytest test_postgres.py
+    TEST_POSTGRES_URL=postgresql://localhost/karachuonyo_test python -m pytest test_postgres.py
+    python test_postgres.py
+"""
+
+import contextlib
+import os
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import PoolTimeout, PostgresConnection, PostgresConnectionPool, pool_from_url  # noqa: E402
+from migrations import (  # noqa: E402
+    MIGRATIONS, _0001_baseline_schema, _0002_hot_path_indexes, _column_exists,
+    apply_migrations, current_version
+)
+
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL', '')
+
+IDLE, IN_TRANSACTION = 0, 2
+
+
+class FakeRawCursor:
+    """Records statements on its connection; answers from queued rows"""
+
+    arraysize = 1
+
+    def __init__(self, connection, name=None):
+        self.connection = connection
+        self.name = name
+        self.rowcount = -1
+        self.description = None
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((sql, params))
+        self.connection.status = IN_TRANSACTION
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        rows = self.connection.rows
+        return rows.pop(0) if rows else None
+
+    def fetchall(self):
+        rows, self.connection.rows = self.connection.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.statements = []
+        self.rows = []
+        self.status = IDLE
+        self.closed = 0
+        self.rollbacks = 0
+        self.cursor_names = []
+
+    def cursor(self, name=None):
+        self.cursor_names.append(name)
+        return FakeRawCursor(self, name)
+
+    def commit(self):
+        self.status = IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return self.status
+
+
+class FakeThreadedConnectionPool:
+    """Hands out FakeRawConnections; like psycopg2's, raises when exhausted"""
+
+    instances = []
+
+    def __init__(self, minconn, maxconn, dsn, **kwargs):
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.kwargs = kwargs
+        self.idle = []
+        self.used = []
+        self.discarded = []
+        FakeThreadedConnectionPool.instances.append(self)
+
+    def getconn(self):
+        if len(self.used) >= self.maxconn:
+            raise RuntimeError('connection pool exhausted')
+        raw = self.idle.pop() if self.idle else FakeRawConnection()
+        self.used.append(raw)
+        return raw
+
+    def putconn(self, raw, close=False):
+        self.used.remove(raw)
+        if close:
+            raw.close()
+            self.discarded.append(raw)
+        else:
+            self.idle.append(raw)
+
+    def closeall(self):
+        for raw in self.idle + self.used:
+            raw.close()
+
+
+@contextlib.contextmanager
+def fake_psycopg2():
+    """Make `import psycopg2` resolve to the fakes above, then put sys.modules back"""
+    psycopg2 = types.ModuleType('psycopg2')
+    psycopg2.IntegrityError = type('IntegrityError', (Exception,), {})
+    psycopg2.extensions = types.ModuleType('psycopg2.extensions')
+    psycopg2.extensions.TRANSACTION_STATUS_IDLE = IDLE
+    psycopg2.pool = types.ModuleType('psycopg2.pool')
+    psycopg2.pool.ThreadedConnectionPool = FakeThreadedConnectionPool
+    fakes = {'psycopg2': psycopg2, 'psycopg2.extensions': psycopg2.extensions,
+             'psycopg2.pool': psycopg2.pool}
+
+    saved = {name: sys.modules.get(name) for name in fakes}
+    sys.modules.update(fakes)
+    try:
+        yield psycopg2
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+def test_adapter_translates_qmark_sql():
+    with fake_psycopg2():
+        raw = FakeRawConnection()
+        conn = PostgresConnection(raw)
+
+        conn.execute("SELECT id FROM donations WHERE status = ? AND donor_name LIKE '%?%'", ('completed',))
+        conn.executemany('INSERT INTO likes (article_id) VALUES (?)', [[1], [2]])
+        conn.execute("SELECT to_char(created_at, 'HH24:MI') FROM donations")
+        assert raw.statements == [
+            ("SELECT id FROM donations WHERE status = %s AND donor_name LIKE '%%?%%'", ('completed',)),
+            ('INSERT INTO likes (article_id) VALUES (%s)', (1,)),
+            ('INSERT INTO likes (article_id) VALUES (%s)', (2,)),
+            # Without parameters psycopg2 does no formatting, so nothing is escaped
+            ("SELECT to_char(created_at, 'HH24:MI') FROM donations", None),
+        ]
+
+        raw.rows = [(41,)]
+        assert conn.execute('INSERT INTO donations (amount) VALUES (?)', (100,)).lastrowid == 41
+        assert raw.statements[-1] == ('SELECT lastval()', None)
+
+        conn.cursor(name='export_contacts').execute('SELECT * FROM contact_submissions')
+        assert raw.cursor_names[-1] == 'export_contacts'
+
+        assert conn.in_transaction
+        conn.commit()
+        assert not conn.in_transaction
+
+
+def test_pool_rolls_back_discards_and_times_out():
+    with fake_psycopg2():
+        FakeThreadedConnectionPool.instances.clear()
+        pool = pool_from_url('postgresql://karachuonyo@db/karachuonyo', {
+            'POSTGRES_POOL_SIZE': 2, 'POSTGRES_POOL_TIMEOUT': 0.05,
+            'POSTGRES_STATEMENT_TIMEOUT_MS': 1500,
+        })
+        assert isinstance(pool, PostgresConnectionPool) and pool.dialect == 'postgresql'
+        assert not FakeThreadedConnectionPool.instances  # opened on first use
+
+        first = pool.acquire()
+        driver_pool, = FakeThreadedConnectionPool.instances
+        assert driver_pool.dsn == 'postgresql://karachuonyo@db/karachuonyo'
+        assert driver_pool.kwargs['options'] == '-c statement_timeout=1500'
+
+        # Uncommitted work is rolled back before the connection is reused
+        first.execute('UPDATE donations SET status = ? WHERE id = ?', ('failed', 1))
+        pool.release(first)
+        assert first.raw.rollbacks == 1 and driver_pool.idle == [first.raw]
+        again = pool.acquire()
+        assert again.raw is first.raw and not again.in_transaction
+
+        # Both slots taken: the next caller waits, then gives up
+        second = pool.acquire()
+        started = time.monotonic()
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        assert time.monotonic() - started >= 0.05
+
+        # A connection the server closed is not handed out again
+        second.raw.closed = 2
+        pool.release(second)
+        pool.release(again)
+        assert driver_pool.discarded == [second.raw]
+
+        stats = pool.stats()
+        assert (stats['in_use'], stats['total_acquired'], stats['timeouts'], stats['discarded']) == (0, 3, 1, 1)
+        pool.close_all()
+        assert first.raw.closed
+
+
+def test_migrations_take_postgresql_branches():
+    with fake_psycopg2():
+        raw = FakeRawConnection()
+        cursor = PostgresConnection(raw).cursor()
+
+        # Columns are looked up in the current schema only, not any table of that name
+        raw.rows = [(1,)]
+        assert _column_exists(cursor, 'donations', 'phone_number', 'postgresql')
+        assert not _column_exists(cursor, 'donations', 'phone_number', 'postgresql')
+        lookup, params = raw.statements[-1]
+        assert 'information_schema.columns' in lookup and 'table_schema = current_schema()' in lookup
+        assert '%s' in lookup and params == ('donations', 'phone_number')
+
+        raw.statements.clear()
+        _0001_baseline_schema(cursor, 'postgresql')
+        created = [sql for sql, _ in raw.statements if 'CREATE TABLE' in sql]
+        assert len(created) == 10
+        assert all('id SERIAL PRIMARY KEY' in sql and 'AUTOINCREMENT' not in sql for sql in created)
+        # No column was reported present, so every legacy column is added
+        added = [sql for sql, _ in raw.statements if sql.startswith('ALTER TABLE')]
+        assert added == [
+            'ALTER TABLE news_articles ADD COLUMN likes INTEGER DEFAULT 0',
+            'ALTER TABLE news_articles ADD COLUMN shares INTEGER DEFAULT 0',
+            'ALTER TABLE donations ADD COLUMN phone_number TEXT',
+            'ALTER TABLE donations ADD COLUMN checkout_request_id TEXT',
+            'ALTER TABLE donations ADD COLUMN merchant_request_id TEXT',
+        ]
+
+        # The index migration is the same on both backends
+        raw.statements.clear()
+        _0002_hot_path_indexes(cursor, 'postgresql')
+        postgres_indexes = [sql for sql, _ in raw.statements]
+        raw.statements.clear()
+        _0002_hot_path_indexes(cursor, 'sqlite')
+        assert [sql for sql, _ in raw.statements] == postgres_indexes
+        assert len(postgres_indexes) == 7
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+def test_migrations_on_postgresql_server():
+    pool = pool_from_url(POSTGRES_URL, {'POSTGRES_POOL_SIZE': 1})
+    schema = f'karachuonyo_test_{os.getpid()}_{time.time_ns()}'
+    conn = pool.acquire()
+    try:
+        conn.execute(f'CREATE SCHEMA {schema}')
+        conn.execute(f'SET search_path TO {schema}')
+        conn.commit()
+        cursor = conn.cursor()
+        # Tables of the same name in other schemas do not count
+        assert not _column_exists(cursor, 'donations', 'status_detail', 'postgresql')
+
+        versions = [version for version, _, _ in MIGRATIONS]
+        assert apply_migrations(conn, pool.dialect) == versions
+        assert apply_migrations(conn, pool.dialect) == []
+        assert current_version(conn) == versions[-1]
+        assert _column_exists(cursor, 'donations', 'status_detail', 'postgresql')
+        assert not _column_exists(cursor, 'donations', 'no_such_column', 'postgresql')
+
+        donation_id = conn.execute('''
+            INSERT INTO donations (donor_name, amount, payment_method, status)
+            VALUES (?, ?, ?, ?)
+        ''', ('Achieng', 100, 'mpesa', 'pending')).lastrowid
+        conn.commit()
+        row = conn.execute("SELECT donor_name FROM donations WHERE id = ? AND status LIKE 'pend%'",
+                           (donation_id,)).fetchone()
+        assert row == ('Achieng',)
+    finally:
+        conn.rollback()
+        conn.execute(f'DROP SCHEMA {schema} CASCADE')
+        conn.commit()
+        pool.release(conn)
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    test_adapter_translates_qmark_sql()
+    test_pool_rolls_back_discards_and_times_out()
+    test_migrations_take_postgresql_branches()
+    if POSTGRES_URL:
+        test_migrations_on_postgresql_server()
+    print('OK')
@@ -0,0 +1,273 @@
+"""
+Donation reconciliation tests.
+
+Leaves donations pending with no callback and lets the sweeper settle them
+through a local stand-in for Daraja's STK Push Query API: paid and
+cancelled pushes are finalized, unanswered ones are checked again later,
+and donations whose push never happened are failed without a query (and
+their push, if still queued, is never sent). A successful callback that
+arrives after the sweeper gave up still completes the donation, as does
+one for a push the sweeper expired while it was still in flight. Runs
+against a throwaway SQLite file, or the database in TEST_DATABASE_URL when
+set.
+
+    python -m pytest test_reconcile.py
+    python test_reconcile.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-reconcile-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'reconcile.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import callback_inbox  # noqa: E402
+from app import db_pool, donation_initiator, init_database, mpesa  # noqa: E402
+from donations import DonationInitiator  # noqa: E402
+from fundraising import totals  # noqa: E402
+from reconcile import NEVER_PUSHED, NOT_CONFIRMED, DonationSweeper  # noqa: E402
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """Token and STK Push Query endpoints; the outcome is the checkout id's suffix"""
+
+    queries = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({'access_token': 'test-token', 'expires_in': '3599'})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).queries += 1
+        checkout_request_id = payload['CheckoutRequestID']
+        if checkout_request_id.endswith('_waiting'):
+            self._reply({'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}, 500)
+            return
+        paid = checkout_request_id.endswith('_paid')
+        self._reply({
+            'ResponseCode': '0',
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': '0' if paid else '1032',
+            'ResultDesc': 'The service request is processed successfully.' if paid else 'Request cancelled by user'
+        })
+
+
+def _add_donations(rows):
+    conn = db_pool.acquire()
+    try:
+        ids = []
+        for status, checkout_request_id in rows:
+            cursor = conn.execute('''
+                INSERT INTO donations (donor_name, amount, payment_method, status, checkout_request_id, next_check_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ('Test Donor', 100, 'mpesa', status, checkout_request_id, int(time.time()) - 1))
+            ids.append(cursor.lastrowid)
+        conn.commit()
+        return ids
+    finally:
+        db_pool.release(conn)
+
+
+def _donation(donation_id):
+    conn = db_pool.acquire()
+    try:
+        return conn.execute(
+            'SELECT status, status_detail, check_attempts, next_check_at FROM donations WHERE id = ?',
+            (donation_id,)
+        ).fetchone()
+    finally:
+        db_pool.release(conn)
+
+
+def _record_callback(checkout_request_id, result_code=0):
+    body = json.dumps({'Body': {'stkCallback': {
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.',
+        'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'LATE123'}]}
+    }}})
+    conn = db_pool.acquire()
+    try:
+        callback_inbox.record(conn, body)
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+
+
+def _totals():
+    conn = db_pool.acquire()
+    try:
+        return totals(conn)
+    finally:
+        db_pool.release(conn)
+
+
+def _serve_queries():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _QueryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_sweeper_settles_stale_donations():
+    init_database()
+    server = _serve_queries()
+    base_url, mpesa.base_url = mpesa.base_url, f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        tag = time.time_ns()
+        paid = _add_donations([('pending', f'ws_CO_{tag}_{i}_paid') for i in range(40)])
+        cancelled, waiting = _add_donations([
+            ('pending', f'ws_CO_{tag}_cancelled'), ('pending', f'ws_CO_{tag}_waiting')
+        ])
+        (unpushed,) = _add_donations([('pending_init', None)])
+
+        sweeper = DonationSweeper(db_pool, mpesa, donation_initiator, batch_size=10,
+                                  concurrency=4, rate_limit=200, retry_base=60)
+        assert sweeper.stats()['backlog']['pending'] >= 42
+        totals = sweeper.sweep()
+
+        assert totals['completed'] >= 40 and totals['expired'] >= 1
+        assert all(_donation(i)[0] == 'completed' for i in paid)
+        assert _donation(cancelled)[:2] == ('failed', 'Request cancelled by user')
+        assert _donation(unpushed)[:2] == ('failed', NEVER_PUSHED)
+
+        # Unanswered: checked once, due again a minute later, not failed
+        status, _, attempts, next_check_at = _donation(waiting)
+        assert status == 'pending' and attempts == 1
+        assert next_check_at >= time.time() + 50
+        # "Still processing" answers do not count against Daraja's circuit
+        assert mpesa.guard.breaker.state == 'closed'
+
+        assert donation_initiator.status(None, paid[0])['status'] == 'completed'
+        queries = _QueryHandler.queries
+        assert sweeper.sweep()['queried'] == 0 and _QueryHandler.queries == queries
+        assert sweeper.stats()['backlog'] == {'pending_init': 0, 'pushing': 0, 'pending': 0}
+    finally:
+        mpesa.base_url = base_url
+        server.shutdown()
+        server.server_close()
+
+
+def test_push_expired_while_queued_is_not_sent():
+    init_database()
+    (donation_id,) = _add_donations([('pending_init', None)])
+    sweeper = DonationSweeper(db_pool, mpesa, donation_initiator)
+    assert sweeper.sweep()['expired'] >= 1
+
+    # The push was still queued when the sweeper gave up on the donation
+    skipped = donation_initiator.stats()['skipped']
+    donation_initiator.submit(donation_id, '0712345678', 100, f'DONATION_{donation_id}', 'Donation').result()
+    assert donation_initiator.stats()['skipped'] == skipped + 1
+    assert _donation(donation_id)[:2] == ('failed', NEVER_PUSHED)
+    assert donation_initiator.status(None, donation_id)['status'] == 'failed'
+
+    # The default expiry outlasts a full push queue at its slowest
+    assert donation_initiator.queue_deadline() > 600
+
+
+def test_late_callback_completes_given_up_donation():
+    init_database()
+    server = _serve_queries()
+    base_url, mpesa.base_url = mpesa.base_url, f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        checkout_request_id = f'ws_CO_{time.time_ns()}_waiting'
+        (donation_id,) = _add_donations([('pending', checkout_request_id)])
+        sweeper = DonationSweeper(db_pool, mpesa, donation_initiator, max_checks=1)
+        sweeper.sweep()
+        assert _donation(donation_id)[:2] == ('failed', NOT_CONFIRMED)
+    finally:
+        mpesa.base_url = base_url
+        server.shutdown()
+        server.server_close()
+
+    # The donor paid after all: the callback lands once the sweeper gave up
+    processor = callback_inbox.CallbackProcessor(db_pool, donation_initiator)
+    processor.drain()  # anything other tests left in the shared inbox
+    counts = processor.stats()
+    before = _totals()
+    _record_callback(checkout_request_id)
+    _record_callback(checkout_request_id)  # Safaricom's retry
+    assert processor.drain() == 2
+    assert _donation(donation_id)[:2] == ('completed', None)
+    assert donation_initiator.status(None, donation_id)['status'] == 'completed'
+    after = _totals()
+    assert after['donation_count'] == before['donation_count'] + 1
+    assert after['total_amount'] == before['total_amount'] + 100
+    stats = processor.stats()
+    for name in ('late_completed', 'duplicate'):
+        key = f'{name}_by_this_process'
+        assert stats[key] == counts[key] + 1
+
+    # A failure callback never reopens a settled donation
+    _record_callback(checkout_request_id, result_code=1032)
+    processor.drain()
+    assert _donation(donation_id)[0] == 'completed'
+
+
+class _SweptMidPush:
+    """Stands in for MPesaAPI: a sweep expires the donation before Daraja answers"""
+
+    guard = mpesa.guard
+
+    def __init__(self, donation_id, checkout_request_id):
+        self.donation_id = donation_id
+        self.checkout_request_id = checkout_request_id
+
+    def stk_push(self, **kwargs):
+        conn = db_pool.acquire()
+        try:
+            conn.execute('UPDATE donations SET next_check_at = ? WHERE id = ?',
+                         (int(time.time()) - 1, self.donation_id))
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+        assert DonationSweeper(db_pool, mpesa, donation_initiator).sweep()['expired'] >= 1
+        return {'ResponseCode': '0', 'CheckoutRequestID': self.checkout_request_id,
+                'MerchantRequestID': 'mr-race'}
+
+
+def test_callback_completes_push_expired_in_flight():
+    init_database()
+    (donation_id,) = _add_donations([('pending_init', None)])
+    checkout_request_id = f'ws_CO_{time.time_ns()}_race'
+    initiator = DonationInitiator(db_pool, _SweptMidPush(donation_id, checkout_request_id), workers=1)
+    initiator.submit(donation_id, '0712345678', 100, f'DONATION_{donation_id}', 'Donation').result()
+
+    # Failed by the sweeper, but the push's answer still recorded its checkout id
+    assert _donation(donation_id)[:2] == ('failed', NOT_CONFIRMED)
+    assert initiator.stats()['pushed'] == 0
+
+    processor = callback_inbox.CallbackProcessor(db_pool, donation_initiator)
+    processor.drain()  # anything other tests left in the shared inbox
+    late = processor.stats()['late_completed_by_this_process']
+    _record_callback(checkout_request_id)
+    assert processor.drain() == 1
+    assert _donation(donation_id)[:2] == ('completed', None)
+    assert processor.stats()['late_completed_by_this_process'] == late + 1
+
+
+if __name__ == '__main__':
+    test_sweeper_settles_stale_donations()
+    test_push_expired_while_queued_is_not_sent()
+    test_late_callback_completes_given_up_donation()
+    test_callback_completes_push_expired_in_flight()
+    print('OK')
@@ -0,0 +1,172 @@
+"""
+Response cache tests.
+
+Checks that cached views run once per key until a write invalidates one
+of their tags, that an invalidation landing while a view renders leaves
+its entry stale, that only 200 responses are kept, and that the memory
+backend evicts least recently used entries. With the shared backend an
+entry stored by one forked worker is served by another, and an
+invalidation in either reaches both. Also drives the /api/news cache
+through an admin write, and checks that a cached article leaves out its
+engagement counters while /metrics keeps counting. Runs against a throwaway SQLite file, or the
+database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_response_cache.py
+    python test_response_cache.py
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-response-cache-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'response_cache.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify, request  # noqa: E402
+
+from app import app, init_database  # noqa: E402
+from response_cache import CachedResponse, MemoryBackend, ResponseCache, SharedBackend  # noqa: E402
+from sharedmem import SharedSegment  # noqa: E402
+
+
+def _cached_app(cache):
+    """Flask app with cached views that count their calls"""
+    site = Flask(__name__)
+    site.calls = 0
+
+    @site.route('/items')
+    @cache.cached(tags=['items'])
+    def items():
+        site.calls += 1
+        if request.args.get('write'):
+            cache.invalidate('items')  # as if an admin saved while this rendered
+        if request.args.get('missing'):
+            return jsonify({'error': 'not found'}), 404
+        return jsonify({'calls': site.calls, 'page': request.args.get('page')})
+
+    return site
+
+
+def test_views_run_once_until_invalidated():
+    cache = ResponseCache(MemoryBackend())
+    site = _cached_app(cache)
+    client = site.test_client()
+
+    first = client.get('/items?page=1&sort=new')
+    assert first.headers['X-Cache'] == 'MISS'
+    again = client.get('/items?sort=new&page=1')
+    assert again.headers['X-Cache'] == 'HIT' and again.get_json() == first.get_json()
+    assert site.calls == 1
+
+    cache.invalidate('items')
+    assert client.get('/items?page=1&sort=new').headers['X-Cache'] == 'MISS'
+    assert site.calls == 2
+
+    # Stored before the write committed, so never served
+    client.get('/items?write=1')
+    assert client.get('/items?write=1').headers['X-Cache'] == 'MISS'
+
+    for _ in range(2):
+        assert client.get('/items?missing=1').status_code == 404
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['stale'] == 2
+    assert site.calls == 6
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2, max_bytes=1000)
+
+    def entry(size):
+        return CachedResponse(b'x' * size, 200, 'application/json', {}, 0, time.time() + 60)
+
+    backend.set('a', entry(100))
+    backend.set('b', entry(100))
+    assert backend.get('a') is not None
+    backend.set('c', entry(100))
+    assert backend.get('b') is None and backend.get('a') is not None
+
+    assert backend.set('d', entry(950))
+    assert backend.get('a') is None and backend.get('c') is None
+    assert not backend.set('huge', entry(2000))
+    assert backend.stats() == {'entries': 1, 'bytes': 950, 'max_entries': 2,
+                               'max_bytes': 1000, 'evictions': 3}
+
+
+def _other_worker(cache, site, results):
+    client = site.test_client()
+    results.put(client.get('/items').headers['X-Cache'])
+    cache.invalidate('items')
+
+
+def test_shared_entries_reach_every_worker():
+    segment = SharedSegment(counter_slots=64, cache_slots=64, cache_value_size=4096)
+    cache = ResponseCache(SharedBackend(segment), segment=segment)
+    site = _cached_app(cache)
+    client = site.test_client()
+    assert client.get('/items').headers['X-Cache'] == 'MISS'
+
+    fork = multiprocessing.get_context('fork')
+    results = fork.Queue()
+    worker = fork.Process(target=_other_worker, args=(cache, site, results))
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+    assert results.get(timeout=5) == 'HIT'
+
+    # The other worker's invalidation expired this worker's copy too
+    assert client.get('/items').headers['X-Cache'] == 'MISS'
+    assert site.calls == 2
+
+
+def test_admin_write_invalidates_news():
+    init_database()
+    client = app.test_client()
+    client.get('/api/news?limit=50')
+    assert client.get('/api/news?limit=50').headers['X-Cache'] == 'HIT'
+
+    title = f'Cache test {time.time_ns()}'
+    response = client.post('/api/admin/news', json={
+        'title': title, 'content': '<p>Body</p>', 'status': 'published', 'tags': 'community'
+    })
+    assert response.status_code == 200
+
+    fresh = client.get('/api/news?limit=50')
+    assert fresh.headers['X-Cache'] == 'MISS'
+    assert title in [article['title'] for article in fresh.get_json()['articles']]
+
+
+def test_cached_article_leaves_counters_to_metrics():
+    init_database()
+    client = app.test_client()
+    created = client.post('/api/admin/news', json={
+        'title': f'Counter test {time.time_ns()}', 'content': '<p>Body</p>', 'status': 'published'
+    })
+    article_id = created.get_json()['id']
+
+    first = client.get(f'/api/news/{article_id}')
+    again = client.get(f'/api/news/{article_id}')
+    assert first.headers['X-Cache'] == 'MISS' and again.headers['X-Cache'] == 'HIT'
+    article = again.get_json()['article']
+    assert article['id'] == article_id
+    assert not {'views', 'likes', 'shares'} & set(article)
+
+    # Views counted on the cache hit and a like show up straight away
+    assert client.post(f'/api/news/{article_id}/like').status_code == 200
+    metrics = client.get(f'/api/news/{article_id}/metrics').get_json()['metrics']
+    assert metrics == {'views': 2, 'likes': 1, 'shares': 0}
+    assert client.get(f'/api/news/{article_id}').headers['X-Cache'] == 'HIT'
+
+
+if __name__ == '__main__':
+    test_views_run_once_until_invalidated()
+    test_memory_backend_evicts_least_recently_used()
+    test_shared_entries_reach_every_worker()
+    test_admin_write_invalidates_news()
+    test_cached_article_leaves_counters_to_metrics()
+    print('OK')
@@ -0,0 +1,101 @@
+"""
+News search tests.
+
+Searches /api/news/search for words planted in test articles and checks
+that title matches outrank body matches, drafts stay hidden, the last
+word matches as a prefix, FTS5 operators in the query are harmless, and
+that edits and deletes reach the index through its triggers. Runs against
+a throwaway SQLite file, or the database in TEST_DATABASE_URL when set.
+
+    python -m pytest test_search.py
+    python test_search.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='karachuonyo-search-')
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(TMP_DIR, 'search.db')}")
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db_pool, init_database  # noqa: E402
+
+
+def _add_article(title, content, status='published', tags=None):
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.execute('''
+            INSERT INTO news_articles (title, slug, excerpt, content, status, tags, published_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (title, f'search-test-{time.time_ns()}', None, content, status, tags))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        db_pool.release(conn)
+
+
+def _execute(sql, params):
+    conn = db_pool.acquire()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        db_pool.release(conn)
+
+
+def _search(client, q, **args):
+    response = client.get('/api/news/search', query_string={'q': q, **args})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_ranked_published_matches():
+    init_database()
+    client = app.test_client()
+    word = f'borehole{time.time_ns()}'
+    in_body = _add_article('Ward water plans', f'<p>Drilling a <b>{word}</b> in every ward</p>')
+    in_title = _add_article(f'New {word} opened', '<p>Water for Kendu Bay</p>')
+    _add_article(f'Draft {word} notes', f'<p>{word}</p>', status='draft')
+
+    found = _search(client, word)
+    assert found['total'] == 2
+    assert [result['id'] for result in found['results']] == [in_title, in_body]
+    # Snippets come from the HTML-stripped body
+    assert f'<mark>{word}</mark>' in found['results'][1]['snippet']
+    assert '<b>' not in found['results'][1]['snippet']
+
+    # The last word is a prefix, so partially typed queries already match
+    assert _search(client, f'ward {word[:-3]}')['total'] == 1
+    assert _search(client, word, limit=1, offset=1)['results'][0]['id'] == in_body
+
+    # Operators and quotes are plain separators, never MATCH syntax errors
+    assert _search(client, f'"{word}" OR NEAR(')['total'] == 0
+    assert _search(client, '*')['total'] == 0
+    assert client.get('/api/news/search').status_code == 400
+    assert client.get('/api/news/search?q=water&limit=x').status_code == 400
+
+
+def test_index_follows_edits_and_deletes():
+    init_database()
+    client = app.test_client()
+    old, new = f'dispensary{time.time_ns()}', f'clinic{time.time_ns()}'
+    article_id = _add_article(f'{old} update', '<p>Health services</p>', tags='health')
+
+    assert _search(client, old)['total'] == 1
+    _execute('UPDATE news_articles SET title = ? WHERE id = ?', (f'{new} update', article_id))
+    assert _search(client, old)['total'] == 0
+    assert _search(client, new)['results'][0]['tags'] == ['health']
+
+    _execute('DELETE FROM news_articles WHERE id = ?', (article_id,))
+    assert _search(client, new)['total'] == 0
+
+
+if __name__ == '__main__':
+    test_ranked_published_matches()
+    test_index_follows_edits_and_deletes()
+    print('OK')
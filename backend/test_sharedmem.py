@@ -0,0 +1,119 @@
+"""
+Shared memory segment tests.
+
+Forks worker processes against one segment, as gunicorn does, to check
+that counters and cache entries are shared and that increments are not
+lost. A worker killed while holding a segment lock must not hang the
+others: they get cache misses and per-process counts instead. Drained
+counters must give their slots back.
+
+    python -m pytest test_sharedmem.py
+    python test_sharedmem.py
+"""
+
+import atexit
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engagement import EngagementBuffer  # noqa: E402
+from sharedmem import SegmentBusy, SharedSegment, _key_hash  # noqa: E402
+
+WORKERS = 4
+INCREMENTS = 500
+
+fork = multiprocessing.get_context('fork')
+
+
+def _work(segment, worker):
+    for _ in range(INCREMENTS):
+        segment.incr('hits')
+    segment.cache_set(f'worker:{worker}', f'hello from {os.getpid()}'.encode())
+
+
+def _die_holding(segment, stripe):
+    # As gunicorn's timeout would: SIGKILL in the middle of a locked section
+    segment._counter_lock.acquire()
+    segment._locks[stripe].acquire()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_counters_and_cache_are_shared_across_processes():
+    segment = SharedSegment(counter_slots=64, cache_slots=64, cache_value_size=256, lock_timeout=5)
+    workers = [fork.Process(target=_work, args=(segment, i)) for i in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert worker.exitcode == 0
+
+    assert segment.get_counter('hits') == WORKERS * INCREMENTS
+    pids = {str(worker.pid) for worker in workers}
+    values = [segment.cache_get(f'worker:{i}') for i in range(WORKERS)]
+    # Slots are direct-mapped, so colliding keys may have evicted each other
+    assert any(values)
+    assert all(value.decode().split()[-1] in pids for value in values if value)
+
+
+def test_dead_lock_holder_degrades_instead_of_hanging():
+    segment = SharedSegment(counter_slots=64, cache_slots=16, cache_value_size=256, lock_timeout=0.1)
+    # A cache key guarded by the stripe lock the victim will hold
+    key = next(f'key:{i}' for i in range(1000) if segment._cache_slot(_key_hash(f'key:{i}'))[1] == 3)
+    victim = fork.Process(target=_die_holding, args=(segment, 3))
+    victim.start()
+    victim.join(10)
+    assert victim.exitcode == -signal.SIGKILL
+
+    started = time.monotonic()
+    with pytest.raises(SegmentBusy):
+        segment.incr('hits')
+    with pytest.raises(SegmentBusy):
+        segment.get_counter('hits')
+    assert segment.cache_set(key, b'value') is False
+    assert segment.cache_get(key) is None
+    assert segment.drain_counters('engagement:') == {}
+    assert segment.stats()['locks_timed_out'] == 2
+    assert time.monotonic() - started < 5
+
+    # Views are still counted, in this process until the next flush
+    engagement = EngagementBuffer(None, flush_interval=3600, segment=segment)
+    engagement.add(7, 'views', 3)
+    assert engagement.pending(7)['views'] == 3
+    atexit.unregister(engagement.stop)  # no database to flush to
+
+
+def test_drained_counters_free_their_slots():
+    segment = SharedSegment(counter_slots=64, cache_slots=4, cache_value_size=64)
+    segment.incr('tag:news', 5)
+    kept = {f'tag:{i}': i + 1 for i in range(10)}
+    for key, value in kept.items():
+        segment.incr(key, value)
+
+    rng = random.Random(7)
+    for rounds in range(20):
+        # Far more distinct keys over the run than the table has slots
+        expected = {}
+        for _ in range(40):
+            key = f'engagement:views:{rng.randrange(10 ** 6)}'
+            expected[key] = expected.get(key, 0) + 1
+            segment.incr(key)
+        assert segment.drain_counters('engagement:') == expected
+        assert segment.stats()['counter_slots_used'] == 1 + len(kept)
+
+    # Entries shifted around by the deletions are all still reachable
+    assert segment.get_counter('tag:news') == 5
+    assert all(segment.get_counter(key) == value for key, value in kept.items())
+
+
+if __name__ == '__main__':
+    test_counters_and_cache_are_shared_across_processes()
+    test_dead_lock_holder_degrades_instead_of_hanging()
+    test_drained_counters_free_their_slots()
+    print('OK')
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Karachuonyo Text Utilities
+Plain-text helpers shared by the database layer, search and the news catalog
+
+Kept free of application imports so that db.py can register strip_html()
+as an SQL function without pulling in the search module.
+"""
+
+import html
+import re
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def strip_html(text):
+    """Plain text of an HTML fragment, for indexing and snippets.
+
+    Angle brackets left over after unescaping are dropped as well, since
+    snippets are returned as HTML with only the <mark> tags meaningful.
+    """
+    if not text:
+        return ''
+    text = html.unescape(_TAG_RE.sub(' ', text)).replace('<', ' ').replace('>', ' ')
+    return _SPACE_RE.sub(' ', text).strip()